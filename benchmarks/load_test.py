@@ -0,0 +1,271 @@
+"""
+Load test for the chat API against the local mock Mistral server.
+
+Starts benchmarks.mock_mistral and `main:app` as subprocesses, drives /api/chat (or
+/api/chat/stream) with a closed-loop async load generator at each concurrency level and
+reports RPS, latency percentiles and error rates. Results are written as JSON so runs
+on different commits can be compared. Needs no API key, GPU or network access.
+
+    python -m benchmarks.load_test --levels 1,8,32,64 --requests 200
+    python -m benchmarks.load_test --endpoint stream --error-rate 0.02
+    python -m benchmarks.load_test --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# Free-text questions (no property IDs/names) so requests go upstream, not to the fast path
+PROMPTS = (
+    "What should I look for when buying my first apartment?",
+    "How do property taxes usually affect the monthly cost of a house?",
+    "Is it better to rent or buy in a growing city?",
+    "What questions should I ask during a house viewing?",
+)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+class ServerProcess:
+    """A uvicorn subprocess that is waited on until `ready_path` answers."""
+
+    def __init__(self, name: str, args: List[str], env: Dict[str, str], port: int, ready_path: str):
+        self.name = name
+        self.url = f"http://127.0.0.1:{port}"
+        self.ready_path = ready_path
+        self.process = subprocess.Popen([sys.executable] + args, cwd=ROOT_DIR, env=env)
+
+    async def wait_ready(self, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.name} exited with code {self.process.returncode}")
+                try:
+                    if (await client.get(self.url + self.ready_path)).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"{self.name} did not become ready within {timeout}s")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+async def send_chat(client: httpx.AsyncClient, payload: dict) -> dict:
+    started = time.perf_counter()
+    try:
+        response = await client.post("/api/chat", json=payload)
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return {"ok": ok, "latency": time.perf_counter() - started, "ttft": None}
+
+
+async def send_stream(client: httpx.AsyncClient, payload: dict) -> dict:
+    started = time.perf_counter()
+    ttft = None
+    ok = False
+    try:
+        async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+            if response.status_code == 200:
+                async for line in response.aiter_lines():
+                    if line.startswith("event: token") and ttft is None:
+                        ttft = time.perf_counter() - started
+                    elif line.startswith("event: done"):
+                        ok = True
+                    elif line.startswith("event: error"):
+                        break
+    except httpx.HTTPError:
+        ok = False
+    return {"ok": ok, "latency": time.perf_counter() - started, "ttft": ttft}
+
+
+async def run_level(base_url: str, endpoint: str, concurrency: int, total: int, run_id: str) -> dict:
+    """Closed loop: `concurrency` workers each send their next request as soon as one finishes."""
+    send = send_stream if endpoint == "stream" else send_chat
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def worker():
+            for i in counter:
+                # Unique text per request keeps the response cache and coalescing out of the numbers
+                question = f"{PROMPTS[i % len(PROMPTS)]} (run {run_id}, c{concurrency}, #{i})"
+                results.append(await send(client, {"messages": [{"role": "user", "content": question}]}))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["ok"]]
+    errors = len(results) - len(ok)
+    to_ms = lambda values: [v * 1000 for v in values]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else 0.0,
+        "duration_s": round(elapsed, 3),
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": summarize(to_ms([r["latency"] for r in ok])),
+        "ttft_ms": summarize(to_ms([r["ttft"] for r in ok if r["ttft"] is not None])) if endpoint == "stream" else None,
+    }
+
+
+def print_table(levels: List[dict], baseline: Optional[dict] = None):
+    previous = {level["concurrency"]: level for level in (baseline or {}).get("levels", [])}
+    header = f"{'conc':>5} {'reqs':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err %':>7} {'up err':>7}"
+    print(header + ("   vs baseline (rps / p95)" if previous else ""))
+    for level in levels:
+        lat = level["latency_ms"]
+        fmt = lambda v: f"{v:9.1f}" if v is not None else f"{'-':>9}"
+        line = (f"{level['concurrency']:>5} {level['requests']:>6} {level['rps']:9.1f} {fmt(lat['p50'])} "
+                f"{fmt(lat['p95'])} {fmt(lat['p99'])} {level['error_rate'] * 100:7.2f} {level.get('upstream_errors', 0):>7}")
+        base = previous.get(level["concurrency"])
+        if base and base["rps"] and base["latency_ms"]["p95"] and lat["p95"]:
+            line += (f"   {(level['rps'] / base['rps'] - 1) * 100:+.1f}% / "
+                     f"{(lat['p95'] / base['latency_ms']['p95'] - 1) * 100:+.1f}%")
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the chat API against a mock Mistral server")
+    parser.add_argument("--levels", default="1,8,32,64", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before the first level")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--app-port", type=int, default=8010)
+    parser.add_argument("--mock-port", type=int, default=8011)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--dist", choices=["fixed", "uniform", "normal", "lognormal"], default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--token-interval-ms", type=float, default=10)
+    parser.add_argument("--completion-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--with-retrieval", action="store_true",
+                        help="Keep context retrieval and the semantic cache on (needs a local vector store)")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to print deltas against")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+
+    mock_args = ["-m", "benchmarks.mock_mistral", "--port", str(args.mock_port),
+                 "--latency-ms", str(args.latency_ms), "--dist", args.dist, "--jitter", str(args.jitter),
+                 "--token-interval-ms", str(args.token_interval_ms),
+                 "--completion-tokens", str(args.completion_tokens),
+                 "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate)]
+    app_env = {
+        **os.environ,
+        "MISTRAL_SERVER_URL": f"http://127.0.0.1:{args.mock_port}",
+        # Never send a real key to the mock
+        "MISTRAL_API_KEY": "mock-key",
+        "MONGO_CONNECTION_STRING": "",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    if not args.with_retrieval:
+        app_env.update({"CONTEXT_RETRIEVAL_ENABLED": "false", "SEMANTIC_CACHE_ENABLED": "false"})
+
+    mock = ServerProcess("mock server", mock_args, dict(os.environ), args.mock_port, "/mock/stats")
+    app = ServerProcess("app", ["-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"],
+                        app_env, args.app_port, "/api/cache/stats")
+    run_id = f"{time.time():.0f}"
+    try:
+        await mock.wait_ready()
+        await app.wait_ready()
+        if args.warmup:
+            await run_level(app.url, args.endpoint, min(args.warmup, max(levels)), args.warmup, run_id + "w")
+
+        results = []
+        async with httpx.AsyncClient() as client:
+            for concurrency in levels:
+                before = (await client.get(mock.url + "/mock/stats")).json()
+                result = await run_level(app.url, args.endpoint, concurrency, args.requests, run_id)
+                after = (await client.get(mock.url + "/mock/stats")).json()
+                # The chat API may turn upstream failures into apology replies, so count them at the source too
+                result["upstream_requests"] = after["requests"] - before["requests"]
+                result["upstream_errors"] = (after["errors"] + after["rate_limited"]
+                                             - before["errors"] - before["rate_limited"])
+                results.append(result)
+                print(f"concurrency {concurrency}: {result['rps']:.1f} rps, "
+                      f"p95 {result['latency_ms']['p95'] or 0:.1f} ms, {result['errors']} errors, "
+                      f"{result['upstream_errors']} upstream errors")
+            upstream = (await client.get(mock.url + "/mock/stats")).json()
+    finally:
+        app.stop()
+        mock.stop()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "upstream": upstream,
+        "levels": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print()
+    print_table(results, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
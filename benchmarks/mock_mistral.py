@@ -0,0 +1,187 @@
+"""
+Local stand-in for the Mistral chat completions API, used by the load tests.
+
+Serves POST /v1/chat/completions (plain and `stream: true`, plus GET /v1/models) with a configurable
+latency distribution and error injection, so the app can be benchmarked offline:
+
+    python -m benchmarks.mock_mistral --port 8001 --latency-ms 300 --dist lognormal
+    MISTRAL_SERVER_URL=http://127.0.0.1:8001 MISTRAL_API_KEY=mock uvicorn main:app
+
+Options can also be given as MOCK_* environment variables (see MockConfig).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, asdict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = ("the", "property", "is", "located", "in", "a", "quiet", "area", "with", "good",
+         "schools", "and", "has", "recently", "renovated", "kitchen", "large", "garden")
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = float(os.getenv("MOCK_LATENCY_MS", "200"))
+    # fixed | uniform | normal | lognormal
+    dist: str = os.getenv("MOCK_LATENCY_DIST", "lognormal")
+    # Spread: half-width for uniform, stddev (ms) for normal, sigma for lognormal
+    jitter: float = float(os.getenv("MOCK_LATENCY_JITTER", "0.5"))
+    # Streaming: delay between chunks, and tokens in every reply
+    token_interval_ms: float = float(os.getenv("MOCK_TOKEN_INTERVAL_MS", "10"))
+    completion_tokens: int = int(os.getenv("MOCK_COMPLETION_TOKENS", "40"))
+    error_rate: float = float(os.getenv("MOCK_ERROR_RATE", "0"))
+    error_status: int = int(os.getenv("MOCK_ERROR_STATUS", "500"))
+    # Fraction of requests answered with 429 (rate limited)
+    rate_limit_rate: float = float(os.getenv("MOCK_RATE_LIMIT_RATE", "0"))
+    seed: int = int(os.getenv("MOCK_SEED", "0"))
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """Time to first byte in seconds."""
+        base = self.latency_ms
+        if self.dist == "fixed":
+            ms = base
+        elif self.dist == "uniform":
+            ms = rng.uniform(base * (1 - self.jitter), base * (1 + self.jitter))
+        elif self.dist == "normal":
+            ms = rng.gauss(base, self.jitter)
+        elif self.dist == "lognormal":
+            # Median `base`, long right tail like real LLM latencies
+            ms = base * rng.lognormvariate(0, self.jitter)
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.dist}")
+        return max(ms, 0) / 1000
+
+
+config = MockConfig()
+rng = random.Random(config.seed or None)
+stats = {"requests": 0, "errors": 0, "rate_limited": 0, "streams": 0}
+
+app = FastAPI(title="Mock Mistral API")
+
+
+def _reply_tokens() -> list:
+    return [rng.choice(WORDS) for _ in range(config.completion_tokens)]
+
+
+def _usage(messages) -> dict:
+    prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in messages) or 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": config.completion_tokens,
+        "total_tokens": prompt_tokens + config.completion_tokens,
+    }
+
+
+def _injected_error():
+    roll = rng.random()
+    if roll < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return JSONResponse({"message": "Requests rate limit exceeded"}, status_code=429,
+                            headers={"Retry-After": "1"})
+    if roll < config.rate_limit_rate + config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse({"message": "Injected upstream error"}, status_code=config.error_status)
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    await asyncio.sleep(config.sample_latency(rng))
+
+    error = _injected_error()
+    if error is not None:
+        return error
+
+    model = body.get("model", "mistral-tiny")
+    completion_id = uuid.uuid4().hex
+    created = int(time.time())
+    usage = _usage(body.get("messages", []))
+    tokens = _reply_tokens()
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "model": model,
+            "created": created,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    stats["streams"] += 1
+
+    async def events():
+        for i, token in enumerate(tokens):
+            last = i == len(tokens) - 1
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "created": created,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": token if i == 0 else " " + token},
+                    "finish_reason": "stop" if last else None,
+                }],
+            }
+            if last:
+                chunk["usage"] = usage
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if not last and config.token_interval_ms:
+                await asyncio.sleep(config.token_interval_ms / 1000)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def list_models():
+    # Enough for the client warm-up request at startup
+    return {"object": "list", "data": [
+        {"id": model, "object": "model", "created": 0, "owned_by": "mistralai", "type": "base",
+         "capabilities": {"completion_chat": True}}
+        for model in ("mistral-tiny", "mistral-small", "mistral-large-latest")
+    ]}
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return {**stats, "config": asdict(config)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Mistral chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--dist", choices=["fixed", "uniform", "normal", "lognormal"], default=config.dist)
+    parser.add_argument("--jitter", type=float, default=config.jitter)
+    parser.add_argument("--token-interval-ms", type=float, default=config.token_interval_ms)
+    parser.add_argument("--completion-tokens", type=int, default=config.completion_tokens)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--error-status", type=int, default=config.error_status)
+    parser.add_argument("--rate-limit-rate", type=float, default=config.rate_limit_rate)
+    args = parser.parse_args()
+
+    for field in asdict(config):
+        if hasattr(args, field):
+            setattr(config, field, getattr(args, field))
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,53 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
 
 class ChatMessage(BaseModel):
     role: str
     content: str
     
 class ChatRequest(BaseModel):
+    # With a session_id only the new turn needs to be sent; history is kept server-side
     messages: List[ChatMessage]
     model: Optional[str] = None
     temperature: Optional[float] = 0.7
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
     model_used: str
+    session_id: Optional[str] = None
 
 class PropertyQuery(BaseModel):
-    """Model for structured property queries if needed later"""
-    location: Optional[str] = None
+    """Model for structured property queries (POST /api/properties/search)"""
+    location: Optional[str] = None  # "Dallas, TX" or just the city, case-insensitive
     min_price: Optional[float] = None
     max_price: Optional[float] = None
     property_type: Optional[str] = None
+    status: Optional[str] = None
+    min_size: Optional[float] = None
+    max_size: Optional[float] = None
+    min_year: Optional[int] = None
+    max_year: Optional[int] = None
+    min_bedrooms: Optional[int] = None
+    sort_by: Optional[Literal["price", "size", "year", "bedrooms", "bathrooms"]] = None
+    sort_order: Literal["asc", "desc"] = "asc"
+    limit: int = Field(default=20, ge=1, le=500)
+    offset: int = Field(default=0, ge=0)
+
+class PropertyRecord(BaseModel):
+    property_id: str
+    property_name: str
+    location: str
+    property_type: str
+    bedrooms: int
+    bathrooms: int
+    size_sqft: int
+    price_usd: int
+    year_built: int
+    status: str
+
+class PropertySearchResponse(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    items: List[PropertyRecord]
@@ -1,14 +1,101 @@
 import chromadb
 from chromadb.utils import embedding_functions
 import os
+import threading
 from config.logger import logger
+from config.settings import settings
+from config.vector_index import LocalVectorClient
 from core.embedding import embedder
+from core.metrics import CHROMA_WRITES
 
 # Adapter to make our system embedder compatible with Chroma
 class SystemEmbeddingFunction(embedding_functions.EmbeddingFunction):
     def __call__(self, input: list[str]) -> list[list[float]]:
-        # embedder.embed return tensor, we need list of floats
-        return [embedder.embed(text).tolist() for text in input]
+        # One batched, cached forward pass for the whole input
+        return embedder.embed_batch(list(input))
+
+class WriteBehindBuffer:
+    """
+    Collects single-document writes for a collection and sends them to Chroma in bulk,
+    once `max_items` are pending or every `flush_interval` seconds. Documents of a failed
+    call go back in the buffer for the next flush, up to `max_retries` times, then are dropped.
+    """
+    def __init__(self, collection, method="upsert", max_items=256, flush_interval=2.0, max_retries=3):
+        self.collection = collection
+        self.method = method
+        self.max_items = max_items
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.name = getattr(collection, "name", method)
+        # Keyed by id so a repeated id in one batch keeps only the latest write
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"chroma-{method}-flusher")
+        self._thread.start()
+
+    def add(self, doc_id, document, metadata):
+        with self._lock:
+            self._pending[doc_id] = (document, metadata, 0)
+            full = len(self._pending) >= self.max_items
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Writes everything pending in one call per `max_items` documents."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            items = list(pending.items())
+            written = 0
+            for start in range(0, len(items), self.max_items):
+                chunk = items[start:start + self.max_items]
+                try:
+                    getattr(self.collection, self.method)(
+                        ids=[doc_id for doc_id, _ in chunk],
+                        documents=[doc for _, (doc, _, _) in chunk],
+                        metadatas=[meta for _, (_, meta, _) in chunk]
+                    )
+                except Exception as e:
+                    self._requeue(chunk, e)
+                else:
+                    written += len(chunk)
+                    CHROMA_WRITES.inc(len(chunk), collection=self.name, outcome="written")
+            if written:
+                logger.info(f"Flushed {written} documents to ChromaDB ({self.method})")
+
+    def _requeue(self, chunk, error):
+        retry = [(doc_id, (doc, meta, attempts + 1)) for doc_id, (doc, meta, attempts) in chunk
+                 if attempts < self.max_retries]
+        dropped = len(chunk) - len(retry)
+        with self._lock:
+            for doc_id, entry in retry:
+                # A newer write of the same id, queued meanwhile, wins
+                self._pending.setdefault(doc_id, entry)
+        if retry:
+            CHROMA_WRITES.inc(len(retry), collection=self.name, outcome="retried")
+        if dropped:
+            CHROMA_WRITES.inc(dropped, collection=self.name, outcome="dropped")
+        logger.error(f"Failed to flush {len(chunk)} documents to ChromaDB ({len(retry)} to retry, "
+                     f"{dropped} dropped): {error}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval)
+        self.flush()
+        # No later flush to retry in
+        with self._lock:
+            lost, self._pending = len(self._pending), {}
+        if lost:
+            CHROMA_WRITES.inc(lost, collection=self.name, outcome="dropped")
+            logger.error(f"Dropped {lost} documents that could not be written to ChromaDB before shutdown")
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
 
 class ChromaService:
     def __init__(self, collection_name="neuroqueue_metadata"):
@@ -21,8 +108,17 @@ class ChromaService:
         # USE SYSTEM EMBEDDER for alignment
         self.embedding_fn = SystemEmbeddingFunction()
 
+        # Use cosine similarity
+        metadata = {"hnsw:space": "cosine"}
 
-        if api_key:
+        # "auto" keeps Chroma Cloud when a key is configured and falls back to an
+        # embedded on-disk store otherwise
+        mode = settings.CHROMA_MODE
+        if mode == "auto":
+            mode = "cloud" if api_key else "persistent"
+        self.mode = mode
+
+        if mode == "cloud":
             # Cloud Client (User Preferred)
             try:
                 logger.info("Connecting to ChromaDB Cloud...")
@@ -31,8 +127,6 @@ class ChromaService:
                     tenant=tenant,
                     database=database
                 )
-                # Use cosine similarity
-                metadata = {"hnsw:space": "cosine"}
             except ValueError as e:
                 # This catches the specific "Database ... does not match" error
                 if "does not match" in str(e):
@@ -45,6 +139,14 @@ class ChromaService:
             except Exception as e:
                 logger.critical(f"Failed to connect to ChromaDB: {e}")
                 raise e
+        elif mode == "persistent":
+            logger.info(f"Using embedded ChromaDB at {settings.CHROMA_PERSIST_DIR}")
+            self.client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
+        elif mode == "local":
+            logger.info(f"Using local NumPy vector index at {settings.CHROMA_PERSIST_DIR}")
+            self.client = LocalVectorClient(settings.CHROMA_PERSIST_DIR)
+        else:
+            raise ValueError(f"Unknown CHROMA_MODE '{mode}' (expected auto, cloud, persistent or local)")
         
         self.collection = self.client.get_or_create_collection(
             name=collection_name, 
@@ -58,18 +160,46 @@ class ChromaService:
             embedding_function=self.embedding_fn,
             metadata=metadata
         )
+
+        # Third collection backs the semantic tier of the response cache
+        self.response_cache_collection = self.client.get_or_create_collection(
+            name="neuroqueue_response_cache",
+            embedding_function=self.embedding_fn,
+            metadata=metadata
+        )
+
+        # Single-document writes are buffered and flushed in bulk
+        self.metadata_writer = WriteBehindBuffer(
+            self.collection, "upsert",
+            settings.CHROMA_WRITE_BATCH_SIZE, settings.CHROMA_WRITE_FLUSH_SECONDS, settings.CHROMA_WRITE_MAX_RETRIES
+        )
+        # Upsert: history ids are content hashes, so a repeated Q/A pair replaces itself
+        self.history_writer = WriteBehindBuffer(
+            self.history_collection, "upsert",
+            settings.CHROMA_WRITE_BATCH_SIZE, settings.CHROMA_WRITE_FLUSH_SECONDS, settings.CHROMA_WRITE_MAX_RETRIES
+        )
         logger.info(f"ChromaDB collection '{collection_name}' and 'neuroqueue_vector_history' ready.")
 
     def store_metadata(self, doc_id, content, metadata):
         """
         Generic storage for metadata/contexts.
         """
-        logger.info(f"Storing metadata for {doc_id}")
-        self.collection.upsert(
-            documents=[content],
-            metadatas=[metadata],
-            ids=[doc_id]
-        )
+        logger.debug(f"Buffering metadata for {doc_id}")
+        self.metadata_writer.add(doc_id, content, metadata)
+
+    def store_metadata_batch(self, doc_ids, contents, metadatas):
+        """
+        Bulk upsert for indexing jobs; bypasses the buffer and writes in chunks.
+        """
+        batch_size = settings.CHROMA_WRITE_BATCH_SIZE
+        for start in range(0, len(doc_ids), batch_size):
+            end = start + batch_size
+            self.collection.upsert(
+                documents=contents[start:end],
+                metadatas=metadatas[start:end],
+                ids=doc_ids[start:end]
+            )
+        logger.info(f"Stored {len(doc_ids)} metadata documents")
 
     def store_message_vector(self, message_id, content, analysis):
         """
@@ -78,24 +208,70 @@ class ChromaService:
         text = f"Content: {content}\nAnalysis: {analysis}"
         metadata = {"message_id": message_id, "type": "processed_message"}
         
-        logger.info(f"Storing message vector {message_id} in ChromaDB")
-        self.history_collection.add(
-            documents=[text],
-            metadatas=[metadata],
-            ids=[message_id]
+        logger.debug(f"Buffering message vector {message_id} for ChromaDB")
+        self.history_writer.add(message_id, text, metadata)
+
+    def retrieve_similar_metadata(self, query, n_results=5):
+        """
+        Retrieves relevant stored metadata/context documents. Buffered writes show up after
+        the next flush (at most CHROMA_WRITE_FLUSH_SECONDS later).
+        """
+        results = self.collection.query(
+            query_texts=[query],
+            n_results=n_results
         )
+        return results['documents'][0] if results['documents'] else []
 
     def retrieve_similar_messages(self, query, n_results=5):
         """
-        Retrieves relevant past messages.
+        Retrieves relevant past messages. Buffered writes show up after the next flush.
         """
         results = self.history_collection.query(
             query_texts=[query],
             n_results=n_results
         )
         return results['documents'][0] if results['documents'] else []
+
+    def store_cached_response(self, doc_id, query, response, model, created_at):
+        """
+        Stores a query -> answer pair for semantic cache lookups.
+        """
+        self.response_cache_collection.upsert(
+            documents=[query],
+            metadatas=[{"model": model, "response": response, "created_at": created_at}],
+            ids=[doc_id]
+        )
+
+    def find_cached_response(self, query, model):
+        """
+        Returns (response, similarity, created_at) of the nearest cached query for `model`, or None.
+        """
+        results = self.response_cache_collection.query(
+            query_texts=[query],
+            n_results=1,
+            where={"model": model},
+            include=["metadatas", "distances"]
+        )
+        if not results['ids'] or not results['ids'][0]:
+            return None
+        metadata = results['metadatas'][0][0]
+        # Collections use cosine distance, so similarity = 1 - distance
+        similarity = 1.0 - results['distances'][0][0]
+        return metadata["response"], similarity, metadata.get("created_at", 0.0)
+
+    def delete_cached_responses(self, model):
+        """
+        Drops every semantic cache entry stored for `model`.
+        """
+        self.response_cache_collection.delete(where={"model": model})
+
     def close_chroma_connection(self):
-        self.client.close()
+        self.metadata_writer.close()
+        self.history_writer.close()
+        # Embedded clients have nothing to close on some chromadb versions
+        close = getattr(self.client, "close", None)
+        if close:
+            close()
     def connect_to_chroma(self):
         # self.client.connect() # Not needed/available in recent ChromaDB versions
         try:
@@ -104,9 +280,27 @@ class ChromaService:
         except Exception as e:
              logger.error(f"Failed to connect to ChromaDB: {e}")
 
+_chromadb_client = None
+_client_lock = threading.Lock()
+
+def get_chroma_client() -> ChromaService:
+    """The shared ChromaService, connected and with its collections built on first call."""
+    global _chromadb_client
+    if _chromadb_client is None:
+        with _client_lock:
+            if _chromadb_client is None:
+                _chromadb_client = ChromaService()
+    return _chromadb_client
+
+def __getattr__(name):
+    # `from config.chroma import chromadb_client` keeps working, but only builds the service when asked for
+    if name == "chromadb_client":
+        return get_chroma_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def connect_to_chroma():
-    chromadb_client.connect_to_chroma()
+    get_chroma_client().connect_to_chroma()
 def close_chroma_connection():
-    chromadb_client.close_chroma_connection()
-# Global instance
-chromadb_client = ChromaService()
+    # Nothing to flush or close if the service was never used
+    if _chromadb_client is not None:
+        _chromadb_client.close_chroma_connection()
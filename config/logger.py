@@ -1,11 +1,31 @@
+import atexit
+import json
 import logging
-from logging.config import dictConfig
+import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
+from logging.config import dictConfig
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
 
-# Ensure logs directory exists
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 LOGS_DIR = os.path.join(BASE_DIR, "logs")
-os.makedirs(LOGS_DIR, exist_ok=True)
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" (default) or "json" (one compact JSON object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", "5"))
+# Per-logger sampling of sub-WARNING records, e.g. "app.api=0.1,app.mistral=0.5"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+# Per-logger cap on sub-WARNING records per second, e.g. "app.api=50"
+LOG_RATE_LIMIT = os.getenv("LOG_RATE_LIMIT", "")
 
 class RelativePathFilter(logging.Filter):
     def __init__(self):
@@ -22,6 +42,67 @@ class RelativePathFilter(logging.Filter):
             record.relpath = "unknown"
         return True
 
+class JsonFormatter(logging.Formatter):
+    """Compact single-line JSON records for log shippers."""
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": getattr(record, "relpath", record.pathname),
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, separators=(",", ":"), default=str)
+
+class HotPathFilter(logging.Filter):
+    """
+    Thins out high-volume INFO/DEBUG records on a logger: keeps a `sample_rate` fraction
+    and at most `max_per_second` per second. WARNING and above always pass.
+    """
+    def __init__(self, sample_rate=1.0, max_per_second=0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._window = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.dropped += 1
+            return False
+        if self.max_per_second:
+            now = int(time.monotonic())
+            with self._lock:
+                if now != self._window:
+                    self._window, self._count = now, 0
+                self._count += 1
+                if self._count > self.max_per_second:
+                    self.dropped += 1
+                    return False
+        return True
+
+class LazyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Creates the log directory when the file is first opened (on the first record), not at import."""
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that hands the raw record to the listener thread instead of formatting
+    it first, so message formatting and exception rendering also happen off the caller's
+    thread. Safe because the queue is in-process (nothing gets pickled).
+    """
+    def prepare(self, record):
+        return record
+
 log_config = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -35,34 +116,79 @@ log_config = {
             "format": "%(levelname)s: %(asctime)s - [%(relpath)s:%(lineno)d] - %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
-        "file": { 
+        "file": {
             "format": "%(levelname)s: %(asctime)s - [%(relpath)s:%(lineno)d] - %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
+        "json": {
+            "()": JsonFormatter,
+        },
     },
     "handlers": {
         "console": {
-            "formatter": "console",
+            "formatter": "json" if LOG_FORMAT == "json" else "console",
             "class": "logging.StreamHandler",
             "stream": "ext://sys.stderr",
             "filters": ["relpath"]
         },
         "file": {
-            "formatter": "file",
-            "class": "logging.FileHandler",
+            "formatter": "json" if LOG_FORMAT == "json" else "file",
+            "()": LazyRotatingFileHandler,
             "filename": os.path.join(LOGS_DIR, "app.log"),
             "mode": "a",
+            "maxBytes": LOG_FILE_MAX_BYTES,
+            "backupCount": LOG_FILE_BACKUP_COUNT,
             "encoding": "utf-8",
+            "delay": True,
             "filters": ["relpath"]
         },
     },
     "loggers": {
-        "neuroqueue": {
+        # Output handlers are attached to this holder logger only so dictConfig builds
+        # them; records reach them through the queue listener below.
+        "app.handlers": {
             "handlers": ["console", "file"],
-            "level": "INFO",
+            "propagate": False,
         },
     },
 }
 
-dictConfig(log_config)
+def _parse_pairs(spec, cast):
+    pairs = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        pairs[name.strip()] = cast(value)
+    return pairs
+
+def _setup_logging():
+    dictConfig(log_config)
+    holder = logging.getLogger("app.handlers")
+    handlers = list(holder.handlers)
+    for handler in handlers:
+        holder.removeHandler(handler)
+
+    # Callers only enqueue; the listener thread formats and writes
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    for name in ("app", "neuroqueue"):
+        configured = logging.getLogger(name)
+        configured.setLevel(LOG_LEVEL)
+        configured.addHandler(queue_handler)
+        configured.propagate = False
+
+    sampling = _parse_pairs(LOG_SAMPLING, float)
+    limits = _parse_pairs(LOG_RATE_LIMIT, int)
+    for name in set(sampling) | set(limits):
+        logging.getLogger(name).addFilter(HotPathFilter(sampling.get(name, 1.0), limits.get(name, 0)))
+    return listener
+
+def get_logger(name):
+    """Child of the "app" logger, e.g. get_logger("api") -> "app.api" (sampling/rate limits apply per name)."""
+    return logging.getLogger(f"app.{name}")
+
+log_listener = _setup_logging()
 logger = logging.getLogger("app")
@@ -1,16 +1,23 @@
 # app/db/database.py
 
-from pymongo import MongoClient
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 import os
 from config.logger import logger
+from config.settings import settings
 # Configure logger
 
 # Load environment variables from .env file
 load_dotenv()
 
+if TYPE_CHECKING:
+    from pymongo import MongoClient, AsyncMongoClient
+
+# pymongo is imported by the connect functions, so importing this module doesn't load the driver
 class DataBase:
-    client: MongoClient = None
+    client: "MongoClient" = None
+    # Async client used by the FastAPI app (opened/closed in the app lifespan)
+    async_client: "AsyncMongoClient" = None
 
 db = DataBase()
 
@@ -55,6 +62,7 @@ def connect_to_mongo():
             raise ValueError("MONGO_CONNECTION_STRING not set in environment variables")
         
         logger.debug("Creating MongoDB client...")
+        from pymongo import MongoClient
         db.client = MongoClient(mongo_connection_string)
         
         # Test the connection
@@ -114,3 +122,54 @@ def get_mongo_db():
     Returns the database instance for both sync and async operations.
     """
     return get_database()
+
+
+async def connect_to_mongo_async():
+    """
+    Opens the pooled async MongoDB client used by the web app.
+    """
+    try:
+        logger.info("Attempting to connect to MongoDB (async)...")
+        mongo_connection_string = os.getenv("MONGO_CONNECTION_STRING")
+
+        if not mongo_connection_string:
+            logger.error("MONGO_CONNECTION_STRING not set in environment variables")
+            raise ValueError("MONGO_CONNECTION_STRING not set in environment variables")
+
+        from pymongo import AsyncMongoClient
+        db.async_client = AsyncMongoClient(
+            mongo_connection_string,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGO_MAX_IDLE_MS,
+        )
+
+        # Test the connection
+        await db.async_client.admin.command('ping')
+        logger.info(f"Successfully connected to MongoDB (pool size {settings.MONGO_MIN_POOL_SIZE}-{settings.MONGO_MAX_POOL_SIZE})")
+
+    except Exception as e:
+        logger.error(f"Failed to connect to MongoDB: {e}")
+        raise
+
+async def close_mongo_connection_async():
+    """
+    Closes the async MongoDB client.
+    """
+    try:
+        if db.async_client:
+            await db.async_client.close()
+            db.async_client = None
+            logger.info("Async MongoDB connection closed successfully")
+    except Exception as e:
+        logger.error(f"Error closing async MongoDB connection: {e}")
+        raise
+
+def get_async_collection(collection_name: str):
+    """
+    Returns a collection from the async client.
+    """
+    if not db.async_client:
+        raise ValueError("Async database client not initialized. Call connect_to_mongo_async() first.")
+    mongo_db_name = os.getenv("DB_NAME", "HRM_AGENT")
+    return db.async_client[mongo_db_name][collection_name]
@@ -4,12 +4,131 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 class Settings:
     MISTRAL_API_KEY: str = os.getenv("MISTRAL_API_KEY", "")
     # Default Mistral model (e.g., mistral-tiny, mistral-small, mistral-medium, or your fine-tuned ID)
     DEFAULT_MODEL: str = os.getenv("DEFAULT_MODEL", "mistral-tiny") 
-    
-    # Optional: Database config if needed later
-    # DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # DEFAULT_MODEL (or a request's model) may be this alias for the newest fine-tuned model,
+    # read from FINE_TUNED_MODEL_FILE (written by scripts/finetune_mistral.py) and picked up without a restart
+    FINE_TUNED_MODEL_ALIAS: str = "fine-tuned-latest"
+    FINE_TUNED_MODEL_FILE: str = os.getenv("FINE_TUNED_MODEL_FILE", os.path.join(BASE_DIR, "scripts", "fine_tuned_model.json"))
+    # Used for the alias until a fine-tuning job has finished
+    FINE_TUNED_FALLBACK_MODEL: str = os.getenv("FINE_TUNED_FALLBACK_MODEL", "mistral-tiny")
+
+    # Upstream client tuning (shared async connection pool)
+    MISTRAL_MAX_CONCURRENCY: int = int(os.getenv("MISTRAL_MAX_CONCURRENCY", "16"))
+    MISTRAL_MAX_CONNECTIONS: int = int(os.getenv("MISTRAL_MAX_CONNECTIONS", "32"))
+    MISTRAL_MAX_KEEPALIVE: int = int(os.getenv("MISTRAL_MAX_KEEPALIVE", "16"))
+    MISTRAL_KEEPALIVE_EXPIRY: float = float(os.getenv("MISTRAL_KEEPALIVE_EXPIRY", "30"))
+    MISTRAL_TIMEOUT_SECONDS: float = float(os.getenv("MISTRAL_TIMEOUT_SECONDS", "30"))
+    # Alternative API base URL, e.g. the local mock server used by benchmarks/ (empty = api.mistral.ai)
+    MISTRAL_SERVER_URL: str = os.getenv("MISTRAL_SERVER_URL", "")
+
+    # Upstream quotas of the API key (0 = unlimited). Calls beyond them wait in a priority queue
+    # where interactive chat goes ahead of batch/eval work.
+    MISTRAL_RPS_LIMIT: float = float(os.getenv("MISTRAL_RPS_LIMIT", "0"))
+    MISTRAL_TPM_LIMIT: float = float(os.getenv("MISTRAL_TPM_LIMIT", "0"))
+    # Share of those quotas taken by batch-priority processes (scripts/batch_inference.py, scripts/evaluate.py)
+    # so the web server on the same key keeps the rest
+    MISTRAL_BATCH_QUOTA_SHARE: float = float(os.getenv("MISTRAL_BATCH_QUOTA_SHARE", "0.5"))
+    # Web worker processes sharing the key (uvicorn reads the same variable as its --workers default).
+    # Each one keeps 1/WEB_CONCURRENCY of the quotas left over by batch processes.
+    WEB_CONCURRENCY: int = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    SCHEDULER_MAX_QUEUE: int = int(os.getenv("SCHEDULER_MAX_QUEUE", "256"))
+    # Longest an interactive request waits for an upstream slot before it is shed with a 429
+    SCHEDULER_INTERACTIVE_MAX_WAIT_SECONDS: float = float(os.getenv("SCHEDULER_INTERACTIVE_MAX_WAIT_SECONDS", "5"))
+    # Completion length charged to the TPM bucket up front; corrected once the usage is known
+    SCHEDULER_COMPLETION_TOKENS_ESTIMATE: int = int(os.getenv("SCHEDULER_COMPLETION_TOKENS_ESTIMATE", "256"))
+
+    # Model routing: a failing request falls through to these models in order (comma-separated,
+    # aliases allowed), e.g. "fine-tuned-latest,mistral-small,mistral-tiny". Empty = requested model only.
+    MODEL_FALLBACKS: str = os.getenv("MODEL_FALLBACKS", "")
+    # Send a duplicate request when the first runs past the model's recent p95 latency
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+    HEDGE_MIN_DELAY_SECONDS: float = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.25"))
+    # Latency samples needed before a model's p95 is trusted for hedging
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    ROUTER_LATENCY_WINDOW: int = int(os.getenv("ROUTER_LATENCY_WINDOW", "200"))
+    ROUTER_EWMA_ALPHA: float = float(os.getenv("ROUTER_EWMA_ALPHA", "0.1"))
+    # Circuit breaker: a model is skipped for CIRCUIT_RESET_SECONDS after this many consecutive failures
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_SECONDS: float = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+    # Startup: SDK clients, the vector store and the embedding model are created on first use.
+    # With warm-up on they are built concurrently during startup instead (slower cold start,
+    # no first-request penalty). Startup waits at most the timeout; slower checks finish in the background.
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+    WARMUP_TIMEOUT_SECONDS: float = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "10"))
+
+    # State shared by the uvicorn workers of a node: a SQLite (WAL) cache for responses and embeddings
+    # and memory-mapped snapshots of the property catalogue, e.g. SHARED_STATE_DIR=/var/lib/app/shared_state.
+    # Empty (the default) = every worker keeps its own copies.
+    SHARED_STATE_DIR: str = os.getenv("SHARED_STATE_DIR", "")
+    # Size of the shared cache file; least recently used entries are evicted beyond it
+    SHARED_CACHE_MAX_MB: float = float(os.getenv("SHARED_CACHE_MAX_MB", "256"))
+
+    # Response cache (exact LRU tier + optional semantic tier backed by ChromaDB)
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+
+    # Property catalogue served from memory (deterministic fast path for lookups)
+    PROPERTY_DATA_CSV: str = os.getenv("PROPERTY_DATA_CSV", os.path.join(BASE_DIR, "property_data.csv"))
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+    # Question/answer templates (JSON, or YAML with PyYAML installed) for training data and fast-path answers
+    PROPERTY_TEMPLATES_FILE: str = os.getenv("PROPERTY_TEMPLATES_FILE", os.path.join(BASE_DIR, "core", "property_templates.json"))
+
+
+    # Embeddings (shared by ChromaDB collections and the semantic cache)
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    # In-process entries in front of the shared cache (SHARED_STATE_DIR), which persists embeddings
+    # across restarts and workers
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+    # Vector store backend: auto (cloud if CHROMA_API_KEY is set, else persistent),
+    # cloud, persistent (embedded ChromaDB) or local (in-process NumPy index)
+    CHROMA_MODE: str = os.getenv("CHROMA_MODE", "auto").lower()
+    CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", os.path.join(BASE_DIR, "chroma_data"))
+
+    # ChromaDB write-behind buffer: flush after this many documents or seconds
+    CHROMA_WRITE_BATCH_SIZE: int = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "256"))
+    CHROMA_WRITE_FLUSH_SECONDS: float = float(os.getenv("CHROMA_WRITE_FLUSH_SECONDS", "2"))
+    # Later flushes a failed document is retried in before it is dropped (counted in chroma_writes_total)
+    CHROMA_WRITE_MAX_RETRIES: int = int(os.getenv("CHROMA_WRITE_MAX_RETRIES", "3"))
+
+
+    # Retrieval-augmented prompt assembly
+    CONTEXT_RETRIEVAL_ENABLED: bool = os.getenv("CONTEXT_RETRIEVAL_ENABLED", "true").lower() == "true"
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # whole prompt
+    CONTEXT_MAX_TOKENS: int = int(os.getenv("CONTEXT_MAX_TOKENS", "1200"))  # retrieved records/answers
+    CONTEXT_TOP_K: int = int(os.getenv("CONTEXT_TOP_K", "5"))
+
+
+    # WebSocket chat (/ws/chat): generations a single connection may run at once
+    WS_MAX_CONVERSATIONS: int = int(os.getenv("WS_MAX_CONVERSATIONS", "8"))
+
+
+    # Server-side chat sessions
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    SESSION_MAX_MESSAGES: int = int(os.getenv("SESSION_MAX_MESSAGES", "50"))
+    SESSION_TTL_SECONDS: float = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    SESSION_PERSISTENCE_ENABLED: bool = os.getenv("SESSION_PERSISTENCE_ENABLED", "false").lower() == "true"
+
+
+    # MongoDB (async client + batched write queue for transcripts/analytics)
+    MONGO_ENABLED: bool = bool(os.getenv("MONGO_CONNECTION_STRING"))
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+    MONGO_MAX_IDLE_MS: int = int(os.getenv("MONGO_MAX_IDLE_MS", "60000"))
+    MONGO_WRITE_BATCH_SIZE: int = int(os.getenv("MONGO_WRITE_BATCH_SIZE", "500"))
+    MONGO_WRITE_FLUSH_SECONDS: float = float(os.getenv("MONGO_WRITE_FLUSH_SECONDS", "1"))
+    MONGO_WRITE_QUEUE_SIZE: int = int(os.getenv("MONGO_WRITE_QUEUE_SIZE", "10000"))
+    ANALYTICS_ENABLED: bool = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
 
 settings = Settings()
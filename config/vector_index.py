@@ -0,0 +1,351 @@
+import base64
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.logger import logger
+from core.shared_state import file_lock
+
+# Rows logged since the last snapshot before compacting, at least (or half the index, if more)
+_COMPACT_MIN_ROWS = 1024
+
+
+def _matches(metadata: dict, where: Optional[dict]) -> bool:
+    """Equality-only subset of Chroma's `where` filter, plus $and."""
+    if not where:
+        return True
+    for key, value in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in value):
+                return False
+        elif isinstance(value, dict):
+            if "$eq" not in value or metadata.get(key) != value["$eq"]:
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+class LocalVectorIndex:
+    """
+    In-process cosine index with the subset of the Chroma collection API that
+    ChromaService uses (add, upsert, query, delete, count).
+
+    Vectors are L2-normalized and kept in one contiguous float32 matrix so a query is
+    a single matrix-vector product plus argpartition. The matrix is over-allocated, so
+    appending rows doesn't copy it. On disk a collection is a snapshot, `vectors.npy`
+    (memory-mapped on load, so startup doesn't read the whole file) and `records.json`
+    with ids, documents and metadatas in row order, plus `log.jsonl` with the writes
+    since. The log is folded into the snapshot once it holds half as many rows as the
+    index, so each write costs its own size on disk, not the index's.
+
+    Several processes (uvicorn workers) may open the same directory: disk access is
+    serialized by a file lock, and each process applies the others' logged writes before
+    writing and whenever the log has changed since its last query. The log starts with the
+    generation of the snapshot it extends; a new one means another process compacted,
+    and the snapshot is loaded again.
+    """
+
+    def __init__(self, path: str, embedding_function):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._vectors_file = os.path.join(path, "vectors.npy")
+        self._records_file = os.path.join(path, "records.json")
+        self._log_file = os.path.join(path, "log.jsonl")
+        self._lock_file = os.path.join(path, ".lock")
+
+        # _vectors is the first count() rows of _buffer, or the snapshot's memory map until the first write
+        self._vectors: Optional[np.ndarray] = None
+        self._buffer: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[dict] = []
+        self._rows: Dict[str, int] = {}
+        # Rows in the log, by any process
+        self._logged_rows = 0
+        # Generation of the log this process has read, its inode, and the bytes of it applied so far
+        self._generation: Optional[str] = None
+        self._log_inode: Optional[int] = None
+        self._log_offset = 0
+        with self._lock, file_lock(self._lock_file):
+            self._load()
+        if self._ids:
+            logger.info(f"Loaded local vector index {self.path} ({len(self._ids)} vectors)")
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def add(self, ids, documents, metadatas=None):
+        """Inserts new ids; existing ids are left untouched, like Chroma."""
+        with self._locked():
+            keep = [i for i, doc_id in enumerate(ids) if doc_id not in self._rows]
+            if len(keep) < len(ids):
+                logger.warning(f"Skipping {len(ids) - len(keep)} existing ids in {self.path}")
+            if keep:
+                self._write(
+                    [ids[i] for i in keep],
+                    [documents[i] for i in keep],
+                    [(metadatas or [{}] * len(ids))[i] for i in keep],
+                )
+
+    def upsert(self, ids, documents, metadatas=None):
+        with self._locked():
+            self._write(list(ids), list(documents), list(metadatas or [{}] * len(ids)))
+
+    def delete(self, ids=None, where=None):
+        with self._locked():
+            drop = set(ids or [])
+            if where:
+                drop.update(doc_id for doc_id, meta in zip(self._ids, self._metadatas) if _matches(meta, where))
+            removed = self._remove(drop)
+            if removed:
+                self._log({"op": "delete", "ids": removed})
+
+    def close(self):
+        """Folds the log into the snapshot, so the next start maps it instead of replaying."""
+        with self._locked():
+            if self._logged_rows:
+                self._compact()
+
+    def query(self, query_texts, n_results=10, where=None, include=None):
+        """Cosine top-k. Returns the same nested-list shape as Chroma's query()."""
+        queries = self._normalize(np.asarray(self.embedding_function(list(query_texts)), dtype=np.float32))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            if self._log_changed():
+                with self._locked():
+                    self._sync()
+            if not self._ids:
+                for _ in queries:
+                    for field in result:
+                        result[field].append([])
+                return result
+
+            scores = queries @ self._vectors.T
+            if where:
+                mask = np.fromiter((_matches(m, where) for m in self._metadatas), dtype=bool, count=len(self._ids))
+                scores[:, ~mask] = -np.inf
+                available = int(mask.sum())
+            else:
+                available = len(self._ids)
+
+            k = min(n_results, available)
+            for row_scores in scores:
+                if k == 0:
+                    top = np.empty(0, dtype=np.int64)
+                else:
+                    top = np.argpartition(-row_scores, k - 1)[:k]
+                    top = top[np.argsort(-row_scores[top])]
+                result["ids"].append([self._ids[i] for i in top])
+                result["documents"].append([self._documents[i] for i in top])
+                result["metadatas"].append([self._metadatas[i] for i in top])
+                result["distances"].append((1.0 - row_scores[top]).tolist())
+        return result
+
+    @contextmanager
+    def _locked(self):
+        """This process's threads, then other processes. Not reentrant across processes: take it once per call."""
+        with self._lock:
+            with file_lock(self._lock_file):
+                # Writes decide on ids (add skips existing ones), so first catch up with other processes
+                self._sync()
+                yield
+
+    def _write(self, ids, documents, metadatas):
+        # Last write wins for ids repeated within one call
+        latest = {doc_id: i for i, doc_id in enumerate(ids)}
+        order = sorted(latest.values())
+        ids = [ids[i] for i in order]
+        documents = [documents[i] for i in order]
+        metadatas = [metadatas[i] for i in order]
+        vectors = self._normalize(np.asarray(self.embedding_function(documents), dtype=np.float32))
+
+        self._apply(ids, documents, metadatas, vectors)
+        self._log({
+            "op": "upsert", "ids": ids, "documents": documents, "metadatas": metadatas,
+            "vectors": base64.b64encode(vectors.tobytes()).decode("ascii"),
+        })
+
+    def _apply(self, ids, documents, metadatas, vectors: np.ndarray):
+        """Upserts rows in memory; `ids` must be unique."""
+        added = sum(1 for doc_id in ids if doc_id not in self._rows)
+        self._reserve(len(self._ids) + added, vectors.shape[1])
+        for doc_id, doc, meta, vector in zip(ids, documents, metadatas, vectors):
+            row = self._rows.get(doc_id)
+            if row is None:
+                row = self._rows[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._documents.append(doc)
+                self._metadatas.append(meta)
+            else:
+                self._documents[row] = doc
+                self._metadatas[row] = meta
+            self._buffer[row] = vector
+        self._vectors = self._buffer[:len(self._ids)]
+
+    def _reserve(self, rows: int, dim: int):
+        """Grows the buffer (doubling) to hold `rows`; also copies a memory-mapped snapshot out before the first write."""
+        if self._buffer is not None and len(self._buffer) >= rows:
+            return
+        buffer = np.empty((max(rows, 2 * len(self._ids), 64), dim), dtype=np.float32)
+        if self._ids:
+            buffer[:len(self._ids)] = self._vectors
+        self._buffer = buffer
+
+    def _remove(self, drop: set) -> List[str]:
+        """Deletes rows in memory; returns the ids that were present."""
+        if not drop or self._vectors is None:
+            return []
+        keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in drop]
+        if len(keep) == len(self._ids):
+            return []
+        removed = [doc_id for doc_id in self._ids if doc_id in drop]
+        self._buffer = np.ascontiguousarray(self._vectors[keep])
+        self._vectors = self._buffer
+        self._ids = [self._ids[i] for i in keep]
+        self._documents = [self._documents[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._rows = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        return removed
+
+    def _log(self, entry: dict):
+        if self._generation is None:
+            # No log yet, or one from before logs had a generation: fold it in and start one
+            self._compact()
+        with open(self._log_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            self._log_offset = f.tell()
+        self._logged_rows += len(entry["ids"])
+        if self._logged_rows > max(_COMPACT_MIN_ROWS, len(self._ids) // 2):
+            self._compact()
+
+    def _start_log(self):
+        """Replaces the log with an empty one for a new snapshot generation."""
+        os.makedirs(self.path, exist_ok=True)
+        self._generation = uuid.uuid4().hex
+        tmp_log = self._log_file + ".tmp"
+        with open(tmp_log, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "start", "generation": self._generation, "ids": []}) + "\n")
+            self._log_offset = f.tell()
+            self._log_inode = os.fstat(f.fileno()).st_ino
+        os.replace(tmp_log, self._log_file)
+        self._logged_rows = 0
+
+    def _compact(self):
+        if self._vectors is not None:
+            self._persist()
+        self._start_log()
+
+    def _persist(self):
+        os.makedirs(self.path, exist_ok=True)
+        # Write-then-rename so a crash never leaves a half-written index behind
+        tmp_vectors = self._vectors_file + ".tmp.npy"
+        np.save(tmp_vectors, self._vectors)
+        os.replace(tmp_vectors, self._vectors_file)
+        tmp_records = self._records_file + ".tmp"
+        with open(tmp_records, "w", encoding="utf-8") as f:
+            json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas}, f)
+        os.replace(tmp_records, self._records_file)
+
+    def _load(self):
+        """(Re)reads the snapshot and the whole log. Called with the file lock held."""
+        self._vectors, self._buffer = None, None
+        self._ids, self._documents, self._metadatas, self._rows = [], [], [], {}
+        self._generation, self._log_inode, self._log_offset, self._logged_rows = None, None, 0, 0
+        if os.path.exists(self._vectors_file) and os.path.exists(self._records_file):
+            self._vectors = np.load(self._vectors_file, mmap_mode="r")
+            with open(self._records_file, encoding="utf-8") as f:
+                records = json.load(f)
+            self._ids = records["ids"]
+            self._documents = records["documents"]
+            self._metadatas = records["metadatas"]
+            self._rows = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._replay()
+
+    def _log_changed(self) -> bool:
+        """Cheap check without the file lock: appended to, or replaced by a compaction (a new file, maybe of the same size)."""
+        try:
+            stat = os.stat(self._log_file)
+        except FileNotFoundError:
+            return self._generation is not None
+        return stat.st_ino != self._log_inode or stat.st_size != self._log_offset
+
+    def _sync(self):
+        """Applies what other processes logged since this one last read the log. Called with the file lock held."""
+        if self._read_generation() != self._generation:
+            # Compacted by another process: its snapshot has everything logged so far
+            self._load()
+        elif self._log_changed():
+            self._replay()
+
+    def _read_generation(self) -> Optional[str]:
+        try:
+            with open(self._log_file, encoding="utf-8") as f:
+                return json.loads(f.readline()).get("generation")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _replay(self):
+        # Upserts and deletes by id, so replaying a log already folded into the snapshot
+        # (a crash between the two steps of _compact) changes nothing
+        if not os.path.exists(self._log_file):
+            return
+        torn = False
+        with open(self._log_file, "rb") as f:
+            self._log_inode = os.fstat(f.fileno()).st_ino
+            f.seek(self._log_offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    torn = True
+                    continue
+                if entry["op"] == "start":
+                    self._generation = entry["generation"]
+                elif entry["op"] == "delete":
+                    self._remove(set(entry["ids"]))
+                else:
+                    vectors = np.frombuffer(base64.b64decode(entry["vectors"]), dtype=np.float32)
+                    self._apply(entry["ids"], entry["documents"], entry["metadatas"],
+                                vectors.reshape(len(entry["ids"]), -1))
+                self._logged_rows += len(entry["ids"])
+            self._log_offset = f.tell()
+        if torn:
+            # A write cut short by a crash; compacting drops it before anything is appended after it
+            logger.warning(f"Skipped a partially written entry in {self._log_file}")
+            self._compact()
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class LocalVectorClient:
+    """Stands in for a Chroma client: one LocalVectorIndex directory per collection."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._collections: Dict[str, LocalVectorIndex] = {}
+
+    def get_or_create_collection(self, name, embedding_function=None, metadata=None):
+        if name not in self._collections:
+            self._collections[name] = LocalVectorIndex(os.path.join(self.path, name), embedding_function)
+        return self._collections[name]
+
+    def heartbeat(self):
+        return True
+
+    def close(self):
+        for collection in self._collections.values():
+            collection.close()
+        self._collections.clear()
@@ -0,0 +1,84 @@
+import hashlib
+import re
+from collections import defaultdict
+from typing import List
+
+import numpy as np
+
+# Duplicate detection for generated training examples. Exact duplicates are caught on a
+# normalized text digest; near-duplicates with MinHash signatures and LSH banding, so each
+# new example is only compared against the few earlier ones sharing a band.
+
+_TOKEN_RE = re.compile(r"\w+")
+_SHIFT = np.uint64(32)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class ExactDeduplicator:
+    def __init__(self):
+        self._seen = set()
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if an equal (after normalization) text was seen before; records it otherwise."""
+        digest = hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+        if digest in self._seen:
+            return True
+        self._seen.add(digest)
+        return False
+
+
+class MinHashDeduplicator:
+    """
+    Flags texts whose estimated Jaccard similarity (over word n-gram shingles) with an
+    earlier kept text is at least `threshold`.
+
+    num_perm hash functions are split into `bands` bands; two texts become candidates when
+    any band matches exactly, then the full signatures are compared.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, bands: int = 32, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing on uint64 (wrap-around is intended): h_i(x) = (a_i * x + b_i) >> 32
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self._buckets = defaultdict(list)
+        self._signatures: List[np.ndarray] = []
+
+    def signature(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_RE.findall(normalize_text(text))
+        n = self.shingle_size
+        shingles = {" ".join(tokens[i:i + n]) for i in range(max(1, len(tokens) - n + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        with np.errstate(over="ignore"):
+            permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> _SHIFT
+        return permuted.min(axis=1)
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if `text` nearly duplicates an earlier kept text; otherwise it is indexed and kept."""
+        signature = self.signature(text)
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+        candidates = {index for key in keys for index in self._buckets.get(key, ())}
+        for index in candidates:
+            if np.mean(self._signatures[index] == signature) >= self.threshold:
+                return True
+
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for key in keys:
+            self._buckets[key].append(index)
+        return False
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.settings import settings
+from config.logger import logger
+from core.shared_state import SharedCache, shared_cache
+
+
+class EmbeddingCache:
+    """
+    Content-hash keyed embedding cache: an in-memory LRU in front of the node's shared
+    cache (if enabled), so repeated texts are never embedded twice, even by another
+    worker or before a restart. Vectors are held as float32 bytes (1.5KB for 384 dims
+    instead of ~12KB as a list of floats).
+    """
+
+    NAMESPACE = "embeddings"
+
+    def __init__(self, max_entries: int, store: Optional[SharedCache] = None):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = store
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                blob = self._memory.get(key)
+                if blob is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = blob
+
+        missing = [k for k in keys if k not in found]
+        if missing and self._store is not None:
+            shared = self._store.get_many(self.NAMESPACE, missing)
+            with self._lock:
+                for key, (blob, _, _) in shared.items():
+                    found[key] = blob
+                    self._remember(key, blob)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return {key: np.frombuffer(blob, dtype=np.float32).tolist() for key, blob in found.items()}
+
+    def set_many(self, items: Dict[str, List[float]]):
+        blobs = {k: np.asarray(v, dtype=np.float32).tobytes() for k, v in items.items()}
+        with self._lock:
+            for key, blob in blobs.items():
+                self._remember(key, blob)
+        if self._store is not None:
+            self._store.set_many(self.NAMESPACE, blobs)
+
+    def _remember(self, key: str, blob: bytes):
+        self._memory[key] = blob
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+class SystemEmbedder:
+    """
+    Sentence embedding model shared by ChromaDB collections and the semantic cache.
+    The model is loaded on first use.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, cache: EmbeddingCache):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = cache
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    logger.info(f"Loading embedding model {self.model_name}...")
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def embed(self, text: str):
+        """Embeds a single text. Returns a tensor."""
+        return self.model.encode(text, convert_to_tensor=True)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many texts: cached vectors are reused, duplicates are embedded once and
+        the rest go through the model in forward passes of `batch_size`.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                pending.setdefault(key, text)
+
+        if pending:
+            matrix = self.model.encode(
+                list(pending.values()),
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+            )
+            # One conversion for the whole matrix instead of a .tolist() per tensor
+            computed = dict(zip(pending.keys(), matrix.astype(np.float32).tolist()))
+            self.cache.set_many(computed)
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+embedder = SystemEmbedder(
+    model_name=settings.EMBEDDING_MODEL,
+    batch_size=settings.EMBEDDING_BATCH_SIZE,
+    cache=EmbeddingCache(settings.EMBEDDING_CACHE_SIZE, shared_cache()),
+)
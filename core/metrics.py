@@ -0,0 +1,275 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# Minimal Prometheus-compatible metrics registry (text exposition format 0.0.4).
+# Kept in-house so instrumenting hot paths costs a dict lookup and a lock, with no
+# extra dependency. Metrics are per process.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """Counts the enclosed block as in flight."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the enclosed block. Labels can be updated inside it."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency (until the last body byte)",
+    ["method", "route", "status"]))
+HTTP_REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"))
+
+WEBSOCKET_CONNECTIONS = registry.register(Gauge(
+    "websocket_connections", "Open /ws/chat connections"))
+CHAT_CANCELLED = registry.register(Counter(
+    "chat_generations_cancelled_total", "Chat generations stopped before completion, by reason", ["reason"]))
+
+# --- Upstream Mistral ---
+MISTRAL_REQUEST_SECONDS = registry.register(Histogram(
+    "mistral_request_duration_seconds", "Upstream Mistral call latency", ["model", "mode", "outcome"]))
+MISTRAL_TTFT_SECONDS = registry.register(Histogram(
+    "mistral_time_to_first_token_seconds", "Time to first streamed token", ["model"]))
+MISTRAL_IN_FLIGHT = registry.register(Gauge(
+    "mistral_requests_in_flight", "Upstream Mistral calls currently in flight"))
+MISTRAL_TOKENS = registry.register(Counter(
+    "mistral_tokens_total", "Tokens reported by the Mistral usage fields", ["model", "type"]))
+MISTRAL_RETRIES = registry.register(Counter(
+    "mistral_retries_total", "Upstream calls retried or re-routed to another model", ["model", "reason"]))
+MISTRAL_HEDGES = registry.register(Counter(
+    "mistral_hedged_requests_total", "Duplicate requests sent after the p95 deadline, by winner", ["model", "winner"]))
+MISTRAL_CIRCUIT_OPEN = registry.register(Gauge(
+    "mistral_circuit_open", "1 while a model's circuit breaker is open", ["model"]))
+SCHEDULER_QUEUE_DEPTH = registry.register(Gauge(
+    "upstream_queue_depth", "Upstream calls waiting for admission", ["priority"]))
+SCHEDULER_WAIT_SECONDS = registry.register(Histogram(
+    "upstream_queue_wait_seconds", "Time upstream calls waited for admission", ["priority"]))
+SCHEDULER_SHED = registry.register(Counter(
+    "upstream_shed_total", "Upstream calls rejected with a 429 before being sent", ["priority", "reason"]))
+
+# --- Caches and fast path ---
+CACHE_LOOKUPS = registry.register(Counter(
+    "response_cache_lookups_total", "Response cache lookups", ["tier", "result"]))
+COALESCED_REQUESTS = registry.register(Counter(
+    "coalesced_requests_total", "Requests that joined an identical in-flight upstream call"))
+FAST_PATH_ANSWERS = registry.register(Counter(
+    "fast_path_answers_total", "Questions answered from the property index", ["intent"]))
+RESPONSE_CACHE_ENTRIES = registry.register(Gauge(
+    "response_cache_entries", "Entries in the exact response cache tier"))
+ACTIVE_SESSIONS = registry.register(Gauge(
+    "chat_sessions_in_memory", "Chat sessions held in memory"))
+
+# --- Storage ---
+CHROMA_QUERY_SECONDS = registry.register(Histogram(
+    "chroma_query_duration_seconds", "Vector store query latency", ["operation"]))
+CHROMA_WRITES = registry.register(Counter(
+    "chroma_writes_total", "Documents flushed by the vector store write-behind buffers", ["collection", "outcome"]))
+MONGO_WRITE_SECONDS = registry.register(Histogram(
+    "mongo_bulk_write_duration_seconds", "MongoDB bulk write latency", ["collection"]))
+MONGO_WRITES = registry.register(Counter(
+    "mongo_writes_total", "MongoDB write operations", ["collection", "outcome"]))
+MONGO_QUEUE_DEPTH = registry.register(Gauge(
+    "mongo_write_queue_depth", "Writes waiting in the MongoDB write queue"))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency and in-flight requests. Pure ASGI (not
+    BaseHTTPMiddleware) so streamed responses are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route_template(scope),
+                status=status["code"],
+            )
+
+
+def route_template(scope) -> str:
+    """
+    Full path template of the matched route (e.g. /api/cache/{model}), which keeps label
+    cardinality bounded. The route only knows its path within its router, so the prefix it
+    was included under is recovered from the request path.
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return "unmatched"
+    from starlette.routing import replace_params
+
+    local_path, _ = replace_params(path_format, route.param_convertors, dict(scope.get("path_params", {})))
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    prefix = path[:-len(local_path)] if path.endswith(local_path) else ""
+    return prefix + route.path
@@ -0,0 +1,40 @@
+import json
+import os
+import threading
+
+from config.settings import settings
+from config.logger import logger
+
+# Resolves the "fine-tuned-latest" alias to the model id scripts/finetune_mistral.py wrote
+# to FINE_TUNED_MODEL_FILE. The file is re-read only when its mtime changes, so a finished
+# job is picked up by running workers on their next request.
+
+_lock = threading.Lock()
+_cached = {"mtime": None, "model": None}
+
+
+def _latest_fine_tuned_model():
+    try:
+        mtime = os.stat(settings.FINE_TUNED_MODEL_FILE).st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if mtime != _cached["mtime"]:
+            try:
+                with open(settings.FINE_TUNED_MODEL_FILE, "r", encoding="utf-8") as f:
+                    model = json.load(f).get("fine_tuned_model")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read {settings.FINE_TUNED_MODEL_FILE}: {e}")
+                return _cached["model"]
+            if model and model != _cached["model"]:
+                logger.info(f"Using fine-tuned model {model}")
+            _cached.update(mtime=mtime, model=model)
+        return _cached["model"]
+
+
+def resolve_model(model: str = None) -> str:
+    """Model id to send upstream: `model` or DEFAULT_MODEL, with the fine-tuned alias resolved."""
+    model = model or settings.DEFAULT_MODEL
+    if model != settings.FINE_TUNED_MODEL_ALIAS:
+        return model
+    return _latest_fine_tuned_model() or settings.FINE_TUNED_FALLBACK_MODEL
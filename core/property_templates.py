@@ -0,0 +1,101 @@
+# Question/answer templates for property records.
+# Declared as data in property_templates.json (or any JSON/YAML file with the same layout,
+# see PROPERTY_TEMPLATES_FILE) and compiled once on load. Shared by scripts/prepare_data.py
+# (training data) and the chat fast path, so answers served from the in-memory index read
+# exactly like the ones the model was tuned on. Placeholders are property_data.csv column names.
+import hashlib
+import json
+import string
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+
+
+class CompiledTemplate:
+    """A format string parsed once into (literal, column) segments."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.segments: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if spec or conversion:
+                raise ValueError(f"Only plain {{Column}} placeholders are supported: {text!r}")
+            if field == "" or (field and not field.isidentifier()):
+                raise ValueError(f"Placeholders must name a CSV column: {text!r}")
+            self.segments.append((literal, field))
+        self.fields = {field for _, field in self.segments if field}
+
+    def render(self, row: Dict[str, str]) -> str:
+        return "".join(literal + (str(row[field]) if field else "") for literal, field in self.segments)
+
+    def render_columns(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Renders every row at once from string column arrays of equal length."""
+        size = len(next(iter(columns.values())))
+        out = np.full(size, "", dtype=np.str_)
+        for literal, field in self.segments:
+            if literal:
+                out = np.char.add(out, literal)
+            if field:
+                out = np.char.add(out, columns[field])
+        return out
+
+
+class PropertyTemplate:
+    __slots__ = ("intent", "question", "answer")
+
+    def __init__(self, intent: str, question: str, answer: str):
+        self.intent = intent
+        self.question = CompiledTemplate(question)
+        self.answer = CompiledTemplate(answer)
+
+
+class TemplateSet:
+    """Compiled templates plus the optional system prompt written into every training example."""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.system: Optional[str] = data.get("system")
+        self.templates = [PropertyTemplate(t["intent"], t["question"], t["answer"]) for t in data["templates"]]
+        intents = [t.intent for t in self.templates]
+        if len(set(intents)) != len(intents):
+            raise ValueError(f"Template intents must be unique: {intents}")
+
+    @property
+    def fields(self) -> set:
+        return set().union(*(t.question.fields | t.answer.fields for t in self.templates))
+
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps(self.data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def validate(self, columns) -> None:
+        missing = self.fields - set(columns)
+        if missing:
+            raise ValueError(f"Templates reference columns missing from the CSV: {sorted(missing)}")
+
+    def expand_columns(self, columns: Dict[str, np.ndarray]) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+        """[(intent, questions, answers)] for every template over all rows of `columns`."""
+        return [
+            (t.intent, t.question.render_columns(columns), t.answer.render_columns(columns))
+            for t in self.templates
+        ]
+
+
+def load_templates(path: str = None) -> TemplateSet:
+    path = path or settings.PROPERTY_TEMPLATES_FILE
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("YAML templates need PyYAML (pip install pyyaml), or use JSON") from e
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    return TemplateSet(data)
+
+
+TEMPLATE_SET = load_templates()
+PROPERTY_TEMPLATES = TEMPLATE_SET.data["templates"]
+ANSWER_TEMPLATES = {t.intent: t.answer for t in TEMPLATE_SET.templates}
@@ -0,0 +1,286 @@
+import fcntl
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from config.logger import logger
+
+# State shared by the worker processes of one node (uvicorn --workers N), kept under
+# SHARED_STATE_DIR:
+#   - SharedCache: a SQLite (WAL) key/value store with size-bounded eviction, used by the
+#     response and embedding caches so one worker's results are hits for all of them
+#   - array snapshots: read-only NumPy arrays (e.g. the property catalogue) built once per
+#     node and memory-mapped by every worker, so their pages live once in the page cache
+
+CACHE_FILE = "cache.sqlite"
+# Reads refresh an entry's LRU timestamp at most this often, so hits rarely need a write
+_ACCESS_RESOLUTION_SECONDS = 60.0
+# Writes between size checks (per process)
+_EVICTION_CHECK_EVERY = 64
+# Share of the budget freed below the limit when evicting, so eviction doesn't run on every write
+_EVICTION_HEADROOM = 0.1
+# Superseded snapshots younger than this are left alone: a worker that has not seen the change
+# yet may still be opening one
+_SNAPSHOT_GRACE_SECONDS = 300.0
+
+
+def shared_state_enabled() -> bool:
+    return bool(settings.SHARED_STATE_DIR)
+
+
+class SharedCache:
+    """
+    Node-wide key/value cache in one SQLite file in WAL mode: any number of worker
+    processes read concurrently while one writes. Entries live in namespaces and may
+    carry a tag (e.g. the model that produced them) for bulk invalidation.
+
+    The file is kept under `max_bytes` by deleting the least recently used entries.
+    The LRU order is approximate: a read only refreshes an entry's timestamp if it is
+    older than a minute. The cache is best effort. If the database stays locked past the
+    busy timeout, a read is a miss and a write is skipped; neither raises.
+    """
+
+    def __init__(self, path: str, max_bytes: int, busy_timeout_ms: int = 200):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._writes = 0
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable enough for a cache; no fsync per commit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS entries ("
+                        " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, tag TEXT,"
+                        " size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                        " PRIMARY KEY (namespace, key))"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS entries_tag ON entries (namespace, tag)")
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, Optional[str], float]]:
+        """(value, tag, created_at wall-clock time) or None."""
+        found = self.get_many(namespace, [key])
+        return found.get(key)
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, Tuple[bytes, Optional[str], float]]:
+        found = {}
+        stale = []
+        now = time.time()
+        try:
+            conn = self._conn()
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value, tag, created_at, accessed_at FROM entries"
+                    f" WHERE namespace = ? AND key IN ({placeholders})",
+                    [namespace, *chunk],
+                ).fetchall()
+                for key, value, tag, created_at, accessed_at in rows:
+                    found[key] = (value, tag, created_at)
+                    if now - accessed_at > _ACCESS_RESOLUTION_SECONDS:
+                        stale.append(key)
+            if stale:
+                conn.executemany(
+                    "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    [(now, namespace, key) for key in stale],
+                )
+        except sqlite3.Error as e:
+            logger.debug(f"Shared cache read failed ({namespace}): {e}")
+        return found
+
+    def set(self, namespace: str, key: str, value: bytes, tag: str = None):
+        self.set_many(namespace, {key: value}, tag)
+
+    def set_many(self, namespace: str, items: Dict[str, bytes], tag: str = None):
+        if not items:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, tag, size, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(namespace, key, value, tag, len(key) + len(value), now, now) for key, value in items.items()],
+                )
+            self._writes += len(items)
+            if self._writes >= _EVICTION_CHECK_EVERY:
+                self._writes = 0
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.debug(f"Shared cache write failed ({namespace}): {e}")
+
+    def delete_tag(self, namespace: str, tag: str) -> int:
+        """Drops every entry of `namespace` tagged `tag`; returns how many."""
+        try:
+            with self._conn() as conn:
+                return conn.execute("DELETE FROM entries WHERE namespace = ? AND tag = ?", (namespace, tag)).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache invalidation failed ({namespace}, {tag}): {e}")
+            return 0
+
+    def count(self, namespace: str) -> int:
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def used_bytes(self) -> int:
+        """Bytes of the database in use (pages minus free pages); O(1), read from the file header."""
+        conn = self._conn()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _evict(self, conn: sqlite3.Connection):
+        used = self.used_bytes()
+        if used <= self.max_bytes:
+            return
+        target = self.max_bytes * (1 - _EVICTION_HEADROOM)
+        evicted = 0
+        while used > target:
+            # Oldest entries until roughly the overshoot is freed, estimated from the average entry size
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            if not count:
+                break
+            batch = max(1, int((used - target) / max(1, total / count)))
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                evicted += conn.execute(
+                    "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY accessed_at LIMIT ?)",
+                    (batch,),
+                ).rowcount
+            used = self.used_bytes()
+        logger.info(f"Shared cache over {self.max_bytes / 2**20:.0f}MB, evicted {evicted} entries")
+
+
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def shared_cache() -> Optional[SharedCache]:
+    """The node-wide SharedCache under SHARED_STATE_DIR, or None when shared state is disabled."""
+    global _shared_cache
+    if not shared_state_enabled():
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache(
+                    os.path.join(settings.SHARED_STATE_DIR, CACHE_FILE),
+                    int(settings.SHARED_CACHE_MAX_MB * 2**20),
+                )
+    return _shared_cache
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock across processes (flock), released when the block exits."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def load_array_snapshot(
+    name: str, version: str, build: Callable[[], Dict[str, np.ndarray]]
+) -> Dict[str, np.ndarray]:
+    """
+    Returns the arrays of snapshot `name` at `version`, memory-mapped read-only.
+
+    The first process to ask builds them (under a lock, so other workers wait instead of
+    building too), writes them to a temporary directory and renames it into place, so
+    readers never see a partial snapshot. Other versions of the same `name` are removed
+    once they are a few minutes old; workers still mapping them keep their pages until
+    they reload. A snapshot removed while it is being opened is built again.
+    Without SHARED_STATE_DIR the arrays are built in process memory.
+    """
+    if not shared_state_enabled():
+        return build()
+
+    root = os.path.join(settings.SHARED_STATE_DIR, "snapshots")
+    directory = os.path.join(root, f"{name}-{version}")
+    for _ in range(3):
+        if not os.path.isdir(directory):
+            _publish_snapshot(root, name, directory, version, build)
+        try:
+            return {
+                entry[:-4]: np.load(os.path.join(directory, entry), mmap_mode="r", allow_pickle=False)
+                for entry in os.listdir(directory) if entry.endswith(".npy")
+            }
+        except FileNotFoundError:
+            logger.warning(f"{name} snapshot {version} was removed while loading, rebuilding")
+    raise RuntimeError(f"{name} snapshot {version} keeps disappearing")
+
+
+def _publish_snapshot(root: str, name: str, directory: str, version: str, build: Callable[[], Dict[str, np.ndarray]]):
+    with file_lock(os.path.join(root, f"{name}.lock")):
+        if os.path.isdir(directory):
+            return
+        arrays = build()
+        staging = tempfile.mkdtemp(prefix=f".{name}-", dir=root)
+        for key, array in arrays.items():
+            np.save(os.path.join(staging, f"{key}.npy"), array, allow_pickle=False)
+        os.rename(staging, directory)
+        logger.info(f"Published {name} snapshot {version} ({len(arrays)} arrays)")
+        _remove_other_versions(root, name, directory)
+
+
+def _remove_other_versions(root: str, name: str, keep: str):
+    # `name` identifies one source (the catalogue's includes a hash of its CSV path), so
+    # snapshots of other sources never match
+    cutoff = time.time() - _SNAPSHOT_GRACE_SECONDS
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        if path == keep or not entry.startswith(f"{name}-"):
+            continue
+        try:
+            if os.path.isdir(path) and os.stat(path).st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+def pack_postings(postings: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """{value: rows} as three flat arrays (sorted values, offsets, concatenated rows) that can be saved."""
+    values = sorted(postings)
+    lengths = [len(postings[v]) for v in values]
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    rows = np.concatenate([postings[v] for v in values]) if values else np.empty(0, dtype=np.int64)
+    return np.array(values, dtype=str), offsets, rows.astype(np.int64)
+
+
+def unpack_postings(values: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> Dict[str, np.ndarray]:
+    """Inverse of pack_postings; the row arrays are views into `rows` (no copy of a mapped file)."""
+    return {str(v): rows[offsets[i]:offsets[i + 1]] for i, v in enumerate(values)}
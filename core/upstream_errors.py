@@ -0,0 +1,23 @@
+from typing import Optional
+
+# Reading the HTTP status and Retry-After of Mistral SDK errors; shared by the server's
+# router/scheduler and the batch scripts.
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status of an SDK error (SDKError and friends carry status_code)."""
+    code = getattr(error, "status_code", None)
+    if code is None and getattr(error, "raw_response", None) is not None:
+        code = error.raw_response.status_code
+    return code
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After of an error: set on the 429s the scheduler sheds, else from the SDK error's HTTP response."""
+    if getattr(error, "retry_after", None):
+        return error.retry_after
+    response = getattr(error, "raw_response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
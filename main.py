@@ -1,17 +1,62 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import os
+import sys
 
 from routers.web import web_router
 from routers.api import mistral_router
+from routers.properties import property_router
+from routers.metrics import metrics_router
+from routers.ws import ws_router
+from services.mistral_service import mistral_service
+from services.property_index import property_index
+from services.mongo_writer import mongo_writer
+from services.warmup import warm_up
+from config.settings import settings
 from config.logger import logger
+from core.metrics import MetricsMiddleware
 
-app = FastAPI(title="Mistral Property Assistant")
+# Importing this module only wires routes: SDK clients (Mistral, MongoDB, ChromaDB) and the
+# embedding model are created in the lifespan below or on first use, so workers start fast.
+# `python scripts/profile_startup.py` checks the cold start against a budget.
 
-@app.on_event("startup")
-async def startup_event():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     logger.info("Application starting up...")
+    # The buckets are per process: this worker's share of what batch processes leave over
+    mistral_service.scheduler.scale_quota((1 - settings.MISTRAL_BATCH_QUOTA_SHARE) / settings.WEB_CONCURRENCY)
+    try:
+        property_index.load()
+    except Exception as e:
+        logger.error(f"Failed to load property index, fast path disabled until first use: {e}")
+    if settings.MONGO_ENABLED:
+        from config.mongo import connect_to_mongo_async
+        try:
+            await connect_to_mongo_async()
+            mongo_writer.start()
+        except Exception as e:
+            logger.error(f"MongoDB unavailable, transcripts and session persistence disabled: {e}")
+    app.state.warmup = {}
+    if settings.WARMUP_ON_STARTUP:
+        app.state.warmup = await warm_up(settings.WARMUP_TIMEOUT_SECONDS)
+        logger.info(f"Warm-up finished: {app.state.warmup}")
+
+    yield
+
+    logger.info("Application shutting down...")
+    await mistral_service.close()
+    if settings.MONGO_ENABLED:
+        from config.mongo import close_mongo_connection_async
+        await mongo_writer.stop()
+        await close_mongo_connection_async()
+    # Only if something used the vector store (flushes its write-behind buffers)
+    if "config.chroma" in sys.modules:
+        sys.modules["config.chroma"].close_chroma_connection()
+
+app = FastAPI(title="Mistral Property Assistant", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 # Mount Static Files
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -24,4 +69,6 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 # Include Routers
 app.include_router(web_router)
 app.include_router(mistral_router, prefix="/api")
-
+app.include_router(property_router, prefix="/api")
+app.include_router(metrics_router)
+app.include_router(ws_router)
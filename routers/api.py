@@ -1,27 +1,191 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import math
+import time
+from typing import AsyncIterator, Tuple
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
 from classes.models import ChatRequest, ChatResponse
 from services.mistral_service import mistral_service
-from config.settings import settings
-from config.logger import logger
+from services.model_router import UpstreamError
+from services.cache_service import response_cache
+from services.property_index import answer_property_question, PROPERTY_INDEX_MODEL
+from services.context_service import context_assembler, estimate_tokens
+from services.session_store import session_store
+from services.mongo_writer import record_transcript
+from core.model_alias import resolve_model
+from config.logger import get_logger
 
+logger = get_logger("api")
 mistral_router = APIRouter()
 
+# Strong references to fire-and-forget tasks, so they aren't garbage collected mid-run
+_background_tasks = set()
+
+
+def _in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
 @mistral_router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    logger.info(f"Chat endpoint called. Message count: {len(request.messages)}")
+async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks):
+    logger.info("Chat endpoint called. Message count: %d", len(request.messages))
+    started = time.perf_counter()
     try:
         # Convert pydantic models to dict list for the service
-        messages_data = [{"role": m.role, "content": m.content} for m in request.messages]
-        
-        response_content = await mistral_service.chat_completion(
-            messages=messages_data, 
-            model=request.model
+        new_messages = [{"role": m.role, "content": m.content} for m in request.messages]
+        session, _ = await session_store.get_or_create(request.session_id)
+        messages_data = session_store.history(session) + new_messages
+
+        # Plain property lookups are answered from the in-memory index, no LLM round trip
+        fast_answer = answer_property_question(messages_data)
+        if fast_answer is not None:
+            await session_store.append(session, new_messages + [{"role": "assistant", "content": fast_answer}])
+            record_transcript(session.session_id, new_messages, fast_answer, PROPERTY_INDEX_MODEL,
+                              "property-index", _elapsed_ms(started))
+            return ChatResponse(response=fast_answer, model_used=PROPERTY_INDEX_MODEL, session_id=session.session_id)
+
+        # Retrieved records + budgeted history replace the raw client message list
+        prompt_messages = await context_assembler.assemble(
+            messages_data, history_tokens=_history_tokens(session, new_messages)
         )
         
+        try:
+            result = await mistral_service.chat_completion_result(
+                messages=prompt_messages, 
+                model=request.model,
+                temperature=request.temperature,
+                cache_messages=messages_data,
+            )
+        except UpstreamError as e:
+            record_transcript(session.session_id, new_messages, "", resolve_model(request.model), "llm",
+                              _elapsed_ms(started), error=True)
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers=_retry_headers(e))
+        response_content = result.content
+        record_transcript(session.session_id, new_messages, response_content, result.model, result.source,
+                          _elapsed_ms(started), result.prompt_tokens, result.completion_tokens)
+        await session_store.append(session, new_messages + [{"role": "assistant", "content": response_content}])
+        # A cached answer is already in the history it was retrieved from (or was when it was cached)
+        if result.source != "cache":
+            background_tasks.add_task(context_assembler.remember, messages_data[-1]["content"], response_content)
+        
         return ChatResponse(
             response=response_content,
-            model_used=request.model or settings.DEFAULT_MODEL
+            model_used=result.model,
+            session_id=session.session_id
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in chat_endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+
+def _retry_headers(error: UpstreamError):
+    if error.retry_after is None:
+        return None
+    return {"Retry-After": str(math.ceil(error.retry_after))}
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+def _history_tokens(session, new_messages) -> int:
+    """Session's rolling token count plus the new turn, without re-counting history."""
+    return session.token_count + sum(estimate_tokens(m["content"]) for m in new_messages)
+
+def _sse(event: str, data: dict) -> str:
+    """Formats a single Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_chat_turn(request: ChatRequest) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Runs one streamed chat turn, yielding (event, data) pairs: `token` ({"content": ...}) per
+    delta, then `done` ({"model_used": ..., "session_id": ...}), or `error` ({"detail": ...,
+    "status": ...}) if every model in the route fails or the stream breaks.
+    Shared by the SSE and WebSocket transports. Closing or cancelling it mid-stream closes the
+    upstream call, and the unfinished turn is not added to the session.
+    """
+    started = time.perf_counter()
+    new_messages = [{"role": m.role, "content": m.content} for m in request.messages]
+    session, _ = await session_store.get_or_create(request.session_id)
+    messages_data = session_store.history(session) + new_messages
+    model_used = resolve_model(request.model)
+
+    fast_answer = answer_property_question(messages_data)
+    if fast_answer is not None:
+        await session_store.append(session, new_messages + [{"role": "assistant", "content": fast_answer}])
+        record_transcript(session.session_id, new_messages, fast_answer, PROPERTY_INDEX_MODEL,
+                          "property-index", _elapsed_ms(started))
+        yield "token", {"content": fast_answer}
+        yield "done", {"model_used": PROPERTY_INDEX_MODEL, "session_id": session.session_id}
+        return
+    try:
+        prompt_messages = await context_assembler.assemble(
+            messages_data, history_tokens=_history_tokens(session, new_messages)
+        )
+        parts = []
+        usage = {}
+        async for content in mistral_service.chat_completion_stream(
+            messages=prompt_messages,
+            model=request.model,
+            temperature=request.temperature,
+            usage=usage,
+            cache_messages=messages_data,
+        ):
+            parts.append(content)
+            yield "token", {"content": content}
+        reply = "".join(parts)
+        answered_by = usage.get("model", model_used)
+        # Cache hits are replayed without usage
+        source = "llm" if usage else "cache"
+        record_transcript(session.session_id, new_messages, reply, answered_by, source,
+                          _elapsed_ms(started), usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        await session_store.append(session, new_messages + [{"role": "assistant", "content": reply}])
+        if source != "cache":
+            # Not awaited: the stream (and the client's measured latency) ends with "done"
+            _in_background(asyncio.to_thread(context_assembler.remember, messages_data[-1]["content"], reply))
+        yield "done", {"model_used": answered_by, "session_id": session.session_id}
+    except UpstreamError as e:
+        logger.error(f"Error in chat stream: {e}")
+        record_transcript(session.session_id, new_messages, "", model_used, "llm", _elapsed_ms(started), error=True)
+        yield "error", {"detail": str(e), "status": e.status_code, "retry_after": e.retry_after}
+    except Exception as e:
+        logger.error(f"Error in chat stream: {e}", exc_info=True)
+        yield "error", {"detail": "Sorry, I encountered an error while processing your request."}
+
+@mistral_router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Streams the assistant reply as Server-Sent Events (see stream_chat_turn for the events)."""
+    logger.info("Chat stream endpoint called. Message count: %d", len(request.messages))
+
+    async def event_stream():
+        async for event, data in stream_chat_turn(request):
+            yield _sse(event, data)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@mistral_router.get("/cache/stats")
+async def cache_stats_endpoint():
+    """Hit/miss counters and size of the response cache, plus coalesced upstream calls."""
+    stats = await asyncio.to_thread(response_cache.get_stats)
+    return {**stats, "coalesced": mistral_service.inflight.coalesced}
+
+@mistral_router.get("/models/health")
+async def model_health_endpoint():
+    """Per-model EWMA latency, error rate, p95 hedging deadline and circuit breaker state, plus the upstream queue."""
+    return {
+        "route": mistral_service.router.route(),
+        "models": mistral_service.router.snapshot(),
+        "scheduler": mistral_service.scheduler.stats(),
+    }
+
+@mistral_router.delete("/cache/{model}")
+async def cache_invalidate_endpoint(model: str):
+    """Drops cached answers for a single model, e.g. after retraining it."""
+    await response_cache.invalidate_model(model)
+    return {"invalidated": model}
@@ -0,0 +1,20 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from core.metrics import registry, RESPONSE_CACHE_ENTRIES, ACTIVE_SESSIONS, MONGO_QUEUE_DEPTH
+from services.cache_service import response_cache
+from services.session_store import session_store
+from services.mongo_writer import mongo_writer
+
+metrics_router = APIRouter()
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics."""
+    # Size gauges are sampled at scrape time instead of on every change
+    # Both count rows in the shared cache when it is enabled
+    RESPONSE_CACHE_ENTRIES.set((await asyncio.to_thread(response_cache.get_stats))["entries"])
+    ACTIVE_SESSIONS.set(await asyncio.to_thread(len, session_store))
+    MONGO_QUEUE_DEPTH.set(mongo_writer.queue_depth())
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
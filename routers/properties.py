@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException
+from classes.models import PropertyQuery, PropertyRecord, PropertySearchResponse
+from services.property_index import property_index
+from config.logger import logger
+
+property_router = APIRouter()
+
+@property_router.post("/properties/search", response_model=PropertySearchResponse)
+async def property_search_endpoint(query: PropertyQuery):
+    """Filters, sorts and paginates the property catalogue from the in-memory index."""
+    equals = {}
+    if query.location:
+        equals["Location"] = query.location
+    if query.property_type:
+        equals["Property_Type"] = query.property_type
+    if query.status:
+        equals["Status"] = query.status
+
+    ranges = {
+        "price": (query.min_price, query.max_price),
+        "size": (query.min_size, query.max_size),
+        "year": (query.min_year, query.max_year),
+        "bedrooms": (query.min_bedrooms, None),
+    }
+
+    try:
+        total, rows = property_index.search(
+            equals=equals,
+            ranges=ranges,
+            sort_by=query.sort_by,
+            descending=query.sort_order == "desc",
+            limit=query.limit,
+            offset=query.offset,
+        )
+    except Exception as e:
+        logger.error(f"Error in property_search_endpoint: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    items = [
+        PropertyRecord(**{col.lower(): value for col, value in record.items()})
+        for record in property_index.records(rows)
+    ]
+    return PropertySearchResponse(total=total, limit=query.limit, offset=query.offset, items=items)
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from typing import Dict
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from classes.models import ChatRequest
+from routers.api import stream_chat_turn
+from config.settings import settings
+from config.logger import get_logger
+from core.metrics import WEBSOCKET_CONNECTIONS, CHAT_CANCELLED
+
+logger = get_logger("api")
+ws_router = APIRouter()
+
+
+class ChatConnection:
+    """
+    One browser tab's socket. Each conversation ID has at most one generation running as
+    its own task; frames from all of them share the socket, tagged with their ID.
+    Cancelling a task closes its upstream stream, so abandoned answers stop using tokens.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # Generations send concurrently; one frame at a time goes out on the socket
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, frame: dict):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(frame))
+
+    async def handle(self, frame: dict):
+        kind = frame.get("type")
+        conversation_id = frame.get("id")
+        if not isinstance(conversation_id, str) or not conversation_id:
+            await self.send({"type": "error", "id": conversation_id, "status": 400, "detail": "Missing conversation id"})
+            return
+
+        if kind == "cancel":
+            if self.cancel(conversation_id, "client"):
+                await self.send({"type": "cancelled", "id": conversation_id})
+            return
+        if kind != "chat":
+            await self.send({"type": "error", "id": conversation_id, "status": 400, "detail": f"Unknown frame type: {kind}"})
+            return
+
+        try:
+            request = ChatRequest.model_validate(frame)
+        except ValidationError as e:
+            await self.send({"type": "error", "id": conversation_id, "status": 422, "detail": str(e)})
+            return
+
+        # A new question on a busy conversation replaces the one still being answered
+        if self.cancel(conversation_id, "replaced"):
+            await self.send({"type": "cancelled", "id": conversation_id})
+        if len(self.tasks) >= settings.WS_MAX_CONVERSATIONS:
+            await self.send({
+                "type": "error", "id": conversation_id, "status": 429,
+                "detail": f"At most {settings.WS_MAX_CONVERSATIONS} concurrent conversations per connection",
+            })
+            return
+        task = asyncio.create_task(self.generate(conversation_id, request))
+        self.tasks[conversation_id] = task
+        task.add_done_callback(lambda done: self._forget(conversation_id, done))
+
+    async def generate(self, conversation_id: str, request: ChatRequest):
+        logger.info("WebSocket chat %s. Message count: %d", conversation_id, len(request.messages))
+        turn = stream_chat_turn(request)
+        try:
+            async for event, data in turn:
+                await self.send({"type": event, "id": conversation_id, **data})
+        finally:
+            # Runs on cancellation too: closes the upstream stream and frees its scheduler slot
+            await turn.aclose()
+
+    def cancel(self, conversation_id: str, reason: str) -> bool:
+        task = self.tasks.pop(conversation_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        CHAT_CANCELLED.inc(reason=reason)
+        return True
+
+    def cancel_all(self, reason: str):
+        for conversation_id in list(self.tasks):
+            self.cancel(conversation_id, reason)
+
+    def _forget(self, conversation_id: str, task: asyncio.Task):
+        if self.tasks.get(conversation_id) is task:
+            del self.tasks[conversation_id]
+        if not task.cancelled() and task.exception() is not None:
+            # Usually the socket closing under a send; the receive loop handles the disconnect
+            logger.debug(f"WebSocket generation {conversation_id} ended: {task.exception()}")
+
+
+@ws_router.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat over one persistent connection with several concurrent conversations.
+
+    Client frames (JSON):
+      {"type": "chat", "id": ..., "messages": [...], "model": ..., "temperature": ..., "session_id": ...}
+      {"type": "cancel", "id": ...}
+    Server frames carry the same id: `token` ({"content"}), `done` ({"model_used", "session_id"}),
+    `error` ({"detail", "status", "retry_after"}) and `cancelled`.
+    """
+    await websocket.accept()
+    connection = ChatConnection(websocket)
+    WEBSOCKET_CONNECTIONS.inc()
+    try:
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await connection.send({"type": "error", "id": None, "status": 400, "detail": "Frames must be JSON"})
+                continue
+            if not isinstance(frame, dict):
+                await connection.send({"type": "error", "id": None, "status": 400, "detail": "Frames must be JSON objects"})
+                continue
+            await connection.handle(frame)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is left to read the answers
+        connection.cancel_all("disconnect")
+        WEBSOCKET_CONNECTIONS.dec()
@@ -0,0 +1,392 @@
+"""
+Runs a JSONL file of chat requests through MistralService.
+
+Each input line is a JSON object with either "messages" (Mistral chat format) or a
+plain "prompt", plus optional "custom_id"/"id", "model" and "temperature":
+
+    {"custom_id": "listing-42", "messages": [{"role": "user", "content": "Describe ..."}]}
+
+Usage:
+    python scripts/batch_inference.py requests.jsonl results.jsonl --concurrency 16
+    python scripts/batch_inference.py requests.jsonl results.jsonl --batch-api
+
+Results are appended to the output file as each request finishes (one JSON object per
+line, tagged with the input line number), so the output doubles as the checkpoint:
+re-running the same command skips every line that already has a result (with
+--retry-failed, failed lines are run again and the newer record supersedes). 429s and
+transient 5xx/timeouts are retried with exponential backoff, and the number of
+concurrent requests is halved when 429s arrive and grown back slowly after successes.
+
+--batch-api submits the file through Mistral's batch jobs API instead (cheaper for large
+jobs, results arrive when the job finishes). Submitted job ids are kept in
+<output>.batch.json so an interrupted run picks the same jobs up again.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, Iterator, Optional, Set
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings
+from config.logger import logger
+from core.metrics import MISTRAL_RETRIES
+from core.model_alias import resolve_model
+from core.upstream_errors import error_status, retry_after_seconds
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+BATCH_TERMINAL_STATUS = {"SUCCESS", "FAILED", "TIMEOUT_EXCEEDED", "CANCELLED"}
+
+
+def parse_request(line_no: int, raw: str, default_model: str) -> dict:
+    data = json.loads(raw)
+    if "messages" in data:
+        messages = data["messages"]
+    elif "prompt" in data:
+        messages = [{"role": "user", "content": data["prompt"]}]
+    else:
+        raise ValueError("expected 'messages' or 'prompt'")
+    return {
+        "line": line_no,
+        "id": data.get("custom_id") or data.get("id") or str(line_no),
+        "messages": messages,
+        "model": data.get("model") or default_model,
+        "temperature": data.get("temperature"),
+    }
+
+
+def read_requests(path: str, done: Set[int], default_model: str) -> Iterator[dict]:
+    """Streams requests from `path`, skipping finished and malformed lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, raw in enumerate(f):
+            if line_no in done or not raw.strip():
+                continue
+            try:
+                yield parse_request(line_no, raw, default_model)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Skipping line {line_no}: {e}")
+
+
+def load_checkpoint(output_path: str, retry_failed: bool) -> Set[int]:
+    """Line numbers that already have a result. A half-written last line is cut off."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        valid_end = 0
+        for raw in f:
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                break
+            valid_end += len(raw)
+            if not (retry_failed and record.get("error")):
+                done.add(record["line"])
+        f.truncate(valid_end)
+    return done
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight requests: halves on a 429 (and pauses everyone for the
+    backoff window), then grows by one after `limit` consecutive successes.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttle(self, delay: float):
+        self._successes = 0
+        # 429s from requests that were already in flight during this backoff window count once
+        now = time.monotonic()
+        if now >= self._paused_until and self.limit > 1:
+            self.limit = max(1, self.limit // 2)
+            logger.warning(f"Rate limited, concurrency lowered to {self.limit}")
+        self._paused_until = max(self._paused_until, now + delay)
+
+
+class ResultWriter:
+    """Appends result records, flushing every `flush_every` lines."""
+
+    def __init__(self, path: str, flush_every: int = 20):
+        self.file = open(path, "a", encoding="utf-8")
+        self.flush_every = flush_every
+        self.written = 0
+        self.failed = 0
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.written += 1
+        if record.get("error"):
+            self.failed += 1
+        if self.written % self.flush_every == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+async def run_request(service, limiter: AdaptiveConcurrency, request: dict, args) -> dict:
+    started = time.perf_counter()
+    error = None
+    for attempt in range(1, args.max_retries + 2):
+        await limiter.acquire()
+        try:
+            result = await service.chat_completion_uncached(
+                request["messages"], model=request["model"], temperature=request["temperature"], timeout=args.timeout
+            )
+        except Exception as e:
+            error = e
+        else:
+            limiter.on_success()
+            return {
+                "line": request["line"],
+                "id": request["id"],
+                "model": result.model,
+                "response": result.content,
+                "prompt_tokens": result.prompt_tokens,
+                "completion_tokens": result.completion_tokens,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                "attempts": attempt,
+                "error": None,
+            }
+        finally:
+            await limiter.release()
+
+        code = error_status(error)
+        timed_out = isinstance(error, asyncio.TimeoutError)
+        if attempt > args.max_retries or not (timed_out or code in RETRYABLE_STATUS):
+            break
+        # Exponential backoff with full jitter, or the server's Retry-After when it gives one
+        delay = retry_after_seconds(error) or random.uniform(0, min(args.max_backoff, args.backoff * 2 ** (attempt - 1)))
+        if code == 429:
+            limiter.on_throttle(delay)
+        MISTRAL_RETRIES.inc(model=request["model"], reason="timeout" if timed_out else str(code))
+        logger.info(f"Line {request['line']} attempt {attempt} failed ({code or type(error).__name__}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    return {
+        "line": request["line"],
+        "id": request["id"],
+        "model": request["model"],
+        "response": None,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        "attempts": attempt,
+        "error": str(error) or type(error).__name__,
+    }
+
+
+async def run_online(args):
+    from services.mistral_service import mistral_service
+    from services.scheduler import BATCH, set_priority
+
+    # Queue behind interactive traffic and leave the web server its share of the key's quotas
+    set_priority(BATCH)
+    mistral_service.scheduler.scale_quota(settings.MISTRAL_BATCH_QUOTA_SHARE)
+
+    done = load_checkpoint(args.output, args.retry_failed)
+    if done:
+        logger.info(f"Resuming: {len(done)} lines already finished in {args.output}")
+
+    limiter = AdaptiveConcurrency(args.concurrency)
+    writer = ResultWriter(args.output)
+    # Bounded, so the input file is streamed rather than read up front
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    started = time.perf_counter()
+
+    async def produce():
+        for request in read_requests(args.input, done, args.model):
+            await queue.put(request)
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            request = await queue.get()
+            if request is None:
+                return
+            writer.write(await run_request(mistral_service, limiter, request, args))
+            if writer.written % args.progress_every == 0:
+                rate = writer.written / (time.perf_counter() - started)
+                logger.info(f"{writer.written} done ({writer.failed} failed), {rate:.1f}/s, concurrency {limiter.limit}")
+
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(args.concurrency)))
+    finally:
+        writer.close()
+        await mistral_service.close()
+    logger.info(f"Finished: {writer.written} written this run ({writer.failed} failed) in "
+                f"{time.perf_counter() - started:.1f}s -> {args.output}")
+
+
+async def run_batch_api(args):
+    from services.mistral_service import mistral_service
+    client = mistral_service.client
+
+    done = load_checkpoint(args.output, args.retry_failed)
+    state_path = args.output + ".batch.json"
+    state: Dict[str, dict] = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        logger.info(f"Resuming {len(state)} submitted batch job(s) from {state_path}")
+    # Only models without a saved job are submitted, so an interrupted submission resumes without duplicates
+    await submit_batch_jobs(client, args, done, state, state_path)
+
+    writer = ResultWriter(args.output)
+    try:
+        for model, job in state.items():
+            finished = await poll_batch_job(client, job["job_id"], args.poll_interval)
+            for file_id in (finished.output_file, finished.error_file):
+                if file_id:
+                    await write_batch_results(client, file_id, model, job["ids"], done, writer)
+            if finished.status != "SUCCESS":
+                logger.error(f"Batch job {job['job_id']} ended with status {finished.status}: {finished.errors}")
+    finally:
+        writer.close()
+        await mistral_service.close()
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    logger.info(f"Finished: {writer.written} results ({writer.failed} failed) -> {args.output}")
+
+
+async def submit_batch_jobs(client, args, done: Set[int], state: Dict[str, dict], state_path: str):
+    """
+    Writes one batch input file per model not yet in `state`, uploads it and creates the job.
+    Each job is added to `state` and saved as soon as it is created, so a failure on a later
+    model never loses (and a re-run never resubmits) the paid jobs already created.
+    """
+    files, ids, resolved = {}, {}, {}
+    try:
+        for request in read_requests(args.input, done, args.model):
+            # Jobs go straight to the API rather than through the router, so aliases are resolved here
+            if request["model"] not in resolved:
+                resolved[request["model"]] = resolve_model(request["model"])
+            model = resolved[request["model"]]
+            if model in state:
+                continue
+            if model not in files:
+                files[model] = open(f"{args.output}.batch-input-{len(files)}.jsonl", "w", encoding="utf-8")
+                ids[model] = {}
+            body = {"messages": request["messages"]}
+            if request["temperature"] is not None:
+                body["temperature"] = request["temperature"]
+            files[model].write(json.dumps({"custom_id": str(request["line"]), "body": body}) + "\n")
+            ids[model][str(request["line"])] = request["id"]
+    finally:
+        for f in files.values():
+            f.close()
+
+    for model, f in files.items():
+        with open(f.name, "rb") as content:
+            uploaded = await client.files.upload_async(
+                file={"file_name": os.path.basename(f.name), "content": content}, purpose="batch"
+            )
+        job = await client.batch.jobs.create_async(
+            input_files=[uploaded.id],
+            model=model,
+            endpoint="/v1/chat/completions",
+            metadata={"source": "batch_inference", "input": os.path.basename(args.input)},
+        )
+        os.remove(f.name)
+        logger.info(f"Submitted batch job {job.id} ({len(ids[model])} requests, model {model})")
+        state[model] = {"job_id": job.id, "ids": ids[model]}
+        _save_state(state_path, state)
+
+
+def _save_state(path: str, state: Dict[str, dict]):
+    # Write-then-rename so an interrupted write never leaves a truncated state file
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+async def poll_batch_job(client, job_id: str, interval: float):
+    delay = interval
+    while True:
+        job = await client.batch.jobs.get_async(job_id=job_id)
+        logger.info(f"Batch job {job_id}: {job.status} ({job.completed_requests}/{job.total_requests})")
+        if job.status in BATCH_TERMINAL_STATUS:
+            return job
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.5, 300)
+
+
+async def write_batch_results(client, file_id: str, model: str, ids: Dict[str, str], done: Set[int], writer: ResultWriter):
+    response = await client.files.download_async(file_id=file_id)
+    async for raw in response.aiter_lines():
+        if not raw.strip():
+            continue
+        item = json.loads(raw)
+        line = int(item["custom_id"])
+        if line in done:
+            continue
+        body = (item.get("response") or {}).get("body") or {}
+        usage = body.get("usage") or {}
+        error = item.get("error")
+        if error is None and (item.get("response") or {}).get("status_code", 200) != 200:
+            error = body
+        writer.write({
+            "line": line,
+            "id": ids.get(item["custom_id"], item["custom_id"]),
+            "model": body.get("model", model),
+            "response": None if error else body["choices"][0]["message"]["content"],
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "error": json.dumps(error) if error else None,
+        })
+        done.add(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat requests through Mistral")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument("output", help="JSONL file results are appended to (also the resume checkpoint)")
+    parser.add_argument("--model", default=settings.DEFAULT_MODEL, help="Model for lines without a 'model' field")
+    parser.add_argument("--concurrency", type=int, default=settings.MISTRAL_MAX_CONCURRENCY,
+                        help="Maximum concurrent requests (lowered automatically on 429s)")
+    parser.add_argument("--timeout", type=float, default=settings.MISTRAL_TIMEOUT_SECONDS)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base backoff in seconds")
+    parser.add_argument("--max-backoff", type=float, default=60.0)
+    parser.add_argument("--retry-failed", action="store_true", help="On resume, also redo lines that failed")
+    parser.add_argument("--progress-every", type=int, default=100)
+    parser.add_argument("--batch-api", action="store_true", help="Submit through Mistral's batch jobs API")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="Batch job polling interval in seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(run_batch_api(args) if args.batch_api else run_online(args))
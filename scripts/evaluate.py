@@ -0,0 +1,318 @@
+"""
+Evaluates one or more models on the fine-tuning validation set.
+
+Every example in validation_data.jsonl is sent to each model (conversation minus the
+reference answer) with bounded concurrency, reusing the retry/backoff logic of
+batch_inference.py. Answers are scored by field-level exact match against the
+property_data.csv index rather than against the reference text: price, status,
+bedrooms and bathrooms are extracted from the answer and compared with the property's
+real values, for the fields the question's template asks about.
+
+Usage:
+    python scripts/evaluate.py --models mistral-tiny,ft:open-mistral-7b:abc123
+    python scripts/evaluate.py --models fine-tuned-latest --limit 200 --report eval.json
+
+Responses are cached on disk by sha256(model, prompt), so re-running after adding a model
+(or after an interruption) only calls the API for what is missing; cached entries keep
+the latency and token counts of the original call. --no-cache forces fresh calls.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings
+from config.logger import logger
+from core.model_alias import resolve_model
+from core.property_templates import TEMPLATE_SET
+from services.property_index import property_index, ID_PATTERN, NAME_PATTERN
+from batch_inference import AdaptiveConcurrency, run_request
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VALIDATION_FILE = os.path.join(SCRIPT_DIR, "validation_data.jsonl")
+CACHE_DIR = os.path.join(SCRIPT_DIR, "eval_cache")
+
+# Scored field -> CSV column it is checked against
+SCORED_FIELDS = {
+    "price": "Price_USD",
+    "status": "Status",
+    "bedrooms": "Bedrooms",
+    "bathrooms": "Bathrooms",
+}
+
+_PRICE_RE = re.compile(r"\$\s?(\d[\d,]*(?:\.\d+)?)")
+_BEDROOMS_RE = re.compile(r"(\d+)\s*(?:-\s*)?bed(?:room)?s?\b|bedrooms?\W{1,3}(\d+)", re.IGNORECASE)
+_BATHROOMS_RE = re.compile(r"(\d+)\s*(?:-\s*)?bath(?:room)?s?\b|bathrooms?\W{1,3}(\d+)", re.IGNORECASE)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# --- Reading the validation set ---
+
+def _find_row(question: str) -> Optional[int]:
+    ids = ID_PATTERN.findall(question)
+    if ids:
+        return property_index.find_row(property_id=ids[0])
+    names = NAME_PATTERN.findall(question)
+    if names:
+        return property_index.find_row(name=names[0])
+    return None
+
+
+def _expected_fields(question: str, record: Dict[str, str]) -> List[str]:
+    """Scored fields the question asks about, found by matching it against the rendered templates."""
+    for template in TEMPLATE_SET.templates:
+        if template.question.render(record) == question:
+            columns = template.answer.fields
+            return [field for field, column in SCORED_FIELDS.items() if column in columns]
+    # Not generated from a known template: score every field
+    return list(SCORED_FIELDS)
+
+
+def read_examples(path: str, limit: Optional[int] = None) -> Iterator[dict]:
+    """Streams scorable examples: prompt messages, the property row and the fields to check."""
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, raw in enumerate(f):
+            if limit is not None and count >= limit:
+                return
+            if not raw.strip():
+                continue
+            messages = json.loads(raw)["messages"]
+            if messages[-1]["role"] == "assistant":
+                messages = messages[:-1]
+            question = messages[-1]["content"]
+            row = _find_row(question)
+            if row is None:
+                logger.warning(f"Line {line_no}: no property found in {question!r}, skipping")
+                continue
+            record = property_index.record(row)
+            fields = _expected_fields(question, record)
+            if not fields:
+                continue
+            count += 1
+            yield {
+                "line": line_no,
+                "id": record["Property_ID"],
+                "messages": messages,
+                "truth": {field: record[SCORED_FIELDS[field]] for field in fields},
+            }
+
+
+# --- Scoring ---
+
+def _ints(pattern: re.Pattern, text: str) -> set:
+    values = set()
+    for match in pattern.finditer(text):
+        digits = next(group for group in match.groups() if group)
+        values.add(int(digits.replace(",", "").split(".")[0]))
+    return values
+
+
+def extract_fields(text: str, statuses: set) -> Dict[str, set]:
+    """Every candidate value per scored field mentioned in `text`."""
+    lowered = text.casefold()
+    return {
+        "price": _ints(_PRICE_RE, text),
+        "status": {s for s in statuses if re.search(rf"\b{re.escape(s)}\b", lowered)},
+        "bedrooms": _ints(_BEDROOMS_RE, text),
+        "bathrooms": _ints(_BATHROOMS_RE, text),
+    }
+
+
+def score(answer: str, truth: Dict[str, str], statuses: set) -> Dict[str, bool]:
+    """A field is correct when the answer states exactly one value for it and that value is right."""
+    found = extract_fields(answer or "", statuses)
+    results = {}
+    for field, expected in truth.items():
+        expected = expected.casefold() if field == "status" else int(expected)
+        results[field] = found[field] == {expected}
+    return results
+
+
+# --- Response cache ---
+
+class ResponseCache:
+    """One JSON file per (model, prompt) under `root`, written atomically."""
+
+    def __init__(self, root: str, enabled: bool = True):
+        self.root = root
+        self.enabled = enabled
+
+    def _path(self, model: str, messages: List[Dict[str, str]]) -> str:
+        key = hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, model: str, messages: List[Dict[str, str]]) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(model, messages), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def set(self, model: str, messages: List[Dict[str, str]], result: dict):
+        path = self._path(model, messages)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+# --- Running ---
+
+async def evaluate_model(service, model: str, cache: ResponseCache, statuses: set, args) -> dict:
+    limiter = AdaptiveConcurrency(args.concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    field_hits = {field: 0 for field in SCORED_FIELDS}
+    field_totals = {field: 0 for field in SCORED_FIELDS}
+    latencies: List[float] = []
+    completion_tokens: List[int] = []
+    stats = {"examples": 0, "exact": 0, "errors": 0, "cached": 0}
+    samples = []
+    started = time.perf_counter()
+
+    async def produce():
+        for example in read_examples(args.data, args.limit):
+            await queue.put(example)
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            example = await queue.get()
+            if example is None:
+                return
+            request = {"line": example["line"], "id": example["id"], "messages": example["messages"],
+                       "model": model, "temperature": args.temperature}
+            result = cache.get(model, example["messages"])
+            if result is not None:
+                stats["cached"] += 1
+            else:
+                result = await run_request(service, limiter, request, args)
+                if result["error"]:
+                    stats["errors"] += 1
+                    logger.warning(f"{model} line {example['line']} failed: {result['error']}")
+                    continue
+                cache.set(model, example["messages"], result)
+
+            correct = score(result["response"], example["truth"], statuses)
+            stats["examples"] += 1
+            stats["exact"] += all(correct.values())
+            for field, ok in correct.items():
+                field_totals[field] += 1
+                field_hits[field] += ok
+            latencies.append(result["latency_ms"])
+            completion_tokens.append(result.get("completion_tokens", 0))
+            if not all(correct.values()) and len(samples) < args.samples:
+                samples.append({"line": example["line"], "truth": example["truth"], "response": result["response"]})
+            if stats["examples"] % args.progress_every == 0:
+                logger.info(f"{model}: {stats['examples']} scored ({stats['errors']} failed, {stats['cached']} cached)")
+
+    await asyncio.gather(produce(), *(work() for _ in range(args.concurrency)))
+
+    n = stats["examples"]
+    return {
+        "model": model,
+        **stats,
+        "accuracy": stats["exact"] / n if n else None,
+        "field_accuracy": {
+            field: field_hits[field] / field_totals[field] if field_totals[field] else None
+            for field in SCORED_FIELDS
+        },
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / n if n else None,
+        },
+        "completion_tokens_per_answer": sum(completion_tokens) / n if n else None,
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "failures": samples,
+    }
+
+
+def _fmt(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(reports: List[dict]):
+    header = f"{'model':<32} {'n':>5} {'err':>4} {'acc':>6} " + " ".join(f"{f:>9}" for f in SCORED_FIELDS) + \
+             f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'tok/ans':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        fields = " ".join(f"{_fmt(r['field_accuracy'][f], '.1%'):>9}" for f in SCORED_FIELDS)
+        latency = r["latency_ms"]
+        name = r["model"] if r["requested_model"] == r["model"] else f"{r['requested_model']} ({r['model']})"
+        print(f"{name:<32} {r['examples']:>5} {r['errors']:>4} {_fmt(r['accuracy'], '.1%'):>6} {fields} "
+              f"{_fmt(latency['p50'], '.0f'):>8} {_fmt(latency['p95'], '.0f'):>8} {_fmt(latency['p99'], '.0f'):>8} "
+              f"{_fmt(r['completion_tokens_per_answer'], '.1f'):>8}")
+
+
+async def run(args):
+    from services.mistral_service import mistral_service
+    from services.scheduler import BATCH, set_priority
+
+    # Queue behind interactive traffic and leave the web server its share of the key's quotas
+    set_priority(BATCH)
+    mistral_service.scheduler.scale_quota(settings.MISTRAL_BATCH_QUOTA_SHARE)
+
+    property_index.load()
+    statuses = {str(s).casefold() for s in set(property_index.columns["Status"].tolist())}
+    cache = ResponseCache(args.cache_dir, enabled=not args.no_cache)
+    reports = []
+    try:
+        for name in args.models.split(","):
+            model = resolve_model(name.strip())
+            logger.info(f"Evaluating {model} on {args.data}")
+            report = await evaluate_model(mistral_service, model, cache, statuses, args)
+            report["requested_model"] = name.strip()
+            reports.append(report)
+    finally:
+        await mistral_service.close()
+
+    print_report(reports)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"data": args.data, "created_at": time.time(), "models": reports}, f, indent=2)
+        logger.info(f"Report written to {args.report}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Score models on the validation set (accuracy, latency, tokens)")
+    parser.add_argument("--models", default=settings.DEFAULT_MODEL, help="Comma-separated model IDs or aliases")
+    parser.add_argument("--data", default=VALIDATION_FILE, help="Chat-format JSONL with reference answers")
+    parser.add_argument("--limit", type=int, default=None, help="Only score the first N examples")
+    parser.add_argument("--concurrency", type=int, default=settings.MISTRAL_MAX_CONCURRENCY)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=settings.MISTRAL_TIMEOUT_SECONDS)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base backoff in seconds")
+    parser.add_argument("--max-backoff", type=float, default=60.0)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached responses (new ones are still stored)")
+    parser.add_argument("--samples", type=int, default=5, help="Wrong answers kept per model in the report")
+    parser.add_argument("--progress-every", type=int, default=100)
+    parser.add_argument("--report", help="Also write the full report as JSON to this path")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
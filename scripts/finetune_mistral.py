@@ -1,83 +1,208 @@
+import argparse
+import hashlib
+import json
 import os
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from mistralai import Mistral
 from dotenv import load_dotenv
-from config.logger import logger
 
-# Add project root path - REMOVED as we use pip install -e .
-# from app.core.logger import logger
+# Add project root path so the shared config/logger can be imported when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.logger import logger
+from config.settings import settings
 
 # Load env vars
 load_dotenv()
 
-api_key = os.getenv("MISTRAL_API_KEY")
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINING_FILE = os.path.join(SCRIPT_DIR, "training_data.jsonl")
+VALIDATION_FILE = os.path.join(SCRIPT_DIR, "validation_data.jsonl")
+# SHA-256 of a dataset file -> file id already uploaded to Mistral
+REGISTRY_FILE = os.path.join(SCRIPT_DIR, "uploaded_files.json")
+# Job being monitored, so an interrupted run resumes polling instead of starting another job
+JOB_STATE_FILE = os.path.join(SCRIPT_DIR, "finetune_job.json")
 
-if not api_key:
-    logger.error("MISTRAL_API_KEY not found in environment variables.")
-    # Assuming .env is in the project root, try to load it specifically if missing
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    load_dotenv(os.path.join(project_root, ".env"))
+TERMINAL_STATUSES = {"SUCCESS", "FAILED", "FAILED_VALIDATION", "CANCELLED"}
+HASH_CHUNK_BYTES = 1024 * 1024
+
+def get_client() -> Mistral:
     api_key = os.getenv("MISTRAL_API_KEY")
+    if not api_key:
+        # Assuming .env is in the project root, try to load it specifically if missing
+        load_dotenv(os.path.join(os.path.dirname(SCRIPT_DIR), ".env"))
+        api_key = os.getenv("MISTRAL_API_KEY")
+    if not api_key:
+        # If still not found, exit
+        logger.error("MISTRAL_API_KEY not found. Please check your .env file.")
+        sys.exit(1)
+    return Mistral(api_key=api_key, server_url=settings.MISTRAL_SERVER_URL or None)
 
-if not api_key:
-    # If still not found, exit
-    print("FATAL: MISTRAL_API_KEY not found. Please check your .env file.")
-    exit(1)
+def _load_json(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-print(f"DEBUG: Loaded API Key: {api_key[:4]}...{api_key[-4:]} (Length: {len(api_key)})")
+def _save_json(path: str, data: dict):
+    # Write-then-rename so a crash never leaves a truncated file behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
 
+def file_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-client = Mistral(api_key=api_key)
+def _remote_file_exists(client: Mistral, file_id: str) -> bool:
+    try:
+        client.files.retrieve(file_id=file_id)
+        return True
+    except Exception as e:
+        logger.info(f"Registered file {file_id} is no longer available ({e}), uploading again")
+        return False
+
+def upload_file(client: Mistral, filepath: str, registry: dict) -> str:
+    """Returns the file id for `filepath`, uploading it only if this exact content wasn't uploaded before."""
+    sha = file_sha256(filepath)
+    known = registry.get(sha)
+    if known and _remote_file_exists(client, known["file_id"]):
+        logger.info(f"{os.path.basename(filepath)} unchanged, reusing file {known['file_id']}")
+        return known["file_id"]
 
-def upload_file(filepath):
     logger.info(f"Uploading {filepath}...")
     try:
+        # Passing the open file streams it instead of reading it into memory
         with open(filepath, "rb") as f:
             response = client.files.upload(file={
                 "file_name": os.path.basename(filepath),
-                "content": f.read(),
+                "content": f,
             }, purpose="fine-tune")
         logger.info(f"Uploaded {filepath}, ID: {response.id}")
-        return response.id
     except Exception as e:
         logger.error(f"Failed to upload {filepath}: {e}")
         raise
+    registry[sha] = {"file_id": response.id, "file_name": os.path.basename(filepath), "uploaded_at": time.time()}
+    return response.id
+
+def upload_datasets(client: Mistral, paths):
+    """Uploads (or reuses) all datasets in parallel and records them in the registry."""
+    registry = _load_json(REGISTRY_FILE)
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        file_ids = list(pool.map(lambda path: upload_file(client, path, registry), paths))
+    _save_json(REGISTRY_FILE, registry)
+    return file_ids
+
+def monitor_job(client: Mistral, job_id: str, interval: float, max_interval: float,
+                started: bool = True, start: bool = False, wait: bool = True):
+    """
+    Polls the job with exponential backoff (reset whenever the status changes) until it finishes.
+    A job created without auto-start waits at VALIDATED: it is started there if `start` is set,
+    otherwise that is where monitoring ends. With `wait` unset, polling ends once the job has started.
+    """
+    delay = interval
+    last_status = None
+    while True:
+        job = client.fine_tuning.jobs.get(job_id=job_id)
+        if job.status != last_status:
+            logger.info(f"Job {job_id} status: {job.status}")
+            last_status = job.status
+            delay = interval
+        if job.status == "VALIDATED" and not started:
+            if not start:
+                return job
+            logger.info(f"Starting job {job_id}")
+            client.fine_tuning.jobs.start(job_id=job_id)
+            started = True
+        _save_json(JOB_STATE_FILE, {"job_id": job_id, "status": job.status, "started": started})
+        if job.status in TERMINAL_STATUSES or (started and not wait):
+            return job
+        time.sleep(delay)
+        delay = min(delay * 2, max_interval)
 
-def start_finetune():
-    # Paths relative to this script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    training_file = os.path.join(script_dir, "training_data.jsonl")
-    validation_file = os.path.join(script_dir, "validation_data.jsonl")
-    
-    if not os.path.exists(training_file) or not os.path.exists(validation_file):
-        logger.error(f"Content files not found at {training_file}. Run prepare_data.py first.")
+def publish_model(job):
+    """Writes the fine-tuned model id where the server's "fine-tuned-latest" alias reads it."""
+    _save_json(settings.FINE_TUNED_MODEL_FILE, {
+        "fine_tuned_model": job.fine_tuned_model,
+        "job_id": job.id,
+        "base_model": job.model,
+        "completed_at": time.time(),
+    })
+    logger.info(f"Fine-tuned model {job.fine_tuned_model} written to {settings.FINE_TUNED_MODEL_FILE}")
+
+def start_finetune(args):
+    client = get_client()
+
+    # Resume monitoring a job from an earlier (interrupted) run
+    state = _load_json(JOB_STATE_FILE)
+    if state.get("job_id") and state.get("status") not in TERMINAL_STATUSES and not args.new_job:
+        logger.info(f"Resuming monitoring of job {state['job_id']}")
+        job_id = state["job_id"]
+        # Jobs created with --no-start are started by the first run without it
+        started = state.get("started", True)
+    else:
+        if not os.path.exists(TRAINING_FILE) or not os.path.exists(VALIDATION_FILE):
+            logger.error(f"Content files not found at {TRAINING_FILE}. Run prepare_data.py first.")
+            return
+
+        try:
+            train_file_id, val_file_id = upload_datasets(client, [TRAINING_FILE, VALIDATION_FILE])
+
+            # Create job
+            logger.info("Creating fine-tuning job...")
+            created_job = client.fine_tuning.jobs.create(
+                model=args.model,
+                training_files=[{"file_id": train_file_id, "weight": 1}],
+                validation_files=[val_file_id],
+                hyperparameters={
+                    "training_steps": args.training_steps,
+                    "learning_rate": args.learning_rate
+                },
+                auto_start=not args.no_start
+            )
+        except Exception as e:
+            logger.error(f"Error starting fine-tune job: {e}")
+            return
+        job_id = created_job.id
+        started = not args.no_start
+        logger.info(f"Job created successfully! Job ID: {job_id}")
+        _save_json(JOB_STATE_FILE, {"job_id": job_id, "status": created_job.status, "started": started})
+        if args.no_start:
+            logger.info("Job not started (--no-start). Re-run without --no-start to start it once it is validated.")
+            return
+
+    if args.no_wait and started:
+        logger.info(f"Not waiting for job {job_id}; re-run to resume monitoring.")
         return
 
-    try:
-        # Upload files
-        train_file_id = upload_file(training_file)
-        val_file_id = upload_file(validation_file)
-        
-        # Create job
-        logger.info("Creating fine-tuning job...")
-        created_job = client.fine_tuning.jobs.create(
-            model="open-mistral-7b", 
-            training_files=[{"file_id": train_file_id, "weight": 1}],
-            validation_files=[val_file_id],
-            hyperparameters={
-                "training_steps": 100,
-                "learning_rate": 0.0001
-            },
-            auto_start=False
-        )
-        
-        logger.info(f"Job created successfully! Job ID: {created_job.id}")
-        logger.info(f"Status: {created_job.status}")
-        logger.info(f"Model Name (once complete): {created_job.fine_tuned_model}")
-        logger.info("Use the Job ID to check status or start the job if auto_start=False.")
-    except Exception as e:
-        logger.error(f"Error starting fine-tune job: {e}")
+    job = monitor_job(client, job_id, args.poll_interval, args.max_poll_interval,
+                      started, start=not args.no_start, wait=not args.no_wait)
+    if job.status == "VALIDATED":
+        logger.info(f"Job {job_id} is validated but not started (--no-start). Re-run without --no-start to start it.")
+    elif job.status not in TERMINAL_STATUSES:
+        logger.info(f"Not waiting for job {job_id}; re-run to resume monitoring.")
+    elif job.status == "SUCCESS" and job.fine_tuned_model:
+        publish_model(job)
+    else:
+        logger.error(f"Job {job_id} finished with status {job.status}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload training data and run a Mistral fine-tuning job")
+    parser.add_argument("--model", default="open-mistral-7b", help="Base model to fine-tune")
+    parser.add_argument("--training-steps", type=int, default=100)
+    parser.add_argument("--learning-rate", type=float, default=0.0001)
+    parser.add_argument("--no-start", action="store_true", help="Create the job without starting it")
+    parser.add_argument("--no-wait", action="store_true", help="Don't poll the job until it finishes")
+    parser.add_argument("--new-job", action="store_true", help="Start a new job even if one is still being monitored")
+    parser.add_argument("--poll-interval", type=float, default=10.0, help="Initial polling interval in seconds")
+    parser.add_argument("--max-poll-interval", type=float, default=300.0)
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    start_finetune()
+    start_finetune(parse_args())
@@ -1,8 +1,17 @@
+import argparse
 import csv
+import hashlib
 import json
-import random
 import os
+import sqlite3
 import sys
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 # Add project root to path to import app modules if needed, or just stand-alone logger setup
 # Since this is a script, we can do a quick local setup or append path.
@@ -10,71 +19,382 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.logger import logger
+from config.settings import settings
+from core.property_templates import TemplateSet, load_templates
+from core.dedup import ExactDeduplicator, MinHashDeduplicator
+from services.context_service import estimate_tokens
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CSV_FILE = os.path.join(BASE_DIR, 'property_data.csv')
 OUTPUT_TRAIN = os.path.join(BASE_DIR, 'scripts', 'training_data.jsonl')
 OUTPUT_VAL = os.path.join(BASE_DIR, 'scripts', 'validation_data.jsonl')
+# Row hash -> generated examples, so re-runs only expand rows that changed
+MANIFEST_FILE = os.path.join(BASE_DIR, 'scripts', 'prepare_data_manifest.sqlite')
+
+KEY_COLUMN = 'Property_ID'
+VAL_FRACTION = 0.1  # ~10% of examples go to validation
+CHUNK_SIZE = 5000
+NEAR_DUP_THRESHOLD = 0.9  # estimated Jaccard similarity above which an example counts as a near-duplicate
+# Upper bounds (in tokens) of the example length histogram buckets
+HISTOGRAM_BOUNDS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
 
 def create_message(system_content, user_content, assistant_content):
     """Creates a message list in Mistral chat format."""
     messages = []
+    if system_content:
+        messages.append({"role": "system", "content": system_content})
     messages.append({"role": "user", "content": user_content})
     messages.append({"role": "assistant", "content": assistant_content})
     return {"messages": messages}
 
-def prepare_data():
-    logger.info(f"Reading data from {CSV_FILE}...")
-    
-    data_entries = []
-    
-    try:
-        with open(CSV_FILE, mode='r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                # Variant 1: General details
-                user_q1 = f"Can you give me the details for property {row['Property_ID']}?"
-                ans_1 = (f"Certainly. {row['Property_Name']} is a {row['Property_Type']} located in {row['Location']}. "
-                         f"It has {row['Bedrooms']} bedrooms, {row['Bathrooms']} bathrooms, and is {row['Size_sqft']} sqft. "
-                         f"The price is ${row['Price_USD']}. It was built in {row['Year_Built']} and is currently {row['Status']}.")
-                data_entries.append(create_message(None, user_q1, ans_1))
-                
-                # Variant 2: Specific attribute (Price)
-                user_q2 = f"How much does the {row['Property_Type']} at {row['Location']} (ID: {row['Property_ID']}) cost?"
-                ans_2 = f"The price for property {row['Property_ID']} is ${row['Price_USD']}."
-                data_entries.append(create_message(None, user_q2, ans_2))
-                
-                # Variant 3: Status check
-                user_q3 = f"Is property {row['Property_ID']} available for purchase?"
-                ans_3 = f"The current status of property {row['Property_ID']} is {row['Status']}."
-                data_entries.append(create_message(None, user_q3, ans_3))
-                
-                # Variant 4: Natural language query about specs
-                user_q4 = f"Tell me about the size and rooms of {row['Property_Name']}."
-                ans_4 = f"It is {row['Size_sqft']} square feet with {row['Bedrooms']} bedrooms and {row['Bathrooms']} bathrooms."
-                data_entries.append(create_message(None, user_q4, ans_4))
-    except FileNotFoundError:
-        logger.error(f"File not found: {CSV_FILE}")
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def row_hash(row: Dict[str, str]) -> str:
+    return _sha256(json.dumps(row, sort_keys=True, ensure_ascii=False))
+
+def assign_split(example_key: str, val_fraction: float) -> str:
+    """
+    Deterministic train/val assignment from a hash of the example's stable key
+    (row key + template intent): the same example always lands in the same file,
+    whatever else changed in the CSV.
+    """
+    bucket = int(_sha256(example_key)[:8], 16) / 0xFFFFFFFF
+    return 'val' if bucket < val_fraction else 'train'
+
+def read_header(csv_path: str) -> List[str]:
+    with open(csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
+        return next(csv.reader(csvfile), [])
+
+def iter_rows(csv_path: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Streams (row_key, row) pairs; rows without a key column fall back to their line number."""
+    with open(csv_path, mode='r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for line_no, row in enumerate(reader, start=2):
+            yield row.get(KEY_COLUMN) or f"line:{line_no}", row
+
+def iter_chunks(rows: Iterator, size: int) -> Iterator[list]:
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+@lru_cache(maxsize=None)
+def _templates(path: str) -> TemplateSet:
+    # Compiled once per process (workers included)
+    return load_templates(path)
+
+def expand_rows(rows: List[Tuple[str, Dict[str, str]]], templates: TemplateSet,
+                val_fraction: float) -> List[List[Tuple[str, str, str]]]:
+    """
+    Template expansion for a batch of rows, vectorized over columns.
+    Returns, per row, [(split, order_key, jsonl_line)] with one example per template.
+    """
+    columns = {
+        field: np.array([str(row.get(field, "")) for _, row in rows], dtype=np.str_)
+        for field in templates.fields
+    }
+    expanded = templates.expand_columns(columns)
+    results = []
+    for i, (row_key, _) in enumerate(rows):
+        examples = []
+        for intent, questions, answers in expanded:
+            line = json.dumps(create_message(templates.system, str(questions[i]), str(answers[i])))
+            example_key = f"{row_key}:{intent}"
+            # Output order is by content hash: a fixed shuffle, stable across runs
+            examples.append((assign_split(example_key, val_fraction), _sha256(line), line))
+        results.append(examples)
+    return results
+
+def process_chunk(args) -> Tuple[List[str], List[tuple]]:
+    """
+    Worker: hashes every row of a chunk and expands only those whose hash differs
+    from the manifest. Returns (all row keys, [(row_key, row_hash, examples)]).
+    """
+    chunk, known_hashes, val_fraction, templates_path = args
+    changed = []
+    for row_key, row in chunk:
+        digest = row_hash(row)
+        if known_hashes.get(row_key) != digest:
+            changed.append((row_key, digest, row))
+    if not changed:
+        return [row_key for row_key, _ in chunk], []
+    expanded = expand_rows([(row_key, row) for row_key, _, row in changed], _templates(templates_path), val_fraction)
+    return ([row_key for row_key, _ in chunk],
+            [(row_key, digest, examples) for (row_key, digest, _), examples in zip(changed, expanded)])
+
+class Manifest:
+    """SQLite store of row hashes and the examples generated from each row."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS rows (row_key TEXT PRIMARY KEY, row_hash TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS examples (
+                row_key TEXT NOT NULL, split TEXT NOT NULL, order_key TEXT NOT NULL, line TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS examples_row ON examples (row_key);
+            CREATE INDEX IF NOT EXISTS examples_order ON examples (split, order_key);
+            CREATE TEMP TABLE seen (row_key TEXT PRIMARY KEY);
+        """)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    def delete_meta(self, key: str):
+        self.conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+        self.conn.commit()
+
+    def reset_if_stale(self, fingerprint: str, full: bool):
+        stored = self.conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+        if full or stored is None or stored[0] != fingerprint:
+            if stored is not None:
+                logger.info("Templates or split settings changed, rebuilding every example")
+            self.conn.execute("DELETE FROM rows")
+            self.conn.execute("DELETE FROM examples")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('config', ?)", (fingerprint,))
+            self.conn.commit()
+
+    def known_hashes(self, row_keys: List[str]) -> Dict[str, str]:
+        hashes = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(row_keys), 500):
+            batch = row_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            hashes.update(self.conn.execute(
+                f"SELECT row_key, row_hash FROM rows WHERE row_key IN ({placeholders})", batch))
+        return hashes
+
+    def apply(self, row_keys: List[str], changed: List[tuple]):
+        self.conn.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((k,) for k in row_keys))
+        for row_key, digest, examples in changed:
+            self.conn.execute("DELETE FROM examples WHERE row_key = ?", (row_key,))
+            self.conn.executemany(
+                "INSERT INTO examples VALUES (?, ?, ?, ?)",
+                ((row_key, split, order_key, line) for split, order_key, line in examples))
+            self.conn.execute("INSERT OR REPLACE INTO rows VALUES (?, ?)", (row_key, digest))
+        self.conn.commit()
+
+    def remove_unseen(self) -> int:
+        """Drops rows (and their examples) that are no longer in the CSV."""
+        removed = self.conn.execute("DELETE FROM rows WHERE row_key NOT IN (SELECT row_key FROM seen)").rowcount
+        self.conn.execute("DELETE FROM examples WHERE row_key NOT IN (SELECT row_key FROM seen)")
+        self.conn.commit()
+        return removed
+
+    def iter_lines(self, split: str) -> Iterator[str]:
+        cursor = self.conn.execute("SELECT line FROM examples WHERE split = ? ORDER BY order_key", (split,))
+        for (line,) in cursor:
+            yield line
+
+    def close(self):
+        self.conn.close()
+
+def write_jsonl(path: str, lines: Iterator[str]) -> int:
+    """Streams lines to a temp file and renames it into place, so readers never see a partial file."""
+    count = 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+class TokenStats:
+    """Running token totals and a length histogram for one output file."""
+
+    def __init__(self):
+        self.examples = 0
+        self.tokens = 0
+        self.max_tokens = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, tokens: int):
+        self.examples += 1
+        self.tokens += tokens
+        self.max_tokens = max(self.max_tokens, tokens)
+        self.histogram[int(np.searchsorted(HISTOGRAM_BOUNDS, tokens))] += 1
+
+    def to_dict(self) -> dict:
+        labels = [f"<={b}" for b in HISTOGRAM_BOUNDS] + [f">{HISTOGRAM_BOUNDS[-1]}"]
+        return {
+            "examples": self.examples,
+            "tokens": self.tokens,
+            "mean_tokens": round(self.tokens / self.examples, 1) if self.examples else 0,
+            "max_tokens": self.max_tokens,
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+    def log(self, name: str):
+        stats = self.to_dict()
+        logger.info(f"{name}: {stats['examples']} examples, {stats['tokens']} tokens "
+                    f"(mean {stats['mean_tokens']}, max {stats['max_tokens']})")
+        peak = max(self.histogram) or 1
+        for label, count in stats["histogram"].items():
+            if count:
+                logger.info(f"  {label:>7} tokens | {'#' * max(1, round(40 * count / peak))} {count}")
+
+def example_tokens(example: dict) -> int:
+    return sum(estimate_tokens(m["content"]) for m in example["messages"])
+
+def write_outputs(manifest: Manifest, exact_dedup: bool, near_dup_threshold: Optional[float]) -> dict:
+    """
+    Streams both files out of the manifest, dropping exact and near-duplicate examples
+    (train first, so validation examples that repeat a training one are dropped too),
+    and collects token statistics on what is kept.
+    """
+    exact = ExactDeduplicator() if exact_dedup else None
+    near = MinHashDeduplicator(threshold=near_dup_threshold) if near_dup_threshold else None
+    removed = {"exact": 0, "near": 0}
+    report = {}
+
+    for split, path in (('train', OUTPUT_TRAIN), ('val', OUTPUT_VAL)):
+        stats = TokenStats()
+
+        def kept_lines():
+            for line in manifest.iter_lines(split):
+                example = json.loads(line)
+                text = "\n".join(m["content"] for m in example["messages"])
+                if exact is not None and exact.is_duplicate(text):
+                    removed["exact"] += 1
+                    continue
+                if near is not None and near.is_duplicate(text):
+                    removed["near"] += 1
+                    continue
+                stats.add(example_tokens(example))
+                yield line
+
+        write_jsonl(path, kept_lines())
+        stats.log(os.path.basename(path))
+        report[split] = stats.to_dict()
+
+    report["duplicates_removed"] = removed
+    logger.info(f"Removed {removed['exact']} exact and {removed['near']} near-duplicate examples")
+    return report
+
+def estimate_training(report: dict, epochs: float, tokens_per_step: Optional[int], price_per_mtok: Optional[float]):
+    """Training tokens for `epochs`, and optionally steps and cost (rates depend on the model/plan)."""
+    train_tokens = report["train"]["tokens"]
+    total = train_tokens * epochs
+    estimate = {"epochs": epochs, "training_tokens": total}
+    message = f"{epochs:g} epoch(s) over {train_tokens} training tokens = {total:.0f} tokens"
+    if tokens_per_step:
+        estimate["training_steps"] = -(-int(total) // tokens_per_step)
+        message += f", ~{estimate['training_steps']} steps at {tokens_per_step} tokens/step"
+    if price_per_mtok is not None:
+        estimate["cost"] = round(total / 1_000_000 * price_per_mtok, 2)
+        message += f", ~${estimate['cost']} at ${price_per_mtok}/M tokens"
+    logger.info(message)
+    report["estimate"] = estimate
+
+def _run_chunks(chunks: Iterator[list], manifest: Manifest, val_fraction: float, workers: int,
+                templates_path: str) -> Tuple[int, int]:
+    total_rows = changed_rows = 0
+
+    def handle(result):
+        nonlocal total_rows, changed_rows
+        row_keys, changed = result
+        manifest.apply(row_keys, changed)
+        total_rows += len(row_keys)
+        changed_rows += len(changed)
+
+    def tasks():
+        for chunk in chunks:
+            yield chunk, manifest.known_hashes([k for k, _ in chunk]), val_fraction, templates_path
+
+    if workers <= 1:
+        for task in tasks():
+            handle(process_chunk(task))
+        return total_rows, changed_rows
+
+    # At most 2 chunks per worker in flight, so a huge CSV is never read ahead into memory
+    with Pool(workers) as pool:
+        pending = deque()
+        for task in tasks():
+            pending.append(pool.apply_async(process_chunk, (task,)))
+            if len(pending) >= workers * 2:
+                handle(pending.popleft().get())
+        while pending:
+            handle(pending.popleft().get())
+    return total_rows, changed_rows
+
+def prepare_data(csv_path=CSV_FILE, val_fraction=VAL_FRACTION, chunk_size=CHUNK_SIZE, workers=1,
+                 full=False, manifest_path: Optional[str] = MANIFEST_FILE, templates_path: Optional[str] = None,
+                 exact_dedup=True, near_dup_threshold: Optional[float] = NEAR_DUP_THRESHOLD,
+                 epochs=1.0, tokens_per_step=None, price_per_mtok=None, stats_file=None):
+    logger.info(f"Reading data from {csv_path}...")
+    if not os.path.exists(csv_path):
+        logger.error(f"File not found: {csv_path}")
         return
 
-    # Shuffle and split
-    random.shuffle(data_entries)
-    split_index = int(len(data_entries) * 0.9) # 90% train, 10% val
-    train_data = data_entries[:split_index]
-    val_data = data_entries[split_index:]
-    
-    logger.info(f"Generated {len(data_entries)} total examples.")
-    logger.info(f"Writing {len(train_data)} to {OUTPUT_TRAIN}")
-    logger.info(f"Writing {len(val_data)} to {OUTPUT_VAL}")
-    
-    with open(OUTPUT_TRAIN, 'w', encoding='utf-8') as f:
-        for entry in train_data:
-            f.write(json.dumps(entry) + '\n')
-            
-    with open(OUTPUT_VAL, 'w', encoding='utf-8') as f:
-        for entry in val_data:
-            f.write(json.dumps(entry) + '\n')
+    templates_path = os.path.abspath(templates_path or settings.PROPERTY_TEMPLATES_FILE)
+    templates = _templates(templates_path)
+    templates.validate(read_header(csv_path))
+
+    manifest = Manifest(manifest_path)
+    try:
+        manifest.reset_if_stale(_sha256(f"{templates.fingerprint()}:{val_fraction}"), full)
+        # Marks the output files stale until both are rewritten: row hashes are committed chunk by
+        # chunk, so a run that dies before the files are written must not look up to date next time
+        manifest.delete_meta('output')
+        total_rows, changed_rows = _run_chunks(
+            iter_chunks(iter_rows(csv_path), chunk_size), manifest, val_fraction, workers, templates_path)
+        removed_rows = manifest.remove_unseen()
+        logger.info(f"{total_rows} rows read: {changed_rows} new or changed, {removed_rows} removed")
+
+        # Dedup settings decide the file contents too
+        output_config = _sha256(f"{exact_dedup}:{near_dup_threshold}")
+        outputs_exist = os.path.exists(OUTPUT_TRAIN) and os.path.exists(OUTPUT_VAL)
+        if (not changed_rows and not removed_rows and outputs_exist
+                and manifest.get_meta('output') == output_config):
+            logger.info("No changes, training files left untouched")
+            return
+
+        report = write_outputs(manifest, exact_dedup, near_dup_threshold)
+        manifest.set_meta('output', output_config)
+        estimate_training(report, epochs, tokens_per_step, price_per_mtok)
+        logger.info(f"Generated {report['train']['examples'] + report['val']['examples']} total examples.")
+        logger.info(f"Wrote {report['train']['examples']} to {OUTPUT_TRAIN}")
+        logger.info(f"Wrote {report['val']['examples']} to {OUTPUT_VAL}")
+        if stats_file:
+            with open(stats_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        manifest.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate fine-tuning JSONL files from the property CSV")
+    parser.add_argument("--csv", default=CSV_FILE)
+    parser.add_argument("--templates", default=settings.PROPERTY_TEMPLATES_FILE,
+                        help="Template file (JSON, or YAML with PyYAML installed)")
+    parser.add_argument("--val-fraction", type=float, default=VAL_FRACTION)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows per worker task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes expanding changed rows (1 = no multiprocessing)")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and regenerate every row")
+    parser.add_argument("--no-dedup", action="store_true", help="Keep exact duplicates")
+    parser.add_argument("--near-dup-threshold", type=float, default=NEAR_DUP_THRESHOLD,
+                        help="MinHash similarity for near-duplicates (0 disables)")
+    parser.add_argument("--epochs", type=float, default=1.0, help="Epochs for the token/cost estimate")
+    parser.add_argument("--tokens-per-step", type=int, help="Tokens per training step, to estimate steps")
+    parser.add_argument("--price-per-mtok", type=float, help="Training price per million tokens, to estimate cost")
+    parser.add_argument("--stats-file", help="Also write token statistics and estimates as JSON")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    prepare_data()
+    args = parse_args()
+    prepare_data(args.csv, args.val_fraction, args.chunk_size, args.workers, args.full,
+                 templates_path=args.templates, exact_dedup=not args.no_dedup,
+                 near_dup_threshold=args.near_dup_threshold or None, epochs=args.epochs,
+                 tokens_per_step=args.tokens_per_step, price_per_mtok=args.price_per_mtok,
+                 stats_file=args.stats_file)
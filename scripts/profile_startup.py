@@ -0,0 +1,105 @@
+"""
+Measures the cold start of main:app and fails if it exceeds a budget.
+
+Each run starts a fresh interpreter (as a new container or worker would), imports main
+and runs the application lifespan startup, reporting the interpreter start, the import
+of main and the startup itself. The median over --runs is compared with --budget-ms and
+the script exits with status 1 if it is over, so it can gate CI or an image build:
+
+    python scripts/profile_startup.py --runs 5 --budget-ms 1500
+
+--imports also prints the slowest modules from `python -X importtime -c "import main"`,
+the first place to look when the budget starts failing.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints the phase timings as JSON on the last line
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure_once() -> Dict[str, float]:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+    )
+    total_ms = (time.perf_counter() - started) * 1000
+    phases = json.loads(proc.stdout.strip().splitlines()[-1])
+    # Interpreter start-up plus shutdown: whatever the process took beyond the measured phases
+    phases["interpreter_ms"] = total_ms - phases["import_ms"] - phases["startup_ms"]
+    phases["total_ms"] = total_ms
+    return phases
+
+
+def slowest_imports(top: int) -> List[Tuple[str, float, float]]:
+    """(module, self ms, cumulative ms) of the `top` modules with the largest cumulative import time."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, module = match.groups()
+            rows.append((module, int(self_us) / 1000, int(cumulative_us) / 1000))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:top]
+
+
+def main():
+    args = parse_args()
+    runs = [measure_once() for _ in range(args.runs)]
+    median = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+
+    print(f"Cold start of main:app, median of {args.runs} run(s):")
+    for phase in ("interpreter_ms", "import_ms", "startup_ms", "total_ms"):
+        print(f"  {phase[:-3]:<12} {median[phase]:8.0f} ms")
+
+    if args.imports:
+        print("\nSlowest imports (python -X importtime -c 'import main'):")
+        print(f"  {'module':<45} {'self ms':>8} {'cumulative ms':>14}")
+        for module, self_ms, cumulative_ms in slowest_imports(args.imports):
+            print(f"  {module:<45} {self_ms:8.1f} {cumulative_ms:14.1f}")
+
+    if median["total_ms"] > args.budget_ms:
+        print(f"\nFAIL: cold start {median['total_ms']:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"\nOK: cold start {median['total_ms']:.0f} ms is within the {args.budget_ms:.0f} ms budget")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the cold start of main:app against a budget")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start; the median is reported")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")),
+                        help="Maximum median cold start (interpreter + import + lifespan startup)")
+    parser.add_argument("--imports", type=int, default=15, metavar="N",
+                        help="Also list the N slowest imports (0 = skip)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
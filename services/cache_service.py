@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from config.settings import settings
+from config.logger import logger
+from core.metrics import CACHE_LOOKUPS, CHROMA_QUERY_SECONDS
+from core.model_alias import resolve_model
+from core.shared_state import shared_cache
+
+# How often lookups re-resolve DEFAULT_MODEL (a stat of the fine-tuned model file) to notice a new model
+_MODEL_CHECK_INTERVAL_SECONDS = 5.0
+
+
+class ResponseCache:
+    """
+    Two-tier cache in front of MistralService.
+
+    Exact tier: keyed on a normalized hash of (model, messages, temperature), with a TTL.
+    Lives in the node's shared cache when SHARED_STATE_DIR is set, so an answer cached by
+    one worker is a hit in all of them (and invalidation reaches all of them); otherwise
+    an in-process LRU bounded by RESPONSE_CACHE_MAX_ENTRIES.
+    Semantic tier (optional): nearest-neighbour lookup of single-question conversations in
+    the ChromaDB response cache collection, accepted above SEMANTIC_CACHE_THRESHOLD.
+    """
+
+    NAMESPACE = "responses"
+
+    def __init__(self):
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = settings.RESPONSE_CACHE_TTL_SECONDS
+        self.semantic_enabled = settings.SEMANTIC_CACHE_ENABLED
+        self.semantic_threshold = settings.SEMANTIC_CACHE_THRESHOLD
+
+        # key -> (model, response, stored_at); used when there is no shared cache
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._shared = shared_cache()
+        self._default_model = resolve_model()
+        self._model_checked_at = time.monotonic()
+        self._background_tasks = set()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], temperature: Optional[float]) -> str:
+        """Hashes the request after collapsing whitespace and case in message content."""
+        normalized = [
+            [m["role"], " ".join(m["content"].split()).casefold()]
+            for m in messages
+        ]
+        payload = json.dumps([model, normalized, temperature], separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Exact-tier lookup. Expired entries count as misses."""
+        if not self.enabled:
+            return None
+        self._check_default_model()
+
+        if self._shared is not None:
+            # SQLite may wait on another worker's write lock, so off the event loop
+            entry = await asyncio.to_thread(self._shared.get, self.NAMESPACE, key)
+            # Wall-clock age: the entry may have been written by another process
+            if entry is None or time.time() - entry[2] > self.ttl:
+                return None
+            response = entry[0].decode("utf-8")
+        else:
+            response = self._get_local(key)
+            if response is None:
+                return None
+
+        self.stats["exact_hits"] += 1
+        CACHE_LOOKUPS.inc(tier="exact", result="hit")
+        return response
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        model, response, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return response
+
+    def set(self, key: str, model: str, response: str):
+        if not self.enabled:
+            return
+        if self._shared is not None:
+            # The SQLite write (and any eviction) runs off the event loop
+            self._in_background(asyncio.to_thread(
+                self._shared.set, self.NAMESPACE, key, response.encode("utf-8"), model
+            ))
+            return
+        self._entries[key] = (model, response, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def record_miss(self):
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.inc(tier="all", result="miss")
+
+    async def get_semantic(self, model: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Semantic-tier lookup. Only single-question conversations are eligible, since
+        an answer that depended on earlier turns can't be reused for a new conversation.
+        """
+        query = self._semantic_query(messages)
+        if query is None:
+            return None
+
+        try:
+            chroma = self._chroma()
+            with CHROMA_QUERY_SECONDS.time(operation="semantic_cache"):
+                match = await asyncio.to_thread(chroma.find_cached_response, query, model)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed, disabling semantic tier: {e}")
+            self.semantic_enabled = False
+            return None
+
+        if match is None:
+            return None
+        response, similarity, created_at = match
+        if similarity < self.semantic_threshold or time.time() - created_at > self.ttl:
+            return None
+
+        self.stats["semantic_hits"] += 1
+        CACHE_LOOKUPS.inc(tier="semantic", result="hit")
+        logger.info(f"Semantic cache hit (similarity: {similarity:.3f}, model: {model})")
+        return response
+
+    def set_semantic(self, key: str, model: str, messages: List[Dict[str, str]], response: str):
+        """Stores the answer in the semantic tier in the background, off the request path."""
+        query = self._semantic_query(messages)
+        if query is None:
+            return
+
+        async def _store():
+            try:
+                chroma = self._chroma()
+                await asyncio.to_thread(chroma.store_cached_response, key, query, response, model, time.time())
+            except Exception as e:
+                logger.warning(f"Failed to store semantic cache entry: {e}")
+
+        self._in_background(_store())
+
+    def _in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def invalidate_model(self, model: str):
+        """Drops every cached answer produced by `model` from both tiers. The SQLite and Chroma deletes run in a worker thread."""
+        stale = [key for key, (entry_model, _, _) in self._entries.items() if entry_model == model]
+        for key in stale:
+            del self._entries[key]
+        dropped = len(stale)
+        if self._shared is not None:
+            dropped += await asyncio.to_thread(self._shared.delete_tag, self.NAMESPACE, model)
+        self.stats["invalidations"] += 1
+        logger.info(f"Invalidated {dropped} cached responses for model {model}")
+
+        if self.semantic_enabled:
+            try:
+                await asyncio.to_thread(self._chroma().delete_cached_responses, model)
+            except Exception as e:
+                logger.warning(f"Failed to invalidate semantic cache for model {model}: {e}")
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return {
+            **self.stats,
+            "entries": self._shared.count(self.NAMESPACE) if self._shared is not None else len(self._entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def _check_default_model(self):
+        # A new fine-tuned DEFAULT_MODEL (set directly or via the alias) makes answers from the previous one stale.
+        # Checked every few seconds rather than per lookup; the invalidation runs as a background task.
+        now = time.monotonic()
+        if now - self._model_checked_at < _MODEL_CHECK_INTERVAL_SECONDS:
+            return
+        self._model_checked_at = now
+        current = resolve_model()
+        if current != self._default_model:
+            previous, self._default_model = self._default_model, current
+            logger.info(f"DEFAULT_MODEL changed from {previous} to {self._default_model}")
+            self._in_background(self.invalidate_model(previous))
+
+    def _semantic_query(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        if not (self.enabled and self.semantic_enabled):
+            return None
+        user_messages = [m for m in messages if m["role"] == "user"]
+        if len(user_messages) != 1 or any(m["role"] == "assistant" for m in messages):
+            return None
+        return " ".join(user_messages[0]["content"].split())
+
+    @staticmethod
+    def _chroma():
+        # Imported lazily: the Chroma client connects on import and is only needed for this tier
+        from config.chroma import chromadb_client
+        return chromadb_client
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+from config.logger import logger
+from core.metrics import CHROMA_QUERY_SECONDS
+from services.property_index import property_index, ID_PATTERN, NAME_PATTERN
+
+SYSTEM_PROMPT = (
+    "You are a helpful real estate assistant for the Nova Estatem property catalogue. "
+    "Answer using the reference data below when it is relevant; if the data does not "
+    "cover the question, say so instead of guessing."
+)
+
+_PRICE_MAX_RE = re.compile(r"(?:under|below|less than|up to|max(?:imum)?|cheaper than)\s*\$?\s*([\d,.]+)\s*(k|m)?\b", re.IGNORECASE)
+_PRICE_MIN_RE = re.compile(r"(?:over|above|more than|at least|min(?:imum)?)\s*\$?\s*([\d,.]+)\s*(k|m)?\b", re.IGNORECASE)
+_BEDROOMS_RE = re.compile(r"(\d+)\s*(?:\+\s*)?(?:bed|bedroom|br)s?\b", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for Mistral's tokenizer on English)."""
+    return max(1, len(text) // 4)
+
+
+def history_id(question: str, answer: str) -> str:
+    """Content-hash id for a stored Q/A pair, so asking the same thing again doesn't add a copy."""
+    normalized = [" ".join(question.split()).casefold(), " ".join(answer.split())]
+    return hashlib.sha256("\x00".join(normalized).encode("utf-8")).hexdigest()
+
+
+def format_property_record(record: Dict) -> str:
+    return (f"{record['Property_ID']} | {record['Property_Name']} | {record['Property_Type']} | "
+            f"{record['Location']} | {record['Bedrooms']} bd / {record['Bathrooms']} ba | "
+            f"{record['Size_sqft']} sqft | ${record['Price_USD']} | built {record['Year_Built']} | "
+            f"{record['Status']}")
+
+
+def _parse_amount(number: str, suffix: Optional[str]) -> Optional[float]:
+    try:
+        value = float(number.replace(",", ""))
+    except ValueError:
+        return None
+    multiplier = {"k": 1_000, "m": 1_000_000}.get((suffix or "").lower(), 1)
+    return value * multiplier
+
+
+class ContextAssembler:
+    """
+    Builds the message list sent to Mistral: retrieves property records and prior answers
+    for the latest question, deduplicates them into one system message capped at
+    CONTEXT_MAX_TOKENS, and keeps as much recent history as fits in CONTEXT_TOKEN_BUDGET.
+    Older turns that don't fit are folded into a short extractive summary.
+    """
+
+    def __init__(self):
+        self.enabled = settings.CONTEXT_RETRIEVAL_ENABLED
+        self.token_budget = settings.CONTEXT_TOKEN_BUDGET
+        self.context_tokens = settings.CONTEXT_MAX_TOKENS
+        self.top_k = settings.CONTEXT_TOP_K
+        self._vector_store_available = True
+
+    async def assemble(self, messages: List[Dict[str, str]], history_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        history_tokens: precomputed token total of `messages` (e.g. a session's rolling count);
+        when the whole history fits, per-message counting is skipped.
+        """
+        if not self.enabled or not messages or messages[-1]["role"] != "user":
+            return messages
+
+        query = messages[-1]["content"]
+        records, answers = await asyncio.gather(
+            self._retrieve_properties(query),
+            self._retrieve_prior_answers(query),
+        )
+
+        client_system = [m["content"] for m in messages if m["role"] == "system"]
+        system_content = self._build_system_message(client_system, records, answers)
+        conversation = [m for m in messages if m["role"] != "system"]
+        if history_tokens is not None and estimate_tokens(system_content) + history_tokens <= self.token_budget:
+            return [{"role": "system", "content": system_content}] + conversation
+        return self._fit_history(system_content, conversation)
+
+    def remember(self, question: str, answer: str):
+        """Stores a finished Q/A pair so later questions can retrieve it (buffered write)."""
+        if not self.enabled:
+            return
+        chroma = self._chroma()
+        if chroma is None:
+            return
+        try:
+            chroma.store_message_vector(history_id(question, answer), question, answer)
+        except Exception as e:
+            logger.warning(f"Failed to store answer for retrieval: {e}")
+
+    def _build_system_message(self, client_system: List[str], records: List[str], answers: List[str]) -> str:
+        parts = [SYSTEM_PROMPT] + client_system
+        used = sum(estimate_tokens(p) for p in parts)
+        budget = used + self.context_tokens
+
+        seen = set()
+        sections = [("Property records:", records), ("Previously answered questions:", answers)]
+        for title, snippets in sections:
+            lines = []
+            for snippet in snippets:
+                key = " ".join(snippet.split()).casefold()
+                if key in seen:
+                    continue
+                cost = estimate_tokens(snippet)
+                if used + cost > budget:
+                    break
+                seen.add(key)
+                lines.append(f"- {snippet}")
+                used += cost
+            if lines:
+                parts.append(title + "\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+
+    def _fit_history(self, system_content: str, conversation: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        remaining = self.token_budget - estimate_tokens(system_content)
+
+        # The latest user turn is always kept, then history newest-first while it fits
+        kept = [conversation[-1]]
+        remaining -= estimate_tokens(conversation[-1]["content"])
+        cutoff = len(conversation) - 1
+        for i in range(len(conversation) - 2, -1, -1):
+            cost = estimate_tokens(conversation[i]["content"])
+            if cost > remaining:
+                break
+            kept.append(conversation[i])
+            remaining -= cost
+            cutoff = i
+        kept.reverse()
+
+        dropped = conversation[:cutoff]
+        if dropped:
+            summary = self._summarize(dropped, max(remaining, 0))
+            if summary:
+                system_content += "\n\nEarlier in this conversation the user asked:\n" + summary
+            logger.info(f"Truncated {len(dropped)} older turns to fit the {self.token_budget} token budget")
+
+        # Mistral expects the conversation after the system message to start with a user turn
+        while kept and kept[0]["role"] == "assistant":
+            kept.pop(0)
+        return [{"role": "system", "content": system_content}] + kept
+
+    @staticmethod
+    def _summarize(turns: List[Dict[str, str]], budget: int) -> str:
+        """First sentence of each dropped user question, most recent first, within budget."""
+        lines = []
+        for turn in reversed(turns):
+            if turn["role"] != "user":
+                continue
+            sentence = re.split(r"(?<=[.?!])\s", turn["content"].strip(), maxsplit=1)[0][:200]
+            cost = estimate_tokens(sentence)
+            if cost > budget:
+                break
+            lines.append(f"- {sentence}")
+            budget -= cost
+        return "\n".join(reversed(lines))
+
+    async def _retrieve_properties(self, query: str) -> List[str]:
+        """Records named in the question first, then rows matching filters it mentions."""
+        try:
+            property_index.load()
+            rows = []
+            for pid in ID_PATTERN.findall(query):
+                rows.append(property_index.find_row(property_id=pid))
+            for name in NAME_PATTERN.findall(query):
+                rows.append(property_index.find_row(name=name))
+            rows = [r for r in rows if r is not None]
+
+            filters = self._extract_filters(query)
+            if filters:
+                equals, ranges = filters
+                _, found = property_index.search(equals=equals, ranges=ranges, sort_by="price", limit=self.top_k)
+                rows.extend(found.tolist())
+
+            records = [format_property_record(r) for r in property_index.records(list(dict.fromkeys(rows)))]
+        except Exception as e:
+            logger.warning(f"Property retrieval failed: {e}")
+            records = []
+
+        chroma = self._chroma()
+        if chroma is not None:
+            try:
+                with CHROMA_QUERY_SECONDS.time(operation="metadata"):
+                    records += await asyncio.to_thread(chroma.retrieve_similar_metadata, query, self.top_k)
+            except Exception as e:
+                logger.warning(f"Metadata retrieval failed: {e}")
+        return records
+
+    async def _retrieve_prior_answers(self, query: str) -> List[str]:
+        chroma = self._chroma()
+        if chroma is None:
+            return []
+        try:
+            with CHROMA_QUERY_SECONDS.time(operation="history"):
+                documents = await asyncio.to_thread(chroma.retrieve_similar_messages, query, self.top_k)
+        except Exception as e:
+            logger.warning(f"History retrieval failed: {e}")
+            return []
+        return [d.replace("Content: ", "Q: ", 1).replace("\nAnalysis: ", " A: ", 1) for d in documents]
+
+    @staticmethod
+    def _extract_filters(query: str) -> Optional[Tuple[Dict[str, str], Dict[str, tuple]]]:
+        """Maps locations, types, statuses, price bounds and bedrooms in free text to index filters."""
+        lowered = query.casefold()
+        equals = {}
+        for col in ("Location", "Property_Type", "Status"):
+            # Longest key first so "new york" wins over "york"
+            for key in sorted(property_index.postings.get(col, {}), key=len, reverse=True):
+                if "," not in key and re.search(rf"\b{re.escape(key)}", lowered):
+                    equals[col] = key
+                    break
+
+        ranges = {}
+        price_max = _PRICE_MAX_RE.search(query)
+        price_min = _PRICE_MIN_RE.search(query)
+        low = _parse_amount(*price_min.groups()) if price_min else None
+        high = _parse_amount(*price_max.groups()) if price_max else None
+        if low is not None or high is not None:
+            ranges["price"] = (low, high)
+        bedrooms = _BEDROOMS_RE.search(query)
+        if bedrooms:
+            ranges["bedrooms"] = (int(bedrooms.group(1)), None)
+
+        if not equals and not ranges:
+            return None
+        return equals, ranges
+
+    def _chroma(self):
+        # Imported lazily so the chat path still works when no vector store is reachable
+        if not self._vector_store_available:
+            return None
+        try:
+            from config.chroma import chromadb_client
+            return chromadb_client
+        except Exception as e:
+            logger.warning(f"Vector store unavailable, retrieval limited to the property index: {e}")
+            self._vector_store_available = False
+            return None
+
+
+context_assembler = ContextAssembler()
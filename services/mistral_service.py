@@ -1,34 +1,345 @@
-from mistralai import Mistral
+import asyncio
+import threading
+import time
 from config.settings import settings
-from config.logger import logger
-from typing import List, Dict
+from config.logger import get_logger
+from services.cache_service import response_cache
+from services.singleflight import SingleFlight
+from services.scheduler import UpstreamScheduler, estimate_request_tokens
+from services.model_router import (
+    ModelRouter, UpstreamError, NON_RETRYABLE_STATUS, counts_as_failure, failure_reason, route_error,
+)
+from core.upstream_errors import error_status
+from core.model_alias import resolve_model
+from core.metrics import MISTRAL_REQUEST_SECONDS, MISTRAL_TTFT_SECONDS, MISTRAL_IN_FLIGHT, MISTRAL_TOKENS, MISTRAL_RETRIES
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Dict, Optional
+
+logger = get_logger("mistral")
+
+@dataclass
+class ChatResult:
+    """Completion text plus where it came from and the upstream token usage."""
+    content: str
+    model: str
+    source: str = "llm"  # "llm" or "cache"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+def _record_tokens(model: str, prompt_tokens: int, completion_tokens: int):
+    if prompt_tokens:
+        MISTRAL_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+    if completion_tokens:
+        MISTRAL_TOKENS.inc(completion_tokens, model=model, type="completion")
 
 class MistralService:
     def __init__(self):
         self.api_key = settings.MISTRAL_API_KEY
         if not self.api_key:
             logger.warning("MISTRAL_API_KEY is not set.")
-        self.client = Mistral(api_key=self.api_key)
 
-    async def chat_completion(self, messages: List[Dict[str, str]], model: str = None) -> str:
+        # Created on first use (see `client`), so importing this module stays cheap
+        self.http_client = None
+        self._client = None
+        # The first access can come from the warm-up thread and a request at the same time
+        self._client_lock = threading.Lock()
+
+        # Caps in-flight upstream calls for this worker and keeps them within the key's RPS/TPM quotas,
+        # serving interactive calls before batch ones
+        self.scheduler = UpstreamScheduler(
+            settings.MISTRAL_MAX_CONCURRENCY, settings.MISTRAL_RPS_LIMIT, settings.MISTRAL_TPM_LIMIT
+        )
+        self.timeout = settings.MISTRAL_TIMEOUT_SECONDS
+
+        # Identical concurrent requests share one upstream call
+        self.inflight = SingleFlight()
+
+        # Fallback models, hedging and circuit breaking; no hedges while calls are queueing
+        self.router = ModelRouter(can_hedge=self.scheduler.has_capacity)
+
+    @property
+    def client(self):
+        """The Mistral SDK client; the SDK is imported and the client built on first access."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    def _build_client(self):
+        import httpx
+        from mistralai import Mistral
+
+        # One pooled async HTTP client shared by every request so upstream calls
+        # reuse keep-alive connections instead of paying a TLS handshake each time.
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.MISTRAL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.MISTRAL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.MISTRAL_KEEPALIVE_EXPIRY,
+            ),
+            timeout=settings.MISTRAL_TIMEOUT_SECONDS,
+        )
+        return Mistral(
+            api_key=self.api_key,
+            async_client=self.http_client,
+            server_url=settings.MISTRAL_SERVER_URL or None,
+        )
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        cache_messages: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
         """
         Send a chat request to Mistral API.
         messages: List of {"role": "...", "content": "..."}
+        timeout: Per-request deadline in seconds (queueing + upstream calls, fallbacks included).
+        cache_messages: the conversation as the client sent it, when `messages` is an assembled
+        prompt. The cache is keyed on it, since retrieved context (which includes earlier
+        answers) changes from one request to the next. Defaults to `messages`.
+        Raises UpstreamError when no model in the route could answer.
         """
-        model_to_use = model or settings.DEFAULT_MODEL
-        logger.info(f"Sending request to Mistral API (model: {model_to_use})")
-        
+        result = await self.chat_completion_result(messages, model, temperature, timeout, cache_messages)
+        return result.content
+
+    async def chat_completion_result(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        cache_messages: Optional[List[Dict[str, str]]] = None,
+    ) -> ChatResult:
+        """Same as chat_completion, but returns a ChatResult with source and token usage."""
+        models = self.router.route(model)
+        timeout = timeout or self.timeout
+        cache_messages = cache_messages or messages
+
+        cache_key = response_cache.make_key(models[0], cache_messages, temperature)
+        cached = await response_cache.get(cache_key)
+        if cached is None:
+            cached = await response_cache.get_semantic(models[0], cache_messages)
+        if cached is not None:
+            return ChatResult(content=cached, model=models[0], source="cache")
+        response_cache.record_miss()
+
         try:
-            # Mistral client typically synchronous, but we can wrap or use async client if available.
-            # For simplicity in this step, we use the sync client call (fastapi handles it in threadpool).
-            chat_response = self.client.chat.complete(
-                model=model_to_use,
-                messages=messages
+            return await self.inflight.do(
+                cache_key,
+                lambda: self._fetch(cache_key, models, messages, cache_messages, temperature, timeout),
             )
-            logger.info("Received response from Mistral API")
-            return chat_response.choices[0].message.content
+        except UpstreamError as e:
+            if e.status_code != 429:  # sheds are already logged by the scheduler
+                logger.error(f"Mistral API request failed (route: {', '.join(models)}): {e}")
+            raise
         except Exception as e:
+            # Errors that no fallback can fix, e.g. a 400 for an invalid request
             logger.error(f"Error calling Mistral API: {e}", exc_info=True)
-            return "Sorry, I encountered an error while processing your request."
+            raise UpstreamError(f"Upstream request failed: {e}") from e
+
+    async def chat_completion_uncached(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> ChatResult:
+        """
+        One upstream round trip with no caching, coalescing or error handling: upstream
+        errors (e.g. SDKError with status_code 429) and timeouts are raised to the caller.
+        Used by batch jobs that want to retry on their own terms.
+        """
+        model = resolve_model(model)
+        timeout = timeout or self.timeout
+        logger.info("Sending request to Mistral API (model: %s)", model)
+        with MISTRAL_REQUEST_SECONDS.time(model=model, mode="complete", outcome="error") as labels:
+            try:
+                chat_response = await asyncio.wait_for(
+                    self._complete(model, messages, temperature, timeout),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError:
+                labels["outcome"] = "timeout"
+                raise
+            labels["outcome"] = "ok"
+        logger.info("Received response from Mistral API")
+        usage = chat_response.usage
+        result = ChatResult(
+            content=chat_response.choices[0].message.content,
+            model=model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+        )
+        _record_tokens(model, result.prompt_tokens, result.completion_tokens)
+        return result
+
+    async def _fetch(
+        self,
+        cache_key: str,
+        models: List[str],
+        messages: List[Dict[str, str]],
+        cache_messages: List[Dict[str, str]],
+        temperature: Optional[float],
+        timeout: float,
+    ) -> ChatResult:
+        """Routed upstream call shared by all coalesced callers; fills the cache."""
+        result = await self.router.call(
+            models,
+            lambda model, remaining: self.chat_completion_uncached(messages, model, temperature, remaining),
+            timeout,
+        )
+        # A fallback model's answer is not cached under the requested model's key
+        if result.model == models[0]:
+            response_cache.set(cache_key, result.model, result.content)
+            response_cache.set_semantic(cache_key, result.model, cache_messages, result.content)
+        return result
+
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        usage: Optional[Dict[str, int]] = None,
+        cache_messages: Optional[List[Dict[str, str]]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat response from Mistral API, yielding content deltas as they arrive.
+        Until the first token arrives a failing model falls through to the next one in the
+        route (streams are not hedged); later errors are raised to the caller so it can
+        report them on the stream.
+        usage: optional dict filled with prompt_tokens/completion_tokens from the final event,
+        and "model" with the model that answered.
+        cache_messages: as for chat_completion.
+        """
+        models = self.router.route(model)
+        timeout = timeout or self.timeout
+        usage = usage if usage is not None else {}
+
+        # Exact-tier hits are replayed as a single chunk
+        cache_key = response_cache.make_key(models[0], cache_messages or messages, temperature)
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        response_cache.record_miss()
+
+        deadline = time.monotonic() + timeout
+        last_error = None
+        attempted = 0
+        for model_to_use in models:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            health = self.router.health_of(model_to_use)
+            if not health.allow():
+                continue
+            attempted += 1
+            parts = []
+            upstream = self._stream(model_to_use, messages, temperature, remaining, usage)
+            try:
+                async for content in upstream:
+                    parts.append(content)
+                    yield content
+            except (asyncio.CancelledError, GeneratorExit):
+                # Client went away: release the upstream stream and its concurrency slot now
+                health.abandon()
+                raise
+            except Exception as e:
+                if counts_as_failure(e):
+                    health.record_failure()
+                else:
+                    health.abandon()
+                if parts or isinstance(e, UpstreamError) or error_status(e) in NON_RETRYABLE_STATUS:
+                    raise
+                last_error = e
+                MISTRAL_RETRIES.inc(model=model_to_use, reason=failure_reason(e))
+                logger.warning(f"Model {model_to_use} failed ({failure_reason(e)}), trying next in route")
+                continue
+            finally:
+                await upstream.aclose()
+            health.record_success()
+            usage["model"] = model_to_use
+            if model_to_use == models[0]:
+                response_cache.set(cache_key, model_to_use, "".join(parts))
+            return
+
+        raise route_error(models, attempted, last_error, timeout) from last_error
+
+    async def _stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float],
+        timeout: float,
+        usage: Dict[str, int],
+    ) -> AsyncIterator[str]:
+        """One streaming upstream call."""
+        logger.info("Streaming request to Mistral API (model: %s)", model)
+        first = True
+
+        # The concurrency slot is held for the whole stream, not just the first byte
+        async with self.scheduler.slot(estimate_request_tokens(messages), timeout, self._expected_latency(model)) as ticket:
+            with MISTRAL_IN_FLIGHT.track(), \
+                    MISTRAL_REQUEST_SECONDS.time(model=model, mode="stream", outcome="error") as labels:
+                started = time.perf_counter()
+                stream = await self.client.chat.stream_async(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout_ms=int(timeout * 1000),
+                )
+                async with stream as events:
+                    async for event in events:
+                        if event.data.usage:
+                            usage["prompt_tokens"] = event.data.usage.prompt_tokens
+                            usage["completion_tokens"] = event.data.usage.completion_tokens
+                        if not event.data.choices:
+                            continue
+                        content = event.data.choices[0].delta.content
+                        if content:
+                            if first:
+                                MISTRAL_TTFT_SECONDS.observe(time.perf_counter() - started, model=model)
+                                first = False
+                            yield content
+                labels["outcome"] = "ok"
+            if usage.get("completion_tokens"):
+                ticket.tokens = usage.get("prompt_tokens", 0) + usage["completion_tokens"]
+        logger.info("Finished streaming response from Mistral API")
+        _record_tokens(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+    async def _complete(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float],
+        timeout: float,
+    ):
+        """Waits for the scheduler to admit the call, then calls the async SDK endpoint."""
+        async with self.scheduler.slot(estimate_request_tokens(messages), timeout, self._expected_latency(model)) as ticket:
+            with MISTRAL_IN_FLIGHT.track():
+                response = await self.client.chat.complete_async(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout_ms=int(timeout * 1000),
+                )
+            if response.usage:
+                ticket.tokens = response.usage.total_tokens
+            return response
+
+    def _expected_latency(self, model: str) -> float:
+        return self.router.health_of(model).latency_ewma or 0.0
+
+    async def close(self):
+        """Closes the pooled HTTP client, if one was created. Called on application shutdown."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+            self._client = None
 
 mistral_service = MistralService()
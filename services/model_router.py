@@ -0,0 +1,254 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config.settings import settings
+from config.logger import get_logger
+from core.model_alias import resolve_model
+from core.metrics import MISTRAL_RETRIES, MISTRAL_HEDGES, MISTRAL_CIRCUIT_OPEN
+from core.upstream_errors import error_status, retry_after_seconds
+
+logger = get_logger("mistral")
+
+# Client errors that would fail the same way on every model: no point falling through
+NON_RETRYABLE_STATUS = {400, 401, 403, 413, 422}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class UpstreamError(Exception):
+    """Every model in the route failed (or was skipped). status_code is what the API should answer."""
+
+    def __init__(self, message: str, status_code: int = 502, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class OverloadedError(UpstreamError):
+    """Rate limited: shed by the scheduler, or a 429 from every model. Answered as 429 + Retry-After."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, status_code=429, retry_after=retry_after)
+
+
+def counts_as_failure(error: Exception) -> bool:
+    """Whether an error says something about the model's health (client errors and rate limits don't)."""
+    status = error_status(error)
+    return not isinstance(error, UpstreamError) and status not in NON_RETRYABLE_STATUS and status != 429
+
+
+def failure_reason(error: Exception) -> str:
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return str(error_status(error) or type(error).__name__)
+
+
+def route_error(models: List[str], attempted: int, last_error: Optional[Exception], timeout: float) -> UpstreamError:
+    if not attempted:
+        return UpstreamError(f"All models unavailable (circuit open): {', '.join(models)}", status_code=503)
+    if error_status(last_error) == 429:
+        return OverloadedError(f"Rate limited upstream: {last_error}", retry_after_seconds(last_error) or 1.0)
+    if last_error is None or isinstance(last_error, asyncio.TimeoutError):
+        return UpstreamError(f"Upstream request timed out after {timeout}s", status_code=504)
+    return UpstreamError(f"Upstream request failed: {last_error}")
+
+
+class ModelHealth:
+    """
+    Rolling view of one model: EWMA latency and error rate, a window of recent latencies
+    for the hedging deadline, and a circuit breaker.
+
+    The breaker opens after CIRCUIT_FAILURE_THRESHOLD consecutive failures; once
+    CIRCUIT_RESET_SECONDS have passed a single probe request is let through (half-open),
+    which closes it on success or re-opens it on failure.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.latencies = deque(maxlen=settings.ROUTER_LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= settings.CIRCUIT_RESET_SECONDS:
+            self.state = HALF_OPEN
+            logger.info(f"Circuit for {self.model} half-open, sending a probe request")
+            return True
+        return False
+
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+        alpha = settings.ROUTER_EWMA_ALPHA
+        self.latency_ewma = seconds if self.latency_ewma is None else alpha * seconds + (1 - alpha) * self.latency_ewma
+
+    def record_success(self, seconds: Optional[float] = None):
+        if seconds is not None:
+            self.record_latency(seconds)
+        self.error_ewma *= 1 - settings.ROUTER_EWMA_ALPHA
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            logger.info(f"Circuit for {self.model} closed")
+            self.state = CLOSED
+            MISTRAL_CIRCUIT_OPEN.set(0, model=self.model)
+
+    def record_failure(self):
+        alpha = settings.ROUTER_EWMA_ALPHA
+        self.error_ewma = alpha + (1 - alpha) * self.error_ewma
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= settings.CIRCUIT_FAILURE_THRESHOLD
+        ):
+            logger.warning(f"Circuit for {self.model} opened after {self.consecutive_failures} consecutive failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            MISTRAL_CIRCUIT_OPEN.set(1, model=self.model)
+
+    def abandon(self):
+        """The request was cancelled before an outcome; a half-open probe is handed to the next request."""
+        if self.state == HALF_OPEN:
+            self.state = OPEN
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate_ewma": round(self.error_ewma, 4),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+# call(model, timeout) -> result; one upstream attempt
+Call = Callable[[str, float], Awaitable]
+
+
+class ModelRouter:
+    """
+    Sends a request to the first healthy model of a route, falling through to the next
+    one on failure, within one overall deadline.
+
+    When an attempt runs past the model's recent p95 latency a duplicate (hedged) request
+    is sent to the same model; whichever answers first wins and the other is cancelled.
+    can_hedge() is checked first so hedges are not added when upstream slots are exhausted.
+    """
+
+    def __init__(self, can_hedge: Callable[[], bool] = lambda: True):
+        self.health: Dict[str, ModelHealth] = {}
+        self.can_hedge = can_hedge
+
+    def health_of(self, model: str) -> ModelHealth:
+        health = self.health.get(model)
+        if health is None:
+            health = self.health[model] = ModelHealth(model)
+        return health
+
+    def route(self, model: str = None) -> List[str]:
+        """The requested model followed by MODEL_FALLBACKS, aliases resolved, duplicates dropped."""
+        models = [resolve_model(model)]
+        for fallback in settings.MODEL_FALLBACKS.split(","):
+            fallback = fallback.strip()
+            if fallback and resolve_model(fallback) not in models:
+                models.append(resolve_model(fallback))
+        return models
+
+    async def call(self, models: List[str], call: Call, timeout: float):
+        deadline = time.monotonic() + timeout
+        last_error: Optional[Exception] = None
+        attempted = 0
+        for model in models:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.health_of(model).allow():
+                logger.debug(f"Skipping {model}, circuit open")
+                continue
+            attempted += 1
+            try:
+                return await self._hedged(model, call, remaining)
+            except UpstreamError:
+                # Shed by the scheduler: other models share the same quota
+                raise
+            except Exception as e:
+                status = error_status(e)
+                if status in NON_RETRYABLE_STATUS:
+                    raise
+                last_error = e
+                MISTRAL_RETRIES.inc(model=model, reason=failure_reason(e))
+                logger.warning(f"Model {model} failed ({failure_reason(e)}), trying next in route")
+
+        raise route_error(models, attempted, last_error, timeout) from last_error
+
+    async def _attempt(self, model: str, call: Call, timeout: float):
+        health = self.health_of(model)
+        started = time.monotonic()
+        try:
+            result = await call(model, timeout)
+        except asyncio.CancelledError:
+            # A losing hedge or a client that went away: the elapsed time says nothing about the
+            # model's latency, and a short sample would pull the p95 (and so the hedging deadline) down
+            health.abandon()
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                # Ran out of its deadline: took at least this long
+                health.record_latency(time.monotonic() - started)
+            if counts_as_failure(e):
+                health.record_failure()
+            else:
+                health.abandon()
+            raise
+        health.record_success(time.monotonic() - started)
+        return result
+
+    async def _hedged(self, model: str, call: Call, timeout: float):
+        primary = asyncio.create_task(self._attempt(model, call, timeout))
+        delay = self._hedge_delay(model)
+        if delay is None or delay >= timeout:
+            return await primary
+
+        pending = {primary}
+        hedge = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and self.can_hedge():
+                logger.info(f"Hedging request to {model} after {delay * 1000:.0f}ms")
+                hedge = asyncio.create_task(self._attempt(model, call, timeout - delay))
+                pending.add(hedge)
+            errors = []
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if hedge is not None:
+                            MISTRAL_HEDGES.inc(model=model, winner="hedge" if task is hedge else "primary")
+                        return task.result()
+                    errors.append(task.exception())
+                if not pending:
+                    raise errors[0]
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        if not settings.HEDGE_ENABLED:
+            return None
+        p95 = self.health_of(model).p95()
+        return None if p95 is None else max(p95, settings.HEDGE_MIN_DELAY_SECONDS)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {model: health.snapshot() for model, health in self.health.items()}
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from config.logger import logger
+from core.metrics import MONGO_WRITE_SECONDS, MONGO_WRITES
+
+TRANSCRIPTS_COLLECTION = "chat_transcripts"
+
+
+class MongoWriteQueue:
+    """
+    Fire-and-forget MongoDB writes for the request path.
+
+    enqueue_* only puts an operation on an asyncio queue; a background task drains it
+    in batches of up to MONGO_WRITE_BATCH_SIZE (or whatever arrived within
+    MONGO_WRITE_FLUSH_SECONDS) and sends one bulk_write per collection. Inserts are
+    sent unordered; batches containing updates stay ordered so repeated $push updates
+    to the same document keep their order. When the queue is full new writes are
+    dropped and counted rather than slowing requests down.
+    """
+
+    def __init__(self):
+        self.batch_size = settings.MONGO_WRITE_BATCH_SIZE
+        self.flush_interval = settings.MONGO_WRITE_FLUSH_SECONDS
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.MONGO_WRITE_QUEUE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if not self.running:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="mongo-write-queue")
+            logger.info("MongoDB write queue started")
+
+    async def stop(self):
+        """Lets the drain loop flush everything queued so far, then stops it."""
+        if not self.running:
+            return
+        self._stopping = True
+        # Sentinel goes behind the pending writes, so they are all flushed first
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info(f"MongoDB write queue stopped ({self.written} written, {self.dropped} dropped)")
+
+    # Operations are queued as plain tuples and turned into pymongo requests by the drain
+    # task, so pymongo is only imported once writes actually happen
+    def enqueue_insert(self, collection: str, document: dict):
+        self._put(collection, ("insert", document))
+
+    def enqueue_update(self, collection: str, filter: dict, update: dict, upsert: bool = False):
+        self._put(collection, ("update", filter, update, upsert))
+
+    def _put(self, collection: str, operation):
+        if not self.running or self._stopping:
+            return
+        try:
+            self._queue.put_nowait((collection, operation))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            MONGO_WRITES.inc(collection=collection, outcome="dropped")
+            if self.dropped % 1000 == 1:
+                logger.warning(f"MongoDB write queue full, dropped {self.dropped} writes so far")
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            # Give a partial batch a moment to fill up before sending it
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                batch.extend(self._drain_nowait(self.batch_size - len(batch)))
+                remaining = deadline - asyncio.get_running_loop().time()
+                if len(batch) >= self.batch_size or remaining <= 0 or None in batch:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            stopping = None in batch
+            await self._flush([item for item in batch if item is not None])
+
+    def _drain_nowait(self, limit: int) -> list:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    async def _flush(self, batch: list):
+        from pymongo import InsertOne, UpdateOne
+        from config.mongo import get_async_collection
+
+        by_collection = defaultdict(list)
+        ordered_collections = set()
+        for collection, operation in batch:
+            if operation[0] == "insert":
+                by_collection[collection].append(InsertOne(operation[1]))
+            else:
+                _, filter, update, upsert = operation
+                by_collection[collection].append(UpdateOne(filter, update, upsert=upsert))
+                ordered_collections.add(collection)
+
+        for collection, operations in by_collection.items():
+            ordered = collection in ordered_collections
+            try:
+                with MONGO_WRITE_SECONDS.time(collection=collection):
+                    await get_async_collection(collection).bulk_write(operations, ordered=ordered)
+                self.written += len(operations)
+                MONGO_WRITES.inc(len(operations), collection=collection, outcome="written")
+            except Exception as e:
+                self.failed += len(operations)
+                MONGO_WRITES.inc(len(operations), collection=collection, outcome="failed")
+                logger.error(f"Bulk write of {len(operations)} operations to '{collection}' failed: {e}")
+
+
+mongo_writer = MongoWriteQueue()
+
+
+def record_transcript(
+    session_id: str,
+    messages: List[Dict[str, str]],
+    response: str,
+    model: str,
+    source: str,
+    latency_ms: float,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    error: bool = False,
+):
+    """Queues one chat turn (with latency and token usage) for the analytics collection."""
+    if not settings.ANALYTICS_ENABLED:
+        return
+    mongo_writer.enqueue_insert(TRANSCRIPTS_COLLECTION, {
+        "session_id": session_id,
+        "messages": messages,
+        "response": response,
+        "model": model,
+        "source": source,
+        "latency_ms": round(latency_ms, 2),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "error": error,
+        "created_at": time.time(),
+    })
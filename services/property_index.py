@@ -0,0 +1,290 @@
+import csv
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from config.logger import logger
+from core.property_templates import ANSWER_TEMPLATES
+from core.metrics import FAST_PATH_ANSWERS
+from core.shared_state import load_array_snapshot, pack_postings, unpack_postings
+
+STRING_COLUMNS = ["Property_ID", "Property_Name", "Location", "Property_Type", "Status"]
+INT_COLUMNS = ["Bedrooms", "Bathrooms", "Size_sqft", "Price_USD", "Year_Built"]
+COLUMNS = ["Property_ID", "Property_Name", "Location", "Property_Type",
+           "Bedrooms", "Bathrooms", "Size_sqft", "Price_USD", "Year_Built", "Status"]
+
+# Low-cardinality columns that get a value -> rows posting list
+CATEGORICAL_COLUMNS = ["Location", "Property_Type", "Status"]
+# Numeric columns that get a sorted index for range filters and ordering
+RANGE_COLUMNS = {
+    "price": "Price_USD",
+    "size": "Size_sqft",
+    "year": "Year_Built",
+    "bedrooms": "Bedrooms",
+    "bathrooms": "Bathrooms",
+}
+
+# Model name reported for answers served from the index instead of the LLM
+PROPERTY_INDEX_MODEL = "property-index"
+
+_EMPTY_ROWS = np.empty(0, dtype=np.int64)
+
+# Bumped when the snapshot layout changes, so old snapshots are not mapped
+_SNAPSHOT_FORMAT = "v1"
+
+
+class PropertyIndex:
+    """
+    Columnar copy of property_data.csv.
+
+    Each column is a NumPy array (fixed-width unicode for text, int64 for numbers).
+    Search indexes are built once at load time:
+      - Property_ID / Property_Name: sorted keys + row numbers, looked up with searchsorted
+      - categorical columns: value -> sorted row array (plus city-only keys for Location)
+      - numeric columns: argsort order + sorted values for range lookups with searchsorted,
+        and a rank array for ordering arbitrary row subsets without re-sorting values
+    With SHARED_STATE_DIR set, every array is a read-only memory map of a snapshot built
+    once per node (see core.shared_state), so worker processes share one copy.
+    """
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self.columns: Dict[str, np.ndarray] = {}
+        self.lookup_keys: Dict[str, np.ndarray] = {}
+        self.lookup_rows: Dict[str, np.ndarray] = {}
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {}
+        self.sorted_rows: Dict[str, np.ndarray] = {}
+        self.sorted_values: Dict[str, np.ndarray] = {}
+        self.ranks: Dict[str, np.ndarray] = {}
+        self.loaded = False
+
+    def load(self):
+        """Loads the catalogue (built from the CSV, or mapped from the node's snapshot). Safe to call repeatedly."""
+        if self.loaded:
+            return
+        stat = os.stat(self.csv_path)
+        # A new snapshot whenever the CSV changes; the path hash keeps different catalogues apart,
+        # so replacing one catalogue's snapshot never removes another's
+        path_hash = hashlib.sha1(os.path.abspath(self.csv_path).encode("utf-8")).hexdigest()[:8]
+        version = f"{_SNAPSHOT_FORMAT}-{stat.st_size}-{stat.st_mtime_ns}"
+        self._attach(load_array_snapshot(f"catalogue-{path_hash}", version, self._build))
+        self.loaded = True
+        logger.info(f"Property index ready ({len(self)} properties)")
+
+    def _build(self) -> Dict[str, np.ndarray]:
+        logger.info(f"Loading property index from {self.csv_path}...")
+        raw: Dict[str, list] = {col: [] for col in COLUMNS}
+        with open(self.csv_path, mode='r', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                for col in COLUMNS:
+                    raw[col].append(row[col])
+
+        arrays = {}
+        for col in STRING_COLUMNS:
+            arrays[f"column__{col}"] = np.array(raw[col], dtype=str)
+        for col in INT_COLUMNS:
+            arrays[f"column__{col}"] = np.array(raw[col], dtype=np.int64)
+
+        lookups = {
+            "id": [pid.upper() for pid in raw["Property_ID"]],
+            "name": [name.casefold() for name in raw["Property_Name"]],
+        }
+        for kind, keys in lookups.items():
+            keys = np.array(keys, dtype=str)
+            order = np.argsort(keys, kind="stable")
+            arrays[f"lookup_keys__{kind}"] = keys[order]
+            arrays[f"lookup_rows__{kind}"] = order.astype(np.int64)
+
+        for col in CATEGORICAL_COLUMNS:
+            values, inverse = np.unique(np.char.lower(arrays[f"column__{col}"]), return_inverse=True)
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.searchsorted(inverse[order], np.arange(len(values) + 1))
+            postings = {str(v): order[bounds[i]:bounds[i + 1]] for i, v in enumerate(values)}
+            if col == "Location":
+                # "Dallas, TX" is also reachable as "dallas"
+                for value, rows in list(postings.items()):
+                    city = value.split(",")[0].strip()
+                    postings[city] = np.union1d(postings[city], rows) if city in postings else rows
+            packed = pack_postings(postings)
+            for part, array in zip(("values", "offsets", "rows"), packed):
+                arrays[f"postings_{part}__{col}"] = array
+
+        for col in RANGE_COLUMNS.values():
+            order = np.argsort(arrays[f"column__{col}"], kind="stable")
+            arrays[f"sorted_rows__{col}"] = order
+            arrays[f"sorted_values__{col}"] = arrays[f"column__{col}"][order]
+            ranks = np.empty(len(order), dtype=np.int64)
+            ranks[order] = np.arange(len(order))
+            arrays[f"ranks__{col}"] = ranks
+        return arrays
+
+    def _attach(self, arrays: Dict[str, np.ndarray]):
+        def group(prefix: str) -> Dict[str, np.ndarray]:
+            return {key.split("__", 1)[1]: array for key, array in arrays.items() if key.startswith(prefix + "__")}
+
+        self.columns = group("column")
+        self.lookup_keys = group("lookup_keys")
+        self.lookup_rows = group("lookup_rows")
+        self.sorted_rows = group("sorted_rows")
+        self.sorted_values = group("sorted_values")
+        self.ranks = group("ranks")
+        values, offsets, rows = group("postings_values"), group("postings_offsets"), group("postings_rows")
+        self.postings = {col: unpack_postings(values[col], offsets[col], rows[col]) for col in CATEGORICAL_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["Property_ID"]) if self.columns else 0
+
+    def _lookup(self, kind: str, key: str) -> Optional[int]:
+        keys = self.lookup_keys[kind]
+        # Last of equal keys, i.e. the last CSV row wins for a duplicated ID or name
+        i = int(np.searchsorted(keys, key, side="right")) - 1
+        if i >= 0 and keys[i] == key:
+            return int(self.lookup_rows[kind][i])
+        return None
+
+    def find_row(self, property_id: str = None, name: str = None) -> Optional[int]:
+        self.load()
+        if property_id:
+            return self._lookup("id", property_id.upper())
+        if name:
+            return self._lookup("name", " ".join(name.split()).casefold())
+        return None
+
+    def record(self, row: int) -> Dict[str, str]:
+        """Returns a row as CSV-style strings, ready for the answer templates."""
+        return {col: str(self.columns[col][row]) for col in COLUMNS}
+
+    def records(self, rows: np.ndarray) -> List[Dict]:
+        """Returns rows as dicts of native Python values, one column gather per field."""
+        gathered = {col: self.columns[col][rows].tolist() for col in COLUMNS}
+        return [{col: gathered[col][i] for col in COLUMNS} for i in range(len(rows))]
+
+    def search(
+        self,
+        equals: Dict[str, str] = None,
+        ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = None,
+        sort_by: str = None,
+        descending: bool = False,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[int, np.ndarray]:
+        """
+        Filters, orders and paginates the catalogue.
+        equals: {CATEGORICAL_COLUMN: value}; ranges: {RANGE_COLUMNS key: (min, max)}.
+        Returns (total matches, row numbers of the requested page).
+        """
+        self.load()
+        candidate_sets = []
+        for col, value in (equals or {}).items():
+            candidate_sets.append(self.postings[col].get(" ".join(value.split()).lower(), _EMPTY_ROWS))
+        for key, (low, high) in (ranges or {}).items():
+            if low is not None or high is not None:
+                candidate_sets.append(self._range_rows(RANGE_COLUMNS[key], low, high))
+
+        if not candidate_sets:
+            rows = np.arange(len(self), dtype=np.int64)
+        else:
+            # Start from the most selective index, then check the rest with vectorized masks
+            candidate_sets.sort(key=len)
+            rows = candidate_sets[0]
+            for other in candidate_sets[1:]:
+                if not len(rows):
+                    break
+                rows = rows[np.isin(rows, other, assume_unique=True)]
+
+        total = len(rows)
+        end = offset + limit
+        if sort_by:
+            keys = self.ranks[RANGE_COLUMNS[sort_by]][rows]
+            if descending:
+                keys = -keys
+            if end < total:
+                # Only the first `end` rows need full ordering
+                top = np.argpartition(keys, end - 1)[:end]
+                rows = rows[top[np.argsort(keys[top], kind="stable")]]
+            else:
+                rows = rows[np.argsort(keys, kind="stable")]
+        else:
+            rows = np.sort(rows)
+        return total, rows[offset:end]
+
+    def _range_rows(self, col: str, low: Optional[float], high: Optional[float]) -> np.ndarray:
+        values = self.sorted_values[col]
+        start = 0 if low is None else np.searchsorted(values, low, side="left")
+        stop = len(values) if high is None else np.searchsorted(values, high, side="right")
+        return self.sorted_rows[col][start:stop]
+
+
+# --- Intent matching for the deterministic fast path ---
+
+ID_PATTERN = re.compile(r"\bP\d{4,}\b", re.IGNORECASE)
+NAME_PATTERN = re.compile(r"\bproperty\s+\d+\b", re.IGNORECASE)
+
+_INTENT_KEYWORDS = {
+    "price": ("price", "cost", "how much", "priced"),
+    "status": ("available", "availability", "status", "for sale", "sold", "rented"),
+    "specs": ("size", "rooms", "sqft", "square feet", "bedrooms", "bathrooms", "how big"),
+    "details": ("details", "tell me about", "describe", "information", "info on", "info about"),
+}
+
+# Phrases that signal an open-ended question the templates can't answer
+_OPEN_ENDED = ("compare", "similar", "recommend", "cheaper", "better", "near", "best", "vs", "versus", "why")
+
+_MAX_FAST_PATH_WORDS = 25
+
+
+def match_intent(text: str) -> Optional[str]:
+    """
+    Returns the single template intent a question asks for, or None if it is ambiguous
+    or open-ended. Specific intents (price, status, specs) win over general details.
+    """
+    lowered = text.casefold()
+    words = re.findall(r"[a-z0-9']+", lowered)
+    if len(words) > _MAX_FAST_PATH_WORDS or any(w in _OPEN_ENDED for w in words):
+        return None
+
+    hits = [intent for intent, keys in _INTENT_KEYWORDS.items() if any(k in lowered for k in keys)]
+    specific = [h for h in hits if h != "details"]
+    if len(specific) == 1:
+        return specific[0]
+    if not specific and hits:
+        return "details"
+    return None
+
+
+def answer_property_question(messages: List[Dict[str, str]]) -> Optional[str]:
+    """
+    Answers the latest user message from the property index when it is a plain lookup
+    of one property by ID or name. Returns None to fall through to the LLM.
+    """
+    if not settings.FAST_PATH_ENABLED or not messages or messages[-1]["role"] != "user":
+        return None
+    text = messages[-1]["content"]
+
+    ids = {m.upper() for m in ID_PATTERN.findall(text)}
+    names = {" ".join(m.split()).casefold() for m in NAME_PATTERN.findall(text)}
+    if len(ids) + len(names) != 1:
+        return None
+
+    intent = match_intent(text)
+    if intent is None:
+        return None
+
+    try:
+        row = property_index.find_row(property_id=next(iter(ids), None), name=next(iter(names), None))
+    except Exception as e:
+        logger.warning(f"Property index unavailable, skipping fast path: {e}")
+        return None
+    if row is None:
+        return None
+
+    logger.info("Answered '%s' question from property index", intent)
+    FAST_PATH_ANSWERS.inc(intent=intent)
+    return ANSWER_TEMPLATES[intent].render(property_index.record(row))
+
+
+property_index = PropertyIndex(settings.PROPERTY_DATA_CSV)
@@ -0,0 +1,269 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from config.logger import get_logger
+from core.metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_WAIT_SECONDS, SCHEDULER_SHED
+from core.upstream_errors import error_status, retry_after_seconds
+from services.model_router import OverloadedError
+
+logger = get_logger("mistral")
+
+# Lower value is served first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Priority of upstream calls made from the current task (inherited by tasks it creates)
+_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+def set_priority(priority: int):
+    """Runs upstream calls from the current context (and tasks started from it) at `priority`."""
+    _priority.set(priority)
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]]) -> int:
+    """Prompt estimate (~4 characters per token) plus the expected completion length."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return max(1, chars // 4) + settings.SCHEDULER_COMPLETION_TOKENS_ESTIMATE
+
+
+class TokenBucket:
+    """Refills at `rate` units per second up to `capacity`. A rate of 0 disables it."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (oversized requests only wait for a full bucket)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.rate > 0:
+            self._refill()
+            self.level -= amount
+
+    def adjust(self, amount: float):
+        """Charges (or refunds, if negative) the difference between estimated and actual use."""
+        if self.rate > 0:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+class Ticket:
+    """An admitted upstream call. Set `tokens` to the real usage once known."""
+    __slots__ = ("priority", "seq", "tokens", "estimate", "future", "cancelled")
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.estimate = tokens
+        self.future: Optional[asyncio.Future] = None
+        self.cancelled = False
+
+    def __lt__(self, other: "Ticket"):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class UpstreamScheduler:
+    """
+    Admission control in front of the Mistral client.
+
+    Calls wait in a bounded priority queue (interactive before batch, FIFO within a
+    priority) and are admitted when a concurrency slot is free and both the request and
+    token buckets have room. A call whose estimated wait exceeds its deadline, or that
+    finds the queue full, is shed right away with an OverloadedError (429 + Retry-After)
+    instead of timing out later. An upstream 429 pauses admission for its Retry-After.
+    """
+
+    def __init__(self, max_concurrency: int, rps: float, tpm: float):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rps, max(1.0, rps))
+        # A minute's worth of tokens can be spent in a burst, as the upstream quota allows
+        self.tokens = TokenBucket(tpm / 60, tpm)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._queue: List[Ticket] = []
+        self._queued = {INTERACTIVE: 0, BATCH: 0}
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+
+    def scale_quota(self, share: float):
+        """Keeps only `share` of the quotas, e.g. for a batch process sharing the key with the web server."""
+        for bucket in (self.requests, self.tokens):
+            bucket.rate *= share
+            bucket.capacity = max(1.0, bucket.capacity * share) if bucket.rate > 0 else bucket.capacity
+            bucket.level = min(bucket.level, bucket.capacity)
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.max_concurrency and not self._queue_depth()
+
+    def pause(self, seconds: float):
+        """Stops admitting calls for `seconds` (after an upstream 429)."""
+        until = time.monotonic() + seconds
+        if until > self.paused_until:
+            logger.warning(f"Upstream rate limited, pausing admission for {seconds:.1f}s")
+            self.paused_until = until
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, timeout: float, service_time: float = 0.0):
+        """
+        Holds an upstream slot for the enclosed call. tokens: estimated request size;
+        timeout: the caller's remaining deadline; service_time: expected upstream latency,
+        so calls that would only start after their deadline are shed early.
+        """
+        ticket = await self.acquire(tokens, timeout, service_time)
+        try:
+            yield ticket
+        except Exception as e:
+            if error_status(e) == 429:
+                self.pause(retry_after_seconds(e) or 1.0)
+            raise
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, tokens: int, timeout: float, service_time: float = 0.0) -> Ticket:
+        priority = _priority.get()
+        name = PRIORITY_NAMES[priority]
+        ticket = Ticket(priority, next(self._seq), tokens)
+        max_wait = timeout - service_time
+        if priority == INTERACTIVE:
+            max_wait = min(max_wait, settings.SCHEDULER_INTERACTIVE_MAX_WAIT_SECONDS)
+
+        if self._queue_depth() >= settings.SCHEDULER_MAX_QUEUE:
+            self._shed(name, "queue_full", self._estimated_wait(ticket))
+        if not self._queue_depth() and self._admissible(ticket) == 0.0:
+            self._admit(ticket)
+            return ticket
+        estimate = self._estimated_wait(ticket)
+        if estimate > max_wait:
+            self._shed(name, "deadline", estimate)
+
+        started = time.monotonic()
+        ticket.future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, ticket)
+        self._queued[priority] += 1
+        SCHEDULER_QUEUE_DEPTH.inc(priority=name)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), max(0.0, max_wait))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Admitted just as the wait ended: hand the slot back
+                self.release(ticket)
+            else:
+                self._forget(ticket)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._shed(name, "deadline", self._estimated_wait(ticket))
+        SCHEDULER_WAIT_SECONDS.observe(time.monotonic() - started, priority=name)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        self.in_flight -= 1
+        if ticket.tokens != ticket.estimate:
+            self.tokens.adjust(ticket.tokens - ticket.estimate)
+        self._dispatch()
+
+    def _admit(self, ticket: Ticket):
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+        self.in_flight += 1
+
+    def _admissible(self, ticket: Ticket) -> Optional[float]:
+        """0.0 if the ticket can go now, None if it waits for a slot, else seconds until the buckets allow it."""
+        if self.in_flight >= self.max_concurrency:
+            return None
+        return max(
+            self.paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(ticket.tokens),
+            0.0,
+        )
+
+    def _estimated_wait(self, ticket: Ticket) -> float:
+        """Seconds until the buckets have served everything queued ahead of `ticket` and the ticket itself."""
+        ahead = [t for t in self._queue if not t.cancelled and t < ticket]
+        waits = [self.paused_until - time.monotonic(), 0.0]
+        if self.requests.rate > 0:
+            waits.append((len(ahead) + 1 - self.requests.level) / self.requests.rate)
+        if self.tokens.rate > 0:
+            waits.append((sum(t.tokens for t in ahead) + ticket.tokens - self.tokens.level) / self.tokens.rate)
+        return max(waits)
+
+    def _dispatch(self):
+        while self._queue:
+            ticket = self._queue[0]
+            if ticket.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            wait = self._admissible(ticket)
+            if wait is None:
+                return  # woken again by release()
+            if wait > 0:
+                self._wake_in(wait)
+                return
+            heapq.heappop(self._queue)
+            self._dequeued(ticket)
+            self._admit(ticket)
+            ticket.future.set_result(None)
+
+    def _wake_in(self, seconds: float):
+        at = time.monotonic() + seconds
+        if self._timer is not None and self._timer_at <= at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = asyncio.get_running_loop().call_later(seconds, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _forget(self, ticket: Ticket):
+        if not ticket.cancelled:
+            ticket.cancelled = True
+            self._dequeued(ticket)
+            # The head may have been holding back cheaper requests behind it
+            self._dispatch()
+
+    def _dequeued(self, ticket: Ticket):
+        self._queued[ticket.priority] -= 1
+        SCHEDULER_QUEUE_DEPTH.dec(priority=PRIORITY_NAMES[ticket.priority])
+
+    def _queue_depth(self) -> int:
+        return self._queued[INTERACTIVE] + self._queued[BATCH]
+
+    def _shed(self, priority_name: str, reason: str, retry_after: float):
+        SCHEDULER_SHED.inc(priority=priority_name, reason=reason)
+        retry_after = max(1.0, math.ceil(retry_after))
+        logger.warning(f"Shedding {priority_name} upstream call ({reason}), retry after {retry_after:.0f}s")
+        raise OverloadedError(f"Too many requests ({reason.replace('_', ' ')}), retry after {retry_after:.0f}s", retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": {PRIORITY_NAMES[p]: n for p, n in self._queued.items()},
+            "paused_for": max(0.0, round(self.paused_until - time.monotonic(), 2)),
+        }
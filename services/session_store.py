@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+from config.logger import logger
+from core.shared_state import shared_cache
+from services.context_service import estimate_tokens
+
+SESSIONS_COLLECTION = "chat_sessions"
+
+
+class Session:
+    __slots__ = ("session_id", "messages", "token_counts", "token_count", "updated_at")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.messages: List[Dict[str, str]] = []
+        self.token_counts: List[int] = []
+        # Rolling total of token_counts, kept up to date on every append/trim
+        self.token_count = 0
+        self.updated_at = time.monotonic()
+
+
+class SessionStore:
+    """
+    Server-side conversation history so clients only send the newest turn.
+
+    Sessions live in an LRU bounded by SESSION_MAX_SESSIONS, expire after
+    SESSION_TTL_SECONDS of inactivity and keep at most SESSION_MAX_MESSAGES messages.
+    With SESSION_PERSISTENCE_ENABLED, appended turns are also queued for bulk writes to
+    MongoDB and sessions evicted from memory are reloaded from there on their next request.
+
+    With SHARED_STATE_DIR set, the sessions are kept in the node's SharedCache instead,
+    so every worker sees each turn. They are then bounded by the cache's size limit
+    rather than SESSION_MAX_SESSIONS.
+    """
+
+    NAMESPACE = "sessions"
+
+    def __init__(self):
+        self.max_sessions = settings.SESSION_MAX_SESSIONS
+        self.max_messages = settings.SESSION_MAX_MESSAGES
+        self.ttl = settings.SESSION_TTL_SECONDS
+        self.persistence_enabled = settings.SESSION_PERSISTENCE_ENABLED
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._shared = shared_cache()
+
+    async def get_or_create(self, session_id: Optional[str]) -> Tuple[Session, bool]:
+        """Returns (session, created). Unknown or expired ids start an empty session under that id."""
+        session_id = session_id or uuid.uuid4().hex
+        if self._shared is not None:
+            return await self._get_or_create_shared(session_id)
+        session = self._sessions.get(session_id)
+        if session is not None and time.monotonic() - session.updated_at > self.ttl:
+            del self._sessions[session_id]
+            session = None
+
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            return session, False
+
+        session = Session(session_id)
+        if self.persistence_enabled:
+            await self._load(session)
+        self._add(session)
+        return session, not session.messages
+
+    def history(self, session: Session) -> List[Dict[str, str]]:
+        return list(session.messages)
+
+    async def append(self, session: Session, messages: List[Dict[str, str]]):
+        """Adds finished turns, trims the oldest past max_messages and persists the delta."""
+        counts = [estimate_tokens(m["content"]) for m in messages]
+        session.messages.extend(messages)
+        session.token_counts.extend(counts)
+        session.token_count += sum(counts)
+
+        overflow = len(session.messages) - self.max_messages
+        if overflow > 0:
+            session.token_count -= sum(session.token_counts[:overflow])
+            del session.messages[:overflow]
+            del session.token_counts[:overflow]
+        session.updated_at = time.monotonic()
+
+        if self._shared is not None:
+            payload = json.dumps(session.messages).encode("utf-8")
+            await asyncio.to_thread(self._shared.set, self.NAMESPACE, session.session_id, payload)
+        if self.persistence_enabled:
+            await self._persist(session.session_id, messages, session.token_count)
+
+    def __len__(self):
+        if self._shared is not None:
+            return self._shared.count(self.NAMESPACE)
+        return len(self._sessions)
+
+    async def _get_or_create_shared(self, session_id: str) -> Tuple[Session, bool]:
+        # Read on every request: the previous turn may have been answered by another worker
+        entry = await asyncio.to_thread(self._shared.get, self.NAMESPACE, session_id)
+        session = Session(session_id)
+        if entry is not None and time.time() - entry[2] <= self.ttl:
+            self._set_messages(session, json.loads(entry[0]))
+            return session, False
+        if self.persistence_enabled:
+            await self._load(session)
+        return session, not session.messages
+
+    def _add(self, session: Session):
+        self._sessions[session.session_id] = session
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            logger.debug(f"Evicted session {evicted} from memory")
+
+    async def _load(self, session: Session):
+        try:
+            from config.mongo import get_async_collection
+            document = await get_async_collection(SESSIONS_COLLECTION).find_one({"_id": session.session_id})
+        except Exception as e:
+            logger.warning(f"Failed to load session {session.session_id}: {e}")
+            return
+        if document:
+            self._set_messages(session, document.get("messages", []))
+
+    def _set_messages(self, session: Session, messages: List[Dict[str, str]]):
+        messages = messages[-self.max_messages:]
+        session.messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+        session.token_counts = [estimate_tokens(m["content"]) for m in session.messages]
+        session.token_count = sum(session.token_counts)
+
+    async def _persist(self, session_id: str, messages: List[Dict[str, str]], token_count: int):
+        # Queued for the next bulk write; never waits on MongoDB
+        from services.mongo_writer import mongo_writer
+        mongo_writer.enqueue_update(
+            SESSIONS_COLLECTION,
+            {"_id": session_id},
+            {
+                "$push": {"messages": {"$each": messages, "$slice": -self.max_messages}},
+                # The trimmed session's total, matching the messages left after $slice
+                "$set": {"token_count": token_count, "updated_at": time.time()},
+            },
+            upsert=True,
+        )
+
+
+session_store = SessionStore()
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from config.logger import logger
+from core.metrics import COALESCED_REQUESTS
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one upstream task.
+
+    The first caller for a key starts the task; later callers with the same key await
+    the same result. An exception or cancellation of the shared task is raised in every
+    waiter. A waiter that is cancelled itself just detaches; the shared task is only
+    cancelled once no waiters are left.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+            COALESCED_REQUESTS.inc()
+            logger.debug("Coalescing request onto in-flight call %s", key[:12])
+
+        call.waiters += 1
+        try:
+            # shield() keeps one waiter's cancellation from cancelling everyone else's result
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Union
+
+from config.settings import settings
+from config.logger import logger
+
+
+async def _mistral():
+    from services.mistral_service import mistral_service
+    # Importing the SDK is slow, so the client is built off the event loop. The request
+    # then opens a pooled connection (DNS, TLS) for the first chat to reuse, and checks the key.
+    client = await asyncio.to_thread(lambda: mistral_service.client)
+    await client.models.list_async()
+
+
+def _chroma():
+    from config.chroma import get_chroma_client
+    get_chroma_client().client.heartbeat()
+
+
+def _embedding_model():
+    from core.embedding import embedder
+    embedder.embed_batch(["warm-up"])
+
+
+Check = Callable[[], Union[None, Awaitable[None]]]
+
+
+def warmup_checks() -> Dict[str, Check]:
+    """
+    Checks to run at startup, by name: blocking functions, or coroutine functions for the
+    ones that use the event loop's HTTP client. The vector store only when something uses it.
+    """
+    checks = {"mistral_client": _mistral}
+    if settings.CONTEXT_RETRIEVAL_ENABLED or settings.SEMANTIC_CACHE_ENABLED:
+        checks["chroma"] = _chroma
+        checks["embedding_model"] = _embedding_model
+    return checks
+
+
+async def warm_up(timeout: float) -> Dict[str, str]:
+    """
+    Runs the checks concurrently (blocking ones in worker threads) and returns {name: "ok" | error}.
+    Never raises: a failed check only means that subsystem initializes (or fails) on first use.
+    """
+    checks = warmup_checks()
+
+    async def run(name: str, check: Check) -> str:
+        started = time.perf_counter()
+        try:
+            pending = check() if asyncio.iscoroutinefunction(check) else asyncio.to_thread(check)
+            await asyncio.wait_for(pending, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Warm-up: {name} not ready after {timeout}s, continuing in the background")
+            return f"timed out after {timeout}s"
+        except Exception as e:
+            logger.warning(f"Warm-up: {name} failed, will be retried on first use: {e}")
+            return f"failed: {e}"
+        logger.info(f"Warm-up: {name} ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return "ok"
+
+    results = await asyncio.gather(*(run(name, check) for name, check in checks.items()))
+    return dict(zip(checks, results))
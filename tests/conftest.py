@@ -0,0 +1,17 @@
+import os
+import sys
+
+# Tests run against the in-process defaults, whatever a local .env says (load_dotenv never
+# overrides variables that are already set). Must happen before config.settings is imported.
+os.environ.update({
+    "SHARED_STATE_DIR": "",
+    "MONGO_CONNECTION_STRING": "",
+    "SESSION_PERSISTENCE_ENABLED": "false",
+    "CONTEXT_RETRIEVAL_ENABLED": "false",
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "WARMUP_ON_STARTUP": "false",
+    "MODEL_FALLBACKS": "",
+    "DEFAULT_MODEL": "mistral-tiny",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
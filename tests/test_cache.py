@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from services import cache_service
+from services.cache_service import ResponseCache
+
+QUESTION = [{"role": "user", "content": "What is the price of P1001?"}]
+
+
+@pytest.fixture
+def local_cache(monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", "")
+    return ResponseCache()
+
+
+@pytest.fixture
+def shared_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr("core.shared_state._shared_cache", None)
+    return tmp_path
+
+
+def test_key_ignores_whitespace_and_case_only():
+    key = ResponseCache.make_key("mistral-tiny", QUESTION, 0.2)
+    reworded = [{"role": "user", "content": "  what is the PRICE of   p1001? "}]
+    assert ResponseCache.make_key("mistral-tiny", reworded, 0.2) == key
+    assert ResponseCache.make_key("mistral-small", QUESTION, 0.2) != key
+    assert ResponseCache.make_key("mistral-tiny", QUESTION, 0.7) != key
+    assert ResponseCache.make_key("mistral-tiny", [{"role": "system", "content": QUESTION[0]["content"]}], 0.2) != key
+
+
+def test_local_tier_is_an_lru_with_a_ttl(local_cache, monkeypatch):
+    local_cache.max_entries = 2
+    for name in ("a", "b"):
+        local_cache.set(name, "mistral-tiny", f"answer {name}")
+    assert asyncio.run(local_cache.get("a")) == "answer a"
+    local_cache.set("c", "mistral-tiny", "answer c")
+    # "b" was the least recently used
+    assert asyncio.run(local_cache.get("b")) is None
+    assert asyncio.run(local_cache.get("a")) == "answer a"
+
+    local_cache.ttl = 0
+    assert asyncio.run(local_cache.get("c")) is None
+
+
+def test_invalidate_model_drops_only_its_answers(local_cache):
+    local_cache.set("a", "mistral-tiny", "tiny answer")
+    local_cache.set("b", "mistral-small", "small answer")
+    asyncio.run(local_cache.invalidate_model("mistral-tiny"))
+    assert asyncio.run(local_cache.get("a")) is None
+    assert asyncio.run(local_cache.get("b")) == "small answer"
+    assert local_cache.get_stats()["invalidations"] == 1
+
+
+def test_shared_tier_is_visible_to_other_workers(shared_dir):
+    async def scenario():
+        writer, reader = ResponseCache(), ResponseCache()
+        writer.set("a", "mistral-tiny", "tiny answer")
+        writer.set("b", "mistral-small", "small answer")
+        await asyncio.gather(*writer._background_tasks)
+        hit = await reader.get("a")
+        await reader.invalidate_model("mistral-tiny")
+        return hit, await writer.get("a"), await writer.get("b")
+
+    assert asyncio.run(scenario()) == ("tiny answer", None, "small answer")
+    assert (shared_dir / "cache.sqlite").exists()
+
+
+def test_default_model_change_invalidates_the_previous_model(local_cache, monkeypatch):
+    monkeypatch.setattr(cache_service, "_MODEL_CHECK_INTERVAL_SECONDS", 0)
+
+    async def scenario():
+        local_cache.set("a", local_cache._default_model, "old answer")
+        monkeypatch.setattr(cache_service, "resolve_model", lambda model=None: "ft:new-model")
+        # The lookup itself is not held up by the invalidation
+        first = await local_cache.get("a")
+        await asyncio.gather(*local_cache._background_tasks)
+        return first, await local_cache.get("a")
+
+    assert asyncio.run(scenario()) == ("old answer", None)
+    assert local_cache._default_model == "ft:new-model"
+
+
+def test_semantic_tier_only_takes_single_question_conversations(local_cache):
+    local_cache.semantic_enabled = True
+    assert local_cache._semantic_query([{"role": "user", "content": " Is  P1001 available? "}]) == "Is P1001 available?"
+    follow_up = QUESTION + [{"role": "assistant", "content": "350000"}, {"role": "user", "content": "And P1002?"}]
+    assert local_cache._semantic_query(follow_up) is None
@@ -0,0 +1,32 @@
+from core.dedup import ExactDeduplicator, MinHashDeduplicator
+
+BASE = (
+    "The property at 12 Elm Street is a three bedroom house in Dallas with two bathrooms, "
+    "a garden, a renovated kitchen and a two car garage, listed for 350000 dollars."
+)
+
+
+def test_exact_duplicates_ignore_case_and_whitespace():
+    dedup = ExactDeduplicator()
+    assert not dedup.is_duplicate("Hello   World")
+    assert dedup.is_duplicate("hello world")
+    assert not dedup.is_duplicate("hello there")
+
+
+def test_near_duplicate_is_flagged():
+    dedup = MinHashDeduplicator(threshold=0.8)
+    assert not dedup.is_duplicate(BASE)
+    assert dedup.is_duplicate(BASE.replace("dollars.", "dollars!"))
+
+
+def test_different_texts_are_kept():
+    dedup = MinHashDeduplicator(threshold=0.8)
+    assert not dedup.is_duplicate(BASE)
+    assert not dedup.is_duplicate(
+        "A one bedroom condo in Austin close to downtown, sold in 2019 after a full renovation."
+    )
+    assert not dedup.is_duplicate(BASE.replace("Dallas", "Austin").replace("350000", "420000").replace("garden", "pool"))
+
+
+def test_signatures_are_deterministic():
+    assert (MinHashDeduplicator().signature(BASE) == MinHashDeduplicator().signature(BASE)).all()
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from core.metrics import HTTP_REQUEST_SECONDS, Counter, Histogram, MetricsMiddleware, route_template
+
+
+def make_app(seen):
+    router = APIRouter()
+
+    @router.get("/cache/{model}")
+    async def cache_entry(model: str):
+        return {"model": model}
+
+    @router.get("/health")
+    async def health():
+        return {}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+
+    @app.middleware("http")
+    async def record_route(request, call_next):
+        response = await call_next(request)
+        seen.append(route_template(request.scope))
+        return response
+
+    return app
+
+
+def test_route_template_includes_the_router_prefix():
+    seen = []
+    client = TestClient(make_app(seen))
+    client.get("/api/cache/mistral-tiny")
+    client.get("/api/cache/mistral-small-latest")
+    client.get("/api/health")
+    client.get("/missing/path")
+    assert seen == ["/api/cache/{model}", "/api/cache/{model}", "/api/health", "unmatched"]
+
+
+def test_route_template_ignores_the_root_path():
+    seen = []
+    client = TestClient(make_app(seen), root_path="/proxy")
+    client.get("/proxy/api/cache/mistral-tiny")
+    assert seen == ["/api/cache/{model}"]
+
+
+def test_middleware_labels_latency_by_route_template():
+    seen = []
+    app = make_app(seen)
+    app.add_middleware(MetricsMiddleware)
+    TestClient(app).get("/api/cache/mistral-tiny")
+    rendered = "\n".join(HTTP_REQUEST_SECONDS.render())
+    assert 'route="/api/cache/{model}"' in rendered
+    assert "mistral-tiny" not in rendered
+
+
+def test_metrics_render_in_prometheus_text_format():
+    requests = Counter("test_requests_total", "Requests", ["code"])
+    requests.inc(code=200)
+    requests.inc(2, code=200)
+    latency = Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.5)
+    assert 'test_requests_total{code="200"} 3.0' in requests.render()
+    rendered = latency.render()
+    assert 'test_latency_seconds_bucket{le="0.1"} 0' in rendered
+    assert 'test_latency_seconds_bucket{le="+Inf"} 1' in rendered
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from services.model_router import CLOSED, OPEN, ModelRouter, UpstreamError
+
+
+class FakeError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_falls_through_to_the_next_model_on_failure():
+    router = ModelRouter()
+    calls = []
+
+    async def call(model, timeout):
+        calls.append(model)
+        if model == "primary":
+            raise FakeError(500)
+        return model
+
+    assert asyncio.run(router.call(["primary", "fallback"], call, timeout=5)) == "fallback"
+    assert calls == ["primary", "fallback"]
+    assert router.health_of("primary").consecutive_failures == 1
+    assert router.health_of("fallback").consecutive_failures == 0
+
+
+def test_client_errors_are_not_retried_on_other_models():
+    router = ModelRouter()
+    calls = []
+
+    async def call(model, timeout):
+        calls.append(model)
+        raise FakeError(400)
+
+    with pytest.raises(FakeError):
+        asyncio.run(router.call(["primary", "fallback"], call, timeout=5))
+    assert calls == ["primary"]
+    assert router.health_of("primary").consecutive_failures == 0
+
+
+def test_breaker_opens_and_skips_the_model(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_SECONDS", 60)
+    router = ModelRouter()
+    calls = []
+
+    async def call(model, timeout):
+        calls.append(model)
+        if model == "primary":
+            raise FakeError(503)
+        return model
+
+    for _ in range(3):
+        asyncio.run(router.call(["primary", "fallback"], call, timeout=5))
+    assert router.health_of("primary").state == OPEN
+    assert calls.count("primary") == 2
+
+    # Every model open: answered as 503 without calling upstream
+    router.health_of("fallback").state = OPEN
+    router.health_of("fallback").opened_at = router.health_of("primary").opened_at
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(router.call(["primary", "fallback"], call, timeout=5))
+    assert error.value.status_code == 503
+
+
+def test_half_open_probe_closes_the_breaker_on_success(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_SECONDS", 0)
+    router = ModelRouter()
+    health = router.health_of("primary")
+    health.record_failure()
+    assert health.state == OPEN
+
+    async def call(model, timeout):
+        return model
+
+    assert asyncio.run(router.call(["primary"], call, timeout=5)) == "primary"
+    assert health.state == CLOSED
+
+
+def _seed_latencies(router, model, seconds, count):
+    for _ in range(count):
+        router.health_of(model).record_latency(seconds)
+
+
+def test_slow_attempt_is_hedged_and_the_loser_leaves_no_latency_sample(monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(settings, "HEDGE_MIN_DELAY_SECONDS", 0.01)
+    router = ModelRouter()
+    _seed_latencies(router, "primary", 0.02, 5)
+    attempts = []
+
+    async def call(model, timeout):
+        attempts.append(model)
+        # The first attempt hangs, the hedge answers quickly
+        await asyncio.sleep(10 if len(attempts) == 1 else 0.01)
+        return len(attempts)
+
+    assert asyncio.run(router.call(["primary"], call, timeout=5)) == 2
+    health = router.health_of("primary")
+    # Five seeded samples plus the winning hedge; the cancelled primary adds nothing
+    assert len(health.latencies) == 6
+    assert max(health.latencies) < 1
+
+
+def test_no_hedge_when_upstream_has_no_capacity(monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(settings, "HEDGE_MIN_DELAY_SECONDS", 0.01)
+    router = ModelRouter(can_hedge=lambda: False)
+    _seed_latencies(router, "primary", 0.01, 5)
+    attempts = []
+
+    async def call(model, timeout):
+        attempts.append(model)
+        await asyncio.sleep(0.05)
+        return model
+
+    asyncio.run(router.call(["primary"], call, timeout=5))
+    assert attempts == ["primary"]
+
+
+def test_timeout_records_its_latency_and_counts_as_failure():
+    router = ModelRouter()
+
+    async def call(model, timeout):
+        await asyncio.sleep(0.02)
+        raise asyncio.TimeoutError()
+
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(router.call(["primary"], call, timeout=5))
+    assert error.value.status_code == 504
+    health = router.health_of("primary")
+    assert len(health.latencies) == 1 and health.latencies[0] >= 0.02
+    assert health.consecutive_failures == 1
+
+
+def test_rate_limited_everywhere_is_answered_as_429():
+    router = ModelRouter()
+
+    async def call(model, timeout):
+        raise FakeError(429)
+
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(router.call(["primary", "fallback"], call, timeout=5))
+    assert error.value.status_code == 429
+    assert error.value.retry_after == 1.0
+    # Rate limits say nothing about the model's health
+    assert router.health_of("primary").consecutive_failures == 0
+
+
+def test_route_resolves_fallbacks_without_duplicates(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_FALLBACKS", "mistral-small-latest, mistral-tiny ,")
+    assert ModelRouter().route("mistral-tiny") == ["mistral-tiny", "mistral-small-latest"]
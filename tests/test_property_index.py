@@ -0,0 +1,84 @@
+import csv
+
+import numpy as np
+import pytest
+
+from config.settings import settings
+from services.property_index import COLUMNS, PropertyIndex
+
+ROWS = [
+    ("P1001", "Property 1", "Dallas, TX", "House", 3, 2, 1800, 350000, 1995, "Available"),
+    ("P1002", "Property 2", "Austin, TX", "Condo", 2, 1, 950, 280000, 2010, "Sold"),
+    ("P1003", "Property 3", "Dallas, TX", "Condo", 1, 1, 700, 190000, 2018, "Available"),
+    ("P1004", "Property 4", "Dallas, OR", "House", 4, 3, 2600, 520000, 2005, "Available"),
+    ("P1005", "Property 5", "Austin, TX", "House", 5, 4, 3200, 760000, 2021, "Rented"),
+]
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    path = tmp_path / "property_data.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(ROWS)
+    return str(path)
+
+
+def ids(index, rows):
+    return [record["Property_ID"] for record in index.records(rows)]
+
+
+def test_find_row_by_id_and_name(catalogue):
+    index = PropertyIndex(catalogue)
+    assert index.find_row(property_id="p1003") == 2
+    assert index.find_row(name="  property   4 ") == 3
+    assert index.find_row(property_id="P9999") is None
+    assert index.record(0)["Price_USD"] == "350000"
+
+
+def test_search_combines_equals_and_ranges(catalogue):
+    index = PropertyIndex(catalogue)
+    total, rows = index.search(equals={"Location": "dallas"}, ranges={"price": (200000, None)})
+    assert total == 2
+    assert ids(index, rows) == ["P1001", "P1004"]
+
+    total, rows = index.search(equals={"Location": "Dallas, TX", "Property_Type": "condo"})
+    assert (total, ids(index, rows)) == (1, ["P1003"])
+
+    total, rows = index.search(equals={"Status": "demolished"})
+    assert total == 0 and len(rows) == 0
+
+
+def test_search_sorts_and_paginates(catalogue):
+    index = PropertyIndex(catalogue)
+    total, rows = index.search(sort_by="price", descending=True, limit=2)
+    assert total == 5
+    assert ids(index, rows) == ["P1005", "P1004"]
+
+    total, rows = index.search(sort_by="price", limit=2, offset=2)
+    assert ids(index, rows) == ["P1001", "P1004"]
+
+    total, rows = index.search(ranges={"bedrooms": (2, 4)}, sort_by="year")
+    assert total == 3
+    assert ids(index, rows) == ["P1001", "P1004", "P1002"]
+
+
+def test_search_matches_a_brute_force_filter(catalogue):
+    index = PropertyIndex(catalogue)
+    for low, high in [(None, 300000), (280000, 520000), (800000, None)]:
+        expected = [
+            r[0] for r in sorted(ROWS, key=lambda r: r[7])
+            if (low is None or r[7] >= low) and (high is None or r[7] <= high)
+        ]
+        total, rows = index.search(ranges={"price": (low, high)}, sort_by="price", limit=10)
+        assert (total, ids(index, rows)) == (len(expected), expected)
+
+
+def test_snapshot_is_shared_between_instances(catalogue, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", str(tmp_path / "shared"))
+    first, second = PropertyIndex(catalogue), PropertyIndex(catalogue)
+    first.load()
+    second.load()
+    assert isinstance(second.columns["Price_USD"], np.memmap)
+    assert ids(second, second.search(equals={"Location": "austin"})[1]) == ["P1002", "P1005"]
@@ -0,0 +1,102 @@
+import asyncio
+import types
+
+import pytest
+
+from config.settings import settings
+from services.model_router import OverloadedError
+from services.scheduler import BATCH, UpstreamScheduler, set_priority
+
+
+def test_interactive_calls_are_admitted_before_queued_batch_calls():
+    async def scenario():
+        scheduler = UpstreamScheduler(max_concurrency=1, rps=0, tpm=0)
+        order = []
+
+        async def call(name, priority):
+            set_priority(priority)
+            async with scheduler.slot(tokens=10, timeout=5):
+                order.append(name)
+
+        holder = await scheduler.acquire(tokens=10, timeout=5)
+        batch = asyncio.create_task(call("batch", BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call("interactive", 0))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == {"interactive": 1, "batch": 1}
+        scheduler.release(holder)
+        await asyncio.gather(batch, interactive)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(scenario())
+    assert order == ["interactive", "batch"]
+    assert scheduler.in_flight == 0
+
+
+def test_full_queue_sheds_immediately(monkeypatch):
+    monkeypatch.setattr(settings, "SCHEDULER_MAX_QUEUE", 1)
+
+    async def scenario():
+        scheduler = UpstreamScheduler(max_concurrency=1, rps=0, tpm=0)
+        await scheduler.acquire(tokens=10, timeout=5)
+        queued = asyncio.create_task(scheduler.acquire(tokens=10, timeout=5))
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError) as shed:
+            await scheduler.acquire(tokens=10, timeout=5)
+        queued.cancel()
+        return shed.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+
+
+def test_call_that_cannot_start_before_its_deadline_is_shed():
+    async def scenario():
+        # One request per second: the second call would wait about a second
+        scheduler = UpstreamScheduler(max_concurrency=10, rps=1, tpm=0)
+        await scheduler.acquire(tokens=10, timeout=5)
+        with pytest.raises(OverloadedError):
+            await scheduler.acquire(tokens=10, timeout=0.5)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.stats()["queued"] == {"interactive": 0, "batch": 0}
+
+
+def test_upstream_429_pauses_admission_for_its_retry_after():
+    class RateLimited(Exception):
+        status_code = 429
+        raw_response = types.SimpleNamespace(status_code=429, headers={"retry-after": "3"})
+
+    async def scenario():
+        scheduler = UpstreamScheduler(max_concurrency=1, rps=0, tpm=0)
+        with pytest.raises(RateLimited):
+            async with scheduler.slot(tokens=10, timeout=5):
+                raise RateLimited()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.in_flight == 0
+    assert 2 < scheduler.stats()["paused_for"] <= 3
+
+
+def test_token_bucket_is_corrected_with_the_real_usage():
+    async def scenario():
+        scheduler = UpstreamScheduler(max_concurrency=1, rps=0, tpm=600)
+        async with scheduler.slot(tokens=500, timeout=5) as ticket:
+            ticket.tokens = 100
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    # 500 estimated, 100 used: the difference is refunded
+    assert scheduler.tokens.level == pytest.approx(500, abs=1)
+
+
+def test_scale_quota_keeps_a_share_of_both_buckets():
+    scheduler = UpstreamScheduler(max_concurrency=4, rps=10, tpm=6000)
+    scheduler.scale_quota(0.25)
+    assert scheduler.requests.rate == pytest.approx(2.5)
+    assert scheduler.tokens.rate == pytest.approx(25)
+    assert scheduler.tokens.capacity == pytest.approx(1500)
+    assert scheduler.tokens.level <= scheduler.tokens.capacity
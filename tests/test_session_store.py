@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from services.context_service import estimate_tokens
+from services.session_store import SessionStore
+
+
+def turn(i):
+    return [{"role": "user", "content": f"question {i} " * (i + 1)}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+@pytest.fixture
+def local_store(monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", "")
+    monkeypatch.setattr(settings, "SESSION_PERSISTENCE_ENABLED", False)
+    return SessionStore()
+
+
+@pytest.fixture
+def shared_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "SESSION_PERSISTENCE_ENABLED", False)
+    monkeypatch.setattr("core.shared_state._shared_cache", None)
+    return tmp_path
+
+
+def test_trimming_keeps_the_token_count_in_step(local_store):
+    local_store.max_messages = 4
+
+    async def scenario():
+        session, created = await local_store.get_or_create("s1")
+        for i in range(5):
+            await local_store.append(session, turn(i))
+        return session, created
+
+    session, created = asyncio.run(scenario())
+    assert created
+    assert session.messages == turn(3) + turn(4)
+    assert session.token_count == sum(estimate_tokens(m["content"]) for m in session.messages)
+
+
+def test_sessions_expire_and_are_evicted(local_store):
+    local_store.max_sessions = 1
+
+    async def scenario():
+        first, _ = await local_store.get_or_create("s1")
+        await local_store.append(first, turn(0))
+        again, created_again = await local_store.get_or_create("s1")
+        await local_store.get_or_create("s2")
+        evicted, created_evicted = await local_store.get_or_create("s1")
+        return again is first, created_again, created_evicted
+
+    assert asyncio.run(scenario()) == (True, False, True)
+    assert len(local_store) == 1
+
+
+def test_shared_sessions_are_seen_by_every_worker(shared_dir):
+    async def scenario():
+        first_worker, second_worker = SessionStore(), SessionStore()
+        session, _ = await first_worker.get_or_create("s1")
+        await first_worker.append(session, turn(0))
+        continued, created = await second_worker.get_or_create("s1")
+        await second_worker.append(continued, turn(1))
+        latest, _ = await first_worker.get_or_create("s1")
+        return created, latest
+
+    created, latest = asyncio.run(scenario())
+    assert not created
+    assert latest.messages == turn(0) + turn(1)
+    assert latest.token_count == sum(estimate_tokens(m["content"]) for m in latest.messages)
@@ -0,0 +1,64 @@
+import numpy as np
+
+from config.settings import settings
+from core.shared_state import SharedCache, load_array_snapshot, pack_postings, unpack_postings
+
+
+def test_shared_cache_round_trip_and_tag_invalidation(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.sqlite"), max_bytes=2**20)
+    cache.set("responses", "a", b"one", tag="mistral-tiny")
+    cache.set_many("responses", {"b": b"two", "c": b"three"}, tag="mistral-small")
+    assert cache.get("responses", "a")[0] == b"one"
+    assert cache.get("embeddings", "a") is None
+    assert set(cache.get_many("responses", ["a", "b", "z"])) == {"a", "b"}
+
+    assert cache.delete_tag("responses", "mistral-small") == 2
+    assert cache.get("responses", "b") is None
+    assert cache.count("responses") == 1
+
+
+def test_shared_cache_is_visible_to_other_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SharedCache(path, max_bytes=2**20).set("sessions", "s1", b"state")
+    assert SharedCache(path, max_bytes=2**20).get("sessions", "s1")[0] == b"state"
+
+
+def test_shared_cache_evicts_past_its_budget(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.sqlite"), max_bytes=2**20)
+    for i in range(1024):
+        cache.set("responses", str(i), b"x" * 2048)
+    assert 0 < cache.count("responses") < 1024
+    assert cache.used_bytes() <= 2**20
+    # Least recently used first
+    assert cache.get("responses", "0") is None
+    assert cache.get("responses", "1023") is not None
+
+
+def test_array_snapshot_is_built_once_per_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", str(tmp_path))
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"values": np.arange(5)}
+
+    first = load_array_snapshot("numbers", "v1", build)
+    second = load_array_snapshot("numbers", "v1", build)
+    assert len(builds) == 1
+    assert second["values"].tolist() == [0, 1, 2, 3, 4]
+    assert not second["values"].flags.writeable
+    load_array_snapshot("numbers", "v2", build)
+    assert len(builds) == 2
+    assert first["values"].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_array_snapshot_without_shared_state_builds_in_memory(monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", "")
+    arrays = load_array_snapshot("numbers", "v1", lambda: {"values": np.arange(3)})
+    assert not isinstance(arrays["values"], np.memmap)
+
+
+def test_postings_round_trip():
+    postings = {"dallas": np.array([0, 2, 3]), "austin": np.array([1, 4]), "empty": np.array([], dtype=np.int64)}
+    unpacked = unpack_postings(*pack_postings(postings))
+    assert {k: v.tolist() for k, v in unpacked.items()} == {k: v.tolist() for k, v in postings.items()}
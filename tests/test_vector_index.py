@@ -0,0 +1,125 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from config.vector_index import LocalVectorIndex
+
+
+def embed(texts):
+    """Letter counts: deterministic, and similar words get similar vectors."""
+    vectors = np.zeros((len(texts), 26), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for char in text.lower():
+            if "a" <= char <= "z":
+                vectors[row, ord(char) - ord("a")] += 1
+    return vectors
+
+
+def open_index(path):
+    return LocalVectorIndex(str(path), embed)
+
+
+def test_query_returns_nearest_first_and_filters(tmp_path):
+    index = open_index(tmp_path / "docs")
+    index.add(["a", "b", "c"], ["apple", "banana", "cherry"], [{"kind": "fruit"}, {"kind": "fruit"}, {"kind": "red"}])
+    result = index.query(["apples"], n_results=2)
+    assert result["ids"][0][0] == "a"
+    assert result["distances"][0][0] < result["distances"][0][1]
+
+    result = index.query(["cherry"], n_results=5, where={"kind": "fruit"})
+    assert sorted(result["ids"][0]) == ["a", "b"]
+
+
+def test_add_keeps_existing_ids_and_upsert_replaces_them(tmp_path):
+    index = open_index(tmp_path / "docs")
+    index.add(["a"], ["apple"])
+    index.add(["a", "b"], ["avocado", "banana"])
+    assert index.count() == 2
+    assert index.query(["apple"], n_results=1)["documents"][0] == ["apple"]
+
+    index.upsert(["a", "a"], ["apricot", "avocado"])
+    assert index.count() == 2
+    assert index.query(["avocado"], n_results=1)["documents"][0] == ["avocado"]
+
+
+def test_writes_are_replayed_from_the_log_on_reopen(tmp_path):
+    index = open_index(tmp_path / "docs")
+    index.add(["a", "b", "c"], ["apple", "banana", "cherry"])
+    index.delete(ids=["b"])
+    index.upsert(["c"], ["citrus"])
+
+    reopened = open_index(tmp_path / "docs")
+    assert reopened.count() == 2
+    assert reopened.query(["citrus"], n_results=2)["documents"][0] == ["citrus", "apple"]
+
+
+def test_close_folds_the_log_into_the_snapshot(tmp_path):
+    index = open_index(tmp_path / "docs")
+    index.add(["a", "b"], ["apple", "banana"])
+    index.close()
+    with open(tmp_path / "docs" / "log.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line)["op"] for line in f] == ["start"]
+
+    reopened = open_index(tmp_path / "docs")
+    assert isinstance(reopened._vectors, np.memmap)
+    assert reopened.query(["banana"], n_results=1)["ids"][0] == ["b"]
+
+
+def test_partially_written_entry_is_skipped(tmp_path):
+    index = open_index(tmp_path / "docs")
+    index.add(["a"], ["apple"])
+    with open(tmp_path / "docs" / "log.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"op": "upsert", "ids": ["b"], "docu')
+
+    reopened = open_index(tmp_path / "docs")
+    assert reopened.count() == 1
+    reopened.add(["c"], ["cherry"])
+    assert open_index(tmp_path / "docs").count() == 2
+
+
+def test_delete_on_an_empty_index(tmp_path):
+    index = open_index(tmp_path / "docs")
+    index.delete(ids=["missing"])
+    index.delete(where={"kind": "fruit"})
+    assert index.count() == 0
+    assert index.query(["apple"])["ids"] == [[]]
+
+
+def test_writes_of_another_instance_are_visible(tmp_path):
+    first, second = open_index(tmp_path / "docs"), open_index(tmp_path / "docs")
+    first.add(["a"], ["apple"])
+    assert second.query(["apple"], n_results=1)["ids"][0] == ["a"]
+
+    # add() skips ids another instance has written since
+    second.add(["a", "b"], ["avocado", "banana"])
+    assert first.query(["apple"], n_results=1)["documents"][0] == ["apple"]
+    assert first.count() == 2
+
+    # A compaction by one instance is picked up by the other
+    second.close()
+    first.add(["c"], ["cherry"])
+    assert open_index(tmp_path / "docs").count() == 3
+    assert second.query(["cherry"], n_results=1)["ids"][0] == ["c"]
+
+
+def _add_many(path, worker):
+    index = open_index(path)
+    for batch in range(10):
+        ids = [f"{worker}-{batch}-{i}" for i in range(5)]
+        index.add(ids, [f"doc {doc_id}" for doc_id in ids])
+    index.close()
+
+
+def test_concurrent_processes_do_not_lose_writes(tmp_path):
+    path = str(tmp_path / "docs")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_add_many, args=(path, worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    assert open_index(path).count() == 4 * 10 * 5
+    assert not os.path.exists(os.path.join(path, "log.jsonl.tmp"))